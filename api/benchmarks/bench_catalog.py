@@ -0,0 +1,95 @@
+"""
+Benchmark document lookups of the fhir routes: boolean-mask scans over a pandas
+DataFrame (previous implementation) vs. the hash-indexed catalog (raw.catalog), on a
+synthetic corpus.
+
+python benchmarks/bench_catalog.py --documents 100000 --patients 2000
+"""
+
+import argparse
+import random
+import time
+
+import pandas as pd
+
+from raw.catalog import Catalog
+
+
+def make_documents(n_documents: int, n_patients: int):
+    rng = random.Random(0)
+    for i in range(n_documents):
+        document_id = f"{i:064x}"
+        yield {
+            "document_id": document_id,
+            "resource_type": "DiagnosticReport",
+            "patient_id": f"Patient/{rng.randrange(n_patients):064x}",
+            "last_updated": "2023-03-21T08:25:52.182+00:00",
+            "presented_form": [
+                {
+                    "url": f"https://ship.ume.de/app/docs/medico/{i}",
+                    "content_type": "application/pdf",
+                    "creation": "2023-03-21T09:17:41.000+01:00",
+                    "path": f"{document_id}.pdf",
+                }
+            ],
+        }
+
+
+def timeit(fn, keys):
+    start = time.perf_counter()
+    for key in keys:
+        fn(key)
+    return (time.perf_counter() - start) / len(keys) * 1e6
+
+
+def main(args):
+    docs = list(make_documents(args.documents, args.patients))
+    rng = random.Random(1)
+    sample = rng.sample(docs, args.lookups)
+    document_ids = [d["document_id"] for d in sample]
+    patient_ids = [d["patient_id"] for d in sample]
+    form_keys = [(d["document_id"], d["presented_form"][0]["url"]) for d in sample]
+
+    start = time.perf_counter()
+    df = pd.DataFrame(docs)
+    print(f"pandas build: {time.perf_counter() - start:.2f}s")
+    start = time.perf_counter()
+    catalog = Catalog(docs, sorted({d["patient_id"] for d in docs}))
+    print(f"catalog build: {time.perf_counter() - start:.2f}s")
+
+    def df_documents(patient_id):
+        return df[df["patient_id"] == patient_id].to_dict(orient="records")
+
+    def df_document(document_id):
+        return df[df["document_id"] == document_id].iloc[0].to_dict()
+
+    def df_form(key):
+        document_id, url = key
+        doc = df_document(document_id)
+        return next(f for f in doc["presented_form"] if f["url"] == url)
+
+    results = [
+        ("/documents", df_documents, catalog.documents_json, patient_ids),
+        ("/document", df_document, catalog.document_json, document_ids),
+        ("/document_raw", df_form, lambda k: catalog.form(*k), form_keys),
+    ]
+    print(f"{args.documents:,} documents, {args.patients:,} patients (µs/lookup)")
+    for name, df_fn, catalog_fn, keys in results:
+        before, after = timeit(df_fn, keys), timeit(catalog_fn, keys)
+        print(
+            f"{name:>14}: pandas {before:10.1f}  catalog {after:8.1f}  ({before / after:,.0f}x)"
+        )
+
+
+def arg_parser():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--documents", type=int, default=100_000)
+    parser.add_argument("--patients", type=int, default=2_000)
+    parser.add_argument("--lookups", type=int, default=200)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(arg_parser())
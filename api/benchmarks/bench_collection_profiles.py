@@ -0,0 +1,167 @@
+"""
+Memory footprint, patient-filtered search latency (p50/p99) and recall@k of the
+collection profiles in raw.engine, on random vectors (no embedding model needed).
+Recall is measured against exact search without quantization.
+
+# against a local Qdrant container (memory from the telemetry endpoint)
+docker run -d --name qdrant -p 6333:6333 qdrant/qdrant:latest
+python benchmarks/bench_collection_profiles.py --qdrant_location http://localhost:6333
+# qdrant-client's local mode ignores the profiles (exhaustive search in NumPy); only
+# useful to check the benchmark itself
+python benchmarks/bench_collection_profiles.py --qdrant_location :memory:
+"""
+
+import argparse
+import time
+import uuid
+
+import httpx
+import numpy as np
+from qdrant_client import QdrantClient, models
+
+from raw.engine import (
+    COLLECTION_PROFILES,
+    PATIENT_ID_KEY,
+    apply_profile,
+    collection_search_params,
+)
+
+UPLOAD_BATCH_SIZE = 256
+EXACT = models.SearchParams(
+    exact=True, quantization=models.QuantizationSearchParams(ignore=True)
+)
+
+
+def make_points(rng, args):
+    for p in range(args.patients):
+        vectors = rng.normal(size=(args.chunks, args.dim)).astype(np.float32)
+        for vector in vectors:
+            yield models.PointStruct(
+                id=str(uuid.uuid4()),
+                vector=vector.tolist(),
+                payload={PATIENT_ID_KEY: f"p{p}", "text": "Befund"},
+            )
+
+
+def wait_until_optimized(client, collection_name, timeout=600):
+    start = time.monotonic()
+    while time.monotonic() - start < timeout:
+        info = client.get_collection(collection_name)
+        if info.status == models.CollectionStatus.GREEN:
+            return
+        time.sleep(1)
+    print(f"{collection_name}: still optimizing after {timeout}s")
+
+
+def memory_footprint(location, collection_name):
+    """RAM and disk usage (MB) of the collection's segments (server only)."""
+    if not location.startswith("http"):
+        return None
+    telemetry = httpx.get(
+        location.rstrip("/") + "/telemetry", params={"details_level": 3}
+    ).json()["result"]
+    ram = disk = 0
+    for collection in telemetry["collections"]["collections"]:
+        if collection["id"] != collection_name:
+            continue
+        for shard in collection.get("shards", []):
+            for segment in (shard.get("local") or {}).get("segments", []):
+                ram += segment["info"].get("ram_usage_bytes", 0)
+                disk += segment["info"].get("disk_usage_bytes", 0)
+    return ram / 2**20, disk / 2**20
+
+
+def search(client, collection_name, patient_id, vector, k, params):
+    return client.query_points(
+        collection_name=collection_name,
+        query=vector,
+        query_filter=models.Filter(
+            must=[
+                models.FieldCondition(
+                    key=PATIENT_ID_KEY, match=models.MatchValue(value=patient_id)
+                )
+            ]
+        ),
+        limit=k,
+        search_params=params,
+    ).points
+
+
+def run(client, collection_name, profile, args):
+    rng = np.random.default_rng(0)
+    if client.collection_exists(collection_name):
+        client.delete_collection(collection_name)
+    client.create_collection(
+        collection_name,
+        vectors_config=models.VectorParams(
+            size=args.dim, distance=models.Distance.COSINE
+        ),
+    )
+    client.upload_points(
+        collection_name, make_points(rng, args), batch_size=UPLOAD_BATCH_SIZE
+    )
+    apply_profile(client, collection_name, profile)
+    wait_until_optimized(client, collection_name)
+
+    # the parameters the chat route searches with (see ProfileQdrantVectorStore)
+    params = collection_search_params(client, collection_name)
+    latencies, recalls = [], []
+    for _ in range(args.queries):
+        patient_id = f"p{rng.integers(args.patients)}"
+        vector = rng.normal(size=args.dim).tolist()
+        start = time.perf_counter()
+        points = search(client, collection_name, patient_id, vector, args.top_k, params)
+        latencies.append(time.perf_counter() - start)
+        exact = search(client, collection_name, patient_id, vector, args.top_k, EXACT)
+        recalls.append(len({p.id for p in points} & {p.id for p in exact}) / len(exact))
+
+    footprint = memory_footprint(args.qdrant_location, collection_name)
+    if not args.keep:
+        client.delete_collection(collection_name)
+    ms = np.array(latencies) * 1000
+    return {
+        "RAM MB": footprint[0] if footprint else float("nan"),
+        "disk MB": footprint[1] if footprint else float("nan"),
+        "p50 ms": np.percentile(ms, 50),
+        "p99 ms": np.percentile(ms, 99),
+        f"recall@{args.top_k}": np.mean(recalls),
+    }
+
+
+def main(args):
+    client = QdrantClient(location=args.qdrant_location, timeout=600)
+    print(
+        f"{args.patients} patients x {args.chunks} chunks (dim {args.dim}), "
+        f"{args.queries} queries, top {args.top_k}, {args.qdrant_location}"
+    )
+    for profile in args.profiles:
+        results = run(client, f"bench_profile_{profile}", profile, args)
+        print(
+            f"{profile:>10}: " + ", ".join(f"{k} {v:,.2f}" for k, v in results.items())
+        )
+
+
+def arg_parser():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--patients", type=int, default=200)
+    parser.add_argument("--chunks", type=int, default=300)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--top_k", type=int, default=3)
+    parser.add_argument(
+        "--profiles",
+        nargs="+",
+        default=list(COLLECTION_PROFILES),
+        choices=list(COLLECTION_PROFILES),
+    )
+    parser.add_argument("--qdrant_location", default="http://localhost:6333")
+    parser.add_argument(
+        "--keep", action="store_true", help="Keep the benchmark collections."
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(arg_parser())
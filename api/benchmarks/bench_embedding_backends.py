@@ -0,0 +1,116 @@
+"""
+Load time, single-query latency (p50/p99), ingestion throughput (chunks/s at the
+indexing batch size) and cosine similarity to the PyTorch embeddings of the embedding
+backends (see raw.engine.get_embed_model), on chunks of synthetic MTB protocols. The
+ONNX backends are run with each thread count in --threads.
+
+python benchmarks/bench_embedding_backends.py
+python benchmarks/bench_embedding_backends.py --backends onnx-int8 --threads 1 2 4
+"""
+
+import argparse
+import os
+import random
+import time
+
+import numpy as np
+from bench_mtb_parser import make_protocol
+from llama_index.core.schema import Document
+
+from raw.engine import EMBED_BACKENDS, get_embed_model
+from raw.node_parser import MTBNodeParser
+from raw.onnx_embedding import normalize
+
+QUERIES = [
+    "Was ist die Diagnose?",
+    "Welche Metastasen sind bekannt?",
+    "Wie war der bisherige Therapieverlauf?",
+    "Was wurde beschlossen?",
+]
+
+
+def make_chunks(n_protocols):
+    rng = random.Random(0)
+    documents = [Document(text=make_protocol(rng)) for _ in range(n_protocols)]
+    nodes = MTBNodeParser(chunk_size=512, chunk_overlap=32).get_nodes_from_documents(
+        documents
+    )
+    return [node.get_content() for node in nodes]
+
+
+def run(backend, threads, chunks, args):
+    if threads is not None:
+        os.environ["EMBED_THREADS"] = str(threads)
+    start = time.perf_counter()
+    model = get_embed_model(backend)
+    load_s = time.perf_counter() - start
+    model.get_query_embedding("Aufwärmen")
+
+    latencies = []
+    for i in range(args.queries):
+        start = time.perf_counter()
+        model.get_query_embedding(QUERIES[i % len(QUERIES)])
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    embeddings = []
+    for i in range(0, len(chunks), args.batch_size):
+        embeddings.extend(
+            model.get_text_embedding_batch(chunks[i : i + args.batch_size])
+        )
+    ingest_s = time.perf_counter() - start
+
+    ms = np.array(latencies) * 1000
+    results = {
+        "load s": load_s,
+        "query p50 ms": np.percentile(ms, 50),
+        "query p99 ms": np.percentile(ms, 99),
+        "chunks/s": len(chunks) / ingest_s,
+    }
+    return results, normalize(np.array(embeddings))
+
+
+def main(args):
+    chunks = make_chunks(args.protocols)
+    print(
+        f"{len(chunks)} chunks of {args.protocols} protocols, batch size "
+        f"{args.batch_size}, {args.queries} queries, {os.cpu_count()} CPUs"
+    )
+    reference = None
+    for backend in args.backends:
+        for threads in [None] if backend == "torch" else args.threads:
+            results, embeddings = run(backend, threads, chunks, args)
+            if backend == "torch":
+                reference = embeddings
+            elif reference is not None:
+                cosine = (embeddings * reference).sum(axis=1)
+                results["min cosine"] = cosine.min()
+                results["mean cosine"] = cosine.mean()
+            name = backend if threads is None else f"{backend} ({threads} threads)"
+            print(
+                f"{name:>22}: " + ", ".join(f"{k} {v:,.3f}" for k, v in results.items())
+            )
+
+
+def arg_parser():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        "--backends", nargs="+", default=EMBED_BACKENDS, choices=EMBED_BACKENDS
+    )
+    parser.add_argument(
+        "--threads",
+        nargs="+",
+        type=int,
+        default=[os.cpu_count()],
+        help="Thread counts of the ONNX backends.",
+    )
+    parser.add_argument("--protocols", type=int, default=50)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch_size", type=int, default=64)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(arg_parser())
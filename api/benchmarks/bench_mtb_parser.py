@@ -0,0 +1,150 @@
+"""
+Benchmark the single-pass MTB protocol parser (raw.preprocessing.mtb_parser) against
+the previous implementation (list membership tests and string `+=`), and
+`parse_corpus` with several processes, on synthetic protocols.
+
+python benchmarks/bench_mtb_parser.py --protocols 5000 --workers 8
+"""
+
+import argparse
+import random
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from raw.preprocessing.mtb_parser import (
+    RENAME,
+    SECTIONS,
+    parse,
+    parse_corpus,
+    parse_markers,
+)
+
+WORDS = "Befund Tumor Therapie Progress Lunge Metastasen KRAS Chemotherapie".split()
+MARKERS = [
+    "Angewandte Methode",
+    "Alteration",
+    "Biologische Bewertung",
+    "",
+    "",
+    "KRAS",
+    "NGS-extern",
+    "G13D",
+    "pathogenic",
+    "",
+    "MS-Status",
+    "",
+    "stabil",
+]
+
+
+def parse_previous(txt):
+    sections = []
+    allowed_sections = SECTIONS.keys()
+    allowed_fields = []
+    section = defaultdict(str)
+    section["_name"] = "header"
+    current_field = "_text"
+    for line in txt.split("\n"):
+        line = line.strip()
+        if current_field == "_text" and len(line) == 0:
+            continue
+        elif line in allowed_sections:
+            sections.append(dict(section))
+            section = defaultdict(str)
+            section["_name"] = line
+            current_field = "_text"
+            allowed_fields = SECTIONS[line]
+        elif line in allowed_fields:
+            current_field = RENAME.get(line, line)
+        else:
+            section[current_field] += line + "\n"
+        if (
+            len(sections) == 0
+            and section["_name"] == "header"
+            and len(section["_text"]) > 200
+        ):
+            return []
+    sections.append(dict(section))
+    for section in sections:
+        if (
+            section["_name"] == "Molekularpathologische Analyse"
+            and "Molekulares Profil & prädiktive Marker" in section
+        ):
+            markers = section.pop("Molekulares Profil & prädiktive Marker")
+            try:
+                markers = parse_markers(
+                    "Molekulares Profil & prädiktive Marker\n" + markers
+                )
+                section["marker"] = markers
+            except ValueError:
+                section["marker"] = []
+    return sections
+
+
+def make_protocol(rng: random.Random) -> str:
+    def text(n_lines):
+        return [
+            " ".join(rng.choices(WORDS, k=rng.randint(3, 12))) for _ in range(n_lines)
+        ]
+
+    lines = ["Protokoll Molekulares Tumorboard", "prädiagnostisch", ""]
+    for name, fields in SECTIONS.items():
+        lines += ["", name, ""]
+        for field in fields:
+            lines.append(field)
+            if field == "Molekulares Profil & prädiktive Marker":
+                lines += MARKERS
+            else:
+                lines += text(rng.randint(1, 6))
+            lines.append("")
+        if not fields:
+            lines += text(rng.randint(5, 30))
+    return "\n".join(lines)
+
+
+def main(args):
+    rng = random.Random(0)
+    protocols = [make_protocol(rng) for _ in range(args.protocols)]
+    size = sum(len(txt) for txt in protocols) / 2**20
+    print(f"{args.protocols:,} protocols ({size:,.1f} MB)")
+
+    timings = {}
+    for name, fn in [("previous", parse_previous), ("single-pass", parse)]:
+        start = time.perf_counter()
+        results = [fn(txt) for txt in protocols]
+        timings[name] = time.perf_counter() - start
+        print(
+            f"{name:>12}: {timings[name]:6.2f}s ({args.protocols / timings[name]:,.0f} protocols/s)"
+        )
+    assert results == [parse_previous(txt) for txt in protocols]
+    print(f"speedup: {timings['previous'] / timings['single-pass']:.1f}x")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        paths = []
+        for i, txt in enumerate(protocols):
+            path = Path(tmp_dir) / f"{i}.txt"
+            path.write_text(txt, encoding="utf-8")
+            paths.append(path)
+
+        for workers in sorted({1, args.workers}):
+            start = time.perf_counter()
+            n = sum(1 for _ in parse_corpus(paths, workers=workers))
+            seconds = time.perf_counter() - start
+            print(
+                f"parse_corpus(workers={workers}): {seconds:6.2f}s ({n / seconds:,.0f} protocols/s)"
+            )
+
+
+def arg_parser():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--protocols", type=int, default=5_000)
+    parser.add_argument("--workers", type=int, default=8)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(arg_parser())
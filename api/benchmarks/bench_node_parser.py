@@ -0,0 +1,108 @@
+"""
+Average number of context tokens sent to the LLM per query (top-3 retrieval, context
+as built by raw.chat_engine) with the previous node parser (sentence splitter, 512
+tokens) and the section-aware MTBNodeParser, on synthetic MTB protocols. The hit rate
+is the fraction of queries whose context contains the field that answers them.
+
+python benchmarks/bench_node_parser.py --patients 20
+# without the embedding model (random vectors: token counts only, no hit rate)
+python benchmarks/bench_node_parser.py --embed_model mock
+"""
+
+import argparse
+import random
+import statistics
+
+from bench_mtb_parser import make_protocol
+from llama_index.core import VectorStoreIndex
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.embeddings.utils import resolve_embed_model
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import Document, MetadataMode
+from llama_index.core.utils import get_tokenizer
+
+from raw.engine import EMBED_MODEL
+from raw.node_parser import MTBNodeParser
+from raw.preprocessing.mtb_parser import parse
+
+# (query, section, field that answers it)
+QUERIES = [
+    ("Was ist die Diagnose?", "Verlauf:", "Diagnose:"),
+    ("Welche Metastasen sind bekannt?", "Verlauf:", "Metastasen:"),
+    ("Wie ist die Histologie?", "Verlauf:", "Histologie:"),
+    (
+        "Wie war der bisherige Therapieverlauf?",
+        "Verlauf:",
+        "Bisheriger Therapieverlauf:",
+    ),
+    ("Welche Komorbiditäten bestehen?", "Verlauf:", "Komorbiditäten:"),
+    ("Was ist die Fragestellung an das Tumorboard?", "Fragestellung:", "_text"),
+    ("Was wurde beschlossen?", "Beschluss:", "_text"),
+    (
+        "Welche Tumorprobe wurde untersucht?",
+        "Molekularpathologische Analyse",
+        "Art der Tumorprobe:",
+    ),
+]
+
+
+def answer(sections, section_name, field):
+    section = next(s for s in sections if s["_name"] == section_name)
+    return section[field].strip().split("\n")[0]
+
+
+def run(node_parser, protocols, embed_model, top_k):
+    tokenizer = get_tokenizer()
+    tokens, hits, n_nodes = [], [], 0
+    for text in protocols:
+        nodes = node_parser.get_nodes_from_documents([Document(text=text)])
+        n_nodes += len(nodes)
+        retriever = VectorStoreIndex(nodes, embed_model=embed_model).as_retriever(
+            similarity_top_k=top_k
+        )
+        sections = parse(text)
+        for query, section_name, field in QUERIES:
+            retrieved = retriever.retrieve(query)
+            context_str = "\n\n".join(
+                n.node.get_content(metadata_mode=MetadataMode.LLM).strip()
+                for n in retrieved
+            )
+            tokens.append(len(tokenizer(context_str)))
+            hits.append(answer(sections, section_name, field) in context_str)
+    return {
+        "nodes/protocol": n_nodes / len(protocols),
+        "context tokens/query": statistics.mean(tokens),
+        "hit rate": statistics.mean(hits),
+    }
+
+
+def main(args):
+    rng = random.Random(0)
+    protocols = [make_protocol(rng) for _ in range(args.patients)]
+    if args.embed_model == "mock":
+        embed_model = MockEmbedding(embed_dim=384)
+    else:
+        embed_model = resolve_embed_model(args.embed_model)
+
+    parsers = [
+        ("sentence splitter", SentenceSplitter(chunk_size=512, chunk_overlap=32)),
+        ("MTBNodeParser", MTBNodeParser(chunk_size=512, chunk_overlap=32)),
+    ]
+    print(f"{args.patients} protocols, {len(QUERIES)} queries each, top {args.top_k}")
+    for name, node_parser in parsers:
+        results = run(node_parser, protocols, embed_model, args.top_k)
+        print(f"{name:>18}: " + ", ".join(f"{k} {v:,.2f}" for k, v in results.items()))
+
+
+def arg_parser():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--patients", type=int, default=20)
+    parser.add_argument("--top_k", type=int, default=3)
+    parser.add_argument("--embed_model", default=EMBED_MODEL)
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(arg_parser())
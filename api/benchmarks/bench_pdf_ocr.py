@@ -0,0 +1,81 @@
+"""
+Benchmark sequential vs. parallel (per-page) OCR in PDFReaderPlus on a synthetic
+scanned PDF (image-only pages). Requires tesseract with the German language data.
+
+python benchmarks/bench_pdf_ocr.py --pages 40
+"""
+
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+import fitz
+
+from raw.loader import PDFReaderPlus, get_ocr_pool
+
+TEXT = (
+    "Befundbericht\n\nDiagnose: Adenokarzinom der Lunge, Stadium IV.\n"
+    "Molekularpathologie: KRAS G12C nachgewiesen, EGFR Wildtyp.\n"
+    "Empfehlung: Vorstellung im molekularen Tumorboard.\n"
+)
+
+
+def make_scanned_pdf(path: Path, n_pages: int, dpi: int = 150):
+    text_doc = fitz.open()
+    page = text_doc.new_page()
+    page.insert_text((72, 72), "\n".join([TEXT] * 8), fontsize=10)
+    pix = page.get_pixmap(dpi=dpi)
+
+    scanned = fitz.open()
+    for _ in range(n_pages):
+        scanned_page = scanned.new_page()
+        scanned_page.insert_image(scanned_page.rect, pixmap=pix)
+    scanned.save(path)
+
+
+def run(reader, path):
+    start = time.perf_counter()
+    docs = reader.load_data(path)
+    return time.perf_counter() - start, docs
+
+
+def main(args):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "scan.pdf"
+        make_scanned_pdf(path, args.pages)
+
+        sequential, expected = run(PDFReaderPlus(language=args.language), path)
+        print(f"sequential: {sequential:.1f}s ({args.pages / sequential:.2f} pages/s)")
+
+        # warm up the pool so that process start-up is not measured
+        reader = PDFReaderPlus(
+            language=args.language, parallel_ocr=True, ocr_workers=args.workers
+        )
+        get_ocr_pool(args.workers)
+        parallel, docs = run(reader, path)
+        assert [d.text for d in docs] == [d.text for d in expected]
+
+        workers = args.workers or os.cpu_count()
+        speedup = sequential / parallel
+        print(
+            f"parallel ({workers} workers): {parallel:.1f}s ({args.pages / parallel:.2f} pages/s)"
+        )
+        print(f"speed-up: {speedup:.2f}x ({speedup / workers:.0%} of {workers} cores)")
+
+
+def arg_parser():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--pages", type=int, default=40)
+    parser.add_argument("--language", default="deu")
+    parser.add_argument(
+        "--workers", type=int, default=None, help="OCR processes (default: all cores)"
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(arg_parser())
@@ -0,0 +1,113 @@
+"""
+Retrieval latency of the chat route: the filtered Qdrant search of the VectorStoreIndex
+retriever vs. the in-process PatientVectorCache (first query of a patient, which loads
+the patient's vectors, and later queries). Top-k agreement is the fraction of queries
+with the same top-k chunks. Random vectors, so no embedding model is needed.
+
+python benchmarks/bench_vector_cache.py --patients 100 --chunks 300
+# against the Qdrant server (creates and drops the collection)
+python benchmarks/bench_vector_cache.py --qdrant_location http://localhost:6333
+"""
+
+import argparse
+import statistics
+import time
+
+import numpy as np
+from llama_index.core import VectorStoreIndex
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.schema import QueryBundle, TextNode
+from llama_index.core.vector_stores.types import ExactMatchFilter, MetadataFilters
+from llama_index.vector_stores.qdrant import QdrantVectorStore
+from qdrant_client import QdrantClient
+
+from raw.vector_cache import PatientVectorCache, PatientVectorRetriever
+
+COLLECTION = "bench_vector_cache"
+
+
+def build(client, rng, args):
+    vector_store = QdrantVectorStore(collection_name=COLLECTION, client=client)
+    for p in range(args.patients):
+        vector_store.add(
+            [
+                TextNode(
+                    text=f"Befund {p}-{i}",
+                    metadata={"patient_id": f"p{p}"},
+                    embedding=rng.normal(size=args.dim).tolist(),
+                )
+                for i in range(args.chunks)
+            ]
+        )
+    return VectorStoreIndex.from_vector_store(
+        vector_store, embed_model=MockEmbedding(embed_dim=args.dim)
+    )
+
+
+def timed(retriever, query):
+    start = time.perf_counter()
+    nodes = retriever.retrieve(query)
+    return time.perf_counter() - start, [n.node.node_id for n in nodes]
+
+
+def main(args):
+    rng = np.random.default_rng(0)
+    client = QdrantClient(location=args.qdrant_location)
+    if client.collection_exists(COLLECTION):
+        client.delete_collection(COLLECTION)
+    index = build(client, rng, args)
+    cache = PatientVectorCache(client, COLLECTION)
+    embed_model = MockEmbedding(embed_dim=args.dim)
+
+    latencies = {"qdrant": [], "cache (cold)": [], "cache (warm)": []}
+    agree = []
+    for p in range(args.patients):
+        patient_id = f"p{p}"
+        qdrant = index.as_retriever(
+            similarity_top_k=args.top_k,
+            filters=MetadataFilters(
+                filters=[ExactMatchFilter(key="patient_id", value=patient_id)]
+            ),
+        )
+        cached = PatientVectorRetriever(
+            cache, patient_id, embed_model, similarity_top_k=args.top_k
+        )
+        for q in range(args.queries):
+            query = QueryBundle("Befund", embedding=rng.normal(size=args.dim).tolist())
+            seconds, expected = timed(qdrant, query)
+            latencies["qdrant"].append(seconds)
+            seconds, ids = timed(cached, query)
+            latencies["cache (cold)" if q == 0 else "cache (warm)"].append(seconds)
+            agree.append(ids == expected)
+
+    print(
+        f"{args.patients} patients x {args.chunks} chunks (dim {args.dim}), "
+        f"{args.queries} queries each, top {args.top_k}, {args.qdrant_location}"
+    )
+    for name, values in latencies.items():
+        if values:
+            ms = np.array(values) * 1000
+            print(
+                f"{name:>13}: mean {ms.mean():.2f} ms, "
+                f"p95 {np.percentile(ms, 95):.2f} ms"
+            )
+    print(f"top-{args.top_k} agreement: {statistics.mean(agree):.1%}")
+    print(f"cache: {cache.stats()}")
+    client.delete_collection(COLLECTION)
+
+
+def arg_parser():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--patients", type=int, default=50)
+    parser.add_argument("--chunks", type=int, default=300)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--top_k", type=int, default=3)
+    parser.add_argument("--qdrant_location", default=":memory:")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(arg_parser())
@@ -0,0 +1,210 @@
+"""
+Token budget for the chat prompt. Between retrieval and the LLM call, the prompt is fit
+into the context window of the LLM (minus the tokens reserved for the answer, and at
+most CHAT_MAX_PROMPT_TOKENS):
+
+1. the system prompt, system messages of the client and the new message are kept
+2. retrieved chunks get at least `context_share` of the rest; chunks are added by score,
+   the first chunk that does not fit is truncated and lower-scoring chunks are dropped
+3. the history gets what is left; the oldest turns are dropped first
+
+The prompt size (and with it the prefill time, i.e., time-to-first-token) is bounded no
+matter how long the conversation gets. Tokens are only counted for the newest messages
+that can fit, so the cost of budgeting is bounded as well.
+
+Configuration (environment):
+- TOKENIZER: Hugging Face tokenizer of the LLM (e.g.,
+  mistralai/Mixtral-8x7B-Instruct-v0.1); default: the llama-index tokenizer (tiktoken)
+- CHAT_MAX_PROMPT_TOKENS: upper bound of the prompt (default: the context window)
+- CHAT_CONTEXT_SHARE: minimum share of retrieved chunks (default: 0.6)
+"""
+
+import os
+from dataclasses import asdict, dataclass
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.schema import MetadataMode, NodeWithScore
+from llama_index.core.utils import get_tokenizer
+
+DEFAULT_CONTEXT_SHARE = 0.6
+# Role markers of the chat template (e.g., [INST] ... [/INST])
+MESSAGE_OVERHEAD = 4
+# Truncated chunks shorter than this are dropped instead
+MIN_CHUNK_TOKENS = 32
+
+
+def load_tokenizer(name: Optional[str] = None) -> Callable[[str], Sequence]:
+    """Tokenizer of the LLM (`name` on the Hugging Face hub), else the default."""
+    if name is None:
+        return get_tokenizer()
+    from transformers import AutoTokenizer  # pylint: disable=C0415
+
+    tokenizer = AutoTokenizer.from_pretrained(name)
+    return lambda text: tokenizer.encode(text, add_special_tokens=False)
+
+
+def node_content(node: NodeWithScore) -> str:
+    return node.node.get_content(metadata_mode=MetadataMode.LLM).strip()
+
+
+@dataclass
+class BudgetReport:
+    prompt_budget: int = 0
+    system_tokens: int = 0
+    message_tokens: int = 0
+    context_budget: int = 0
+    context_tokens: int = 0
+    history_budget: int = 0
+    history_tokens: int = 0
+    nodes_kept: int = 0
+    nodes_truncated: int = 0
+    nodes_dropped: int = 0
+    messages_kept: int = 0
+    messages_dropped: int = 0
+
+    @property
+    def prompt_tokens(self) -> int:
+        return (
+            self.system_tokens
+            + self.message_tokens
+            + self.context_tokens
+            + self.history_tokens
+        )
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "prompt_tokens": self.prompt_tokens}
+
+
+class TokenBudget:
+    def __init__(
+        self,
+        tokenizer: Optional[Callable[[str], Sequence]] = None,
+        max_prompt_tokens: Optional[int] = None,
+        context_share: float = DEFAULT_CONTEXT_SHARE,
+    ):
+        self.tokenizer = tokenizer or get_tokenizer()
+        self.max_prompt_tokens = max_prompt_tokens
+        self.context_share = context_share
+
+    def count(self, text: str) -> int:
+        return len(self.tokenizer(text))
+
+    def count_message(self, message: ChatMessage) -> int:
+        return self.count(message.content or "") + MESSAGE_OVERHEAD
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Longest prefix of `text` with at most `max_tokens` tokens."""
+        if self.count(text) <= max_tokens:
+            return text
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.count(text[:mid]) <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:low]
+
+    def fit_nodes(
+        self, nodes: List[NodeWithScore], budget: int, report: BudgetReport
+    ) -> List[NodeWithScore]:
+        kept = []
+        for node in sorted(nodes, key=lambda n: n.score or 0.0, reverse=True):
+            separator = self.count("\n\n") if kept else 0
+            remaining = budget - report.context_tokens - separator
+            tokens = self.count(node_content(node))
+            if tokens <= remaining:
+                kept.append(node)
+                report.context_tokens += tokens + separator
+                continue
+
+            # Truncate the first chunk that does not fit, drop the lower-scoring ones
+            overhead = tokens - self.count(node.node.text)
+            if remaining - overhead >= MIN_CHUNK_TOKENS:
+                truncated = node.node.copy()
+                truncated.text = self.truncate(node.node.text, remaining - overhead)
+                kept.append(NodeWithScore(node=truncated, score=node.score))
+                report.context_tokens += self.count(node_content(kept[-1])) + separator
+                report.nodes_truncated = 1
+            break
+        report.nodes_kept = len(kept)
+        report.nodes_dropped = len(nodes) - len(kept)
+        return kept
+
+    def newest_message_tokens(
+        self, history: List[ChatMessage], limit: int
+    ) -> List[int]:
+        """Token counts of the newest messages, up to `limit` tokens in total."""
+        counts, total = [], 0
+        for message in reversed(history):
+            tokens = self.count_message(message)
+            if total + tokens > limit:
+                break
+            counts.append(tokens)
+            total += tokens
+        return counts
+
+    def fit(
+        self,
+        system_prompt: str,
+        message: ChatMessage,
+        history: List[ChatMessage],
+        nodes: List[NodeWithScore],
+        context_window: int,
+        num_output: int,
+    ) -> Tuple[List[ChatMessage], List[NodeWithScore], BudgetReport]:
+        """
+        Fit retrieved nodes and the history (oldest first) into the prompt budget.
+        System messages in `history` are always kept. Returns the history and nodes to
+        send and the report of the budget decisions.
+        """
+        report = BudgetReport()
+        report.prompt_budget = context_window - num_output
+        if self.max_prompt_tokens is not None:
+            report.prompt_budget = min(report.prompt_budget, self.max_prompt_tokens)
+
+        pinned = [m for m in history if m.role == MessageRole.SYSTEM]
+        turns = [m for m in history if m.role != MessageRole.SYSTEM]
+        report.system_tokens = (
+            self.count(system_prompt)
+            + MESSAGE_OVERHEAD
+            + sum(self.count_message(m) for m in pinned)
+        )
+        report.message_tokens = self.count_message(message)
+        available = max(
+            report.prompt_budget - report.system_tokens - report.message_tokens, 0
+        )
+
+        # Chunks may use what the history does not need, but at least their share
+        history_need = sum(self.newest_message_tokens(turns, available))
+        report.context_budget = max(
+            int(available * self.context_share), available - history_need
+        )
+        nodes = self.fit_nodes(nodes, report.context_budget, report)
+
+        report.history_budget = available - report.context_tokens
+        counts = self.newest_message_tokens(turns, report.history_budget)
+        kept = turns[len(turns) - len(counts) :]
+        # A conversation starts with a user turn
+        while kept and kept[0].role != MessageRole.USER:
+            counts.pop()
+            kept = kept[1:]
+        report.history_tokens = sum(counts)
+        report.messages_kept = len(kept)
+        report.messages_dropped = len(turns) - len(kept)
+
+        kept = set(map(id, kept))
+        history = [m for m in history if m.role == MessageRole.SYSTEM or id(m) in kept]
+        return history, nodes, report
+
+
+def token_budget_from_env() -> TokenBudget:
+    max_prompt_tokens = os.environ.get("CHAT_MAX_PROMPT_TOKENS")
+    return TokenBudget(
+        load_tokenizer(os.environ.get("TOKENIZER")),
+        max_prompt_tokens=int(max_prompt_tokens) if max_prompt_tokens else None,
+        context_share=float(
+            os.environ.get("CHAT_CONTEXT_SHARE", DEFAULT_CONTEXT_SHARE)
+        ),
+    )
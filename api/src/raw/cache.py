@@ -0,0 +1,207 @@
+"""
+Response cache for the chat routes. Entries are evicted least-recently-used first once
+the cache is full and expire after a fixed time-to-live. Backends store JSON-serializable
+values under string keys.
+
+Configuration (environment):
+- RESPONSE_CACHE: "memory" (default), "sqlite" or "off"
+- RESPONSE_CACHE_PATH: database file of the sqlite backend (default: ./cache/response-cache.sqlite)
+- RESPONSE_CACHE_TTL: time-to-live in seconds (default: 86400)
+- RESPONSE_CACHE_SIZE: maximum number of entries (default: 1024)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Protocol, Sequence
+
+from llama_index.core.llms import LLM, ChatMessage
+from llama_index.core.schema import NodeWithScore
+
+DEFAULT_TTL = 24 * 60 * 60
+DEFAULT_MAX_ENTRIES = 1024
+DEFAULT_SQLITE_PATH = "./cache/response-cache.sqlite"
+
+
+class CacheBackend(Protocol):
+    def get(self, key: str) -> Optional[Any]: ...
+
+    def set(self, key: str, value: Any) -> None: ...
+
+    def clear(self) -> None: ...
+
+
+class MemoryBackend:
+    def __init__(
+        self, max_entries: int = DEFAULT_MAX_ENTRIES, ttl: float = DEFAULT_TTL
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteBackend:
+    """On-disk backend, shared by all workers of one host and kept across restarts."""
+
+    def __init__(
+        self,
+        path: str = DEFAULT_SQLITE_PATH,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+        ttl: float = DEFAULT_TTL,
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " expires_at REAL NOT NULL,"
+            " accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS cache_accessed_at ON cache (accessed_at)"
+        )
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at < now:
+                self._conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute(
+                "UPDATE cache SET accessed_at = ? WHERE key = ?", (now, key)
+            )
+        return json.loads(value)
+
+    def set(self, key: str, value: Any) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)",
+                (key, json.dumps(value), now + self.ttl, now),
+            )
+            self._conn.execute("DELETE FROM cache WHERE expires_at < ?", (now,))
+            self._conn.execute(
+                "DELETE FROM cache WHERE key IN ("
+                " SELECT key FROM cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM cache")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+def normalize_messages(messages: Sequence[ChatMessage]) -> List[List[str]]:
+    # Ignore whitespace differences so that re-sent conversations hit the cache
+    return [[m.role.value, " ".join((m.content or "").split())] for m in messages]
+
+
+def llm_fingerprint(llm: LLM) -> Dict[str, Any]:
+    return {
+        "model": llm.metadata.model_name,
+        "options": getattr(llm, "_model_kwargs", {}),
+    }
+
+
+class ResponseCache:
+    def __init__(self, backend: CacheBackend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(
+        patient_id: str,
+        messages: Sequence[ChatMessage],
+        llm: LLM,
+        nodes: Sequence[NodeWithScore],
+    ) -> str:
+        """
+        The key covers everything that determines the answer. Retrieved nodes enter
+        with their content hash, so re-indexed documents invalidate cached answers.
+        """
+        key = {
+            "patient_id": patient_id,
+            "messages": normalize_messages(messages),
+            "llm": llm_fingerprint(llm),
+            "nodes": [[n.node.node_id, n.node.hash] for n in nodes],
+        }
+        key = json.dumps(key, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.backend.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        self.backend.set(key, value)
+
+
+def response_cache_from_env() -> Optional[ResponseCache]:
+    kind = os.environ.get("RESPONSE_CACHE", "memory")
+    ttl = float(os.environ.get("RESPONSE_CACHE_TTL", DEFAULT_TTL))
+    max_entries = int(os.environ.get("RESPONSE_CACHE_SIZE", DEFAULT_MAX_ENTRIES))
+
+    if kind == "off":
+        return None
+    elif kind == "memory":
+        backend = MemoryBackend(max_entries=max_entries, ttl=ttl)
+    elif kind == "sqlite":
+        path = os.environ.get("RESPONSE_CACHE_PATH", DEFAULT_SQLITE_PATH)
+        backend = SQLiteBackend(path, max_entries=max_entries, ttl=ttl)
+    else:
+        raise ValueError(f"Invalid response cache {kind}")
+    return ResponseCache(backend)
@@ -0,0 +1,499 @@
+"""
+Catalog of the FHIR documents and MTB patients (see ../fhir).
+
+The JSON dumps are compiled once into a SQLite file (`catalog.sqlite` next to the
+dumps) with the normalized field names and the serialized API response of each
+document. The compiled catalog is rebuilt automatically when a dump changed, so the API
+and the importer never parse the dumps themselves:
+
+    python -m raw.catalog
+
+In memory, documents are indexed by document id, patient id and (document id, form
+url), so all lookups of the fhir routes are dictionary lookups. The API keeps its
+catalog current with `CatalogWatcher`, which reads only lines appended to the dump.
+"""
+
+import argparse
+import asyncio
+import copy
+import json
+import logging
+import os
+import sqlite3
+from collections import defaultdict
+from contextlib import closing
+from itertools import groupby
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+PATIENTS_JSON = Path("../fhir/data/mtb-patients.json")
+DOCUMENTS_JSON = Path("../fhir/data/patient-documents.jsonl")
+DOCS_BASE_PATH = Path("../fhir/data/docs/")
+BLOBS_PATH = Path("../fhir/data/blobs/")
+CATALOG_DB = Path("../fhir/data/catalog.sqlite")
+
+logger = logging.getLogger("uvicorn")
+
+# Bump when the schema or the normalization changes to force a rebuild
+CATALOG_VERSION = 2
+
+SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value) WITHOUT ROWID;
+CREATE TABLE patients (patient_id TEXT NOT NULL, mtb_creation TEXT);
+CREATE TABLE documents (
+    document_id TEXT PRIMARY KEY,
+    patient_id TEXT NOT NULL,
+    resource_type TEXT,
+    last_updated TEXT,
+    json BLOB NOT NULL
+);
+CREATE TABLE forms (
+    document_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    url TEXT,
+    content_type TEXT,
+    creation TEXT,
+    path TEXT,
+    sha256 TEXT,
+    PRIMARY KEY (document_id, position)
+) WITHOUT ROWID;
+"""
+
+
+def dumps(obj) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+def normalize_form(form: dict) -> dict:
+    return {
+        "url": form["url"],
+        "content_type": form["contentType"],
+        "creation": form["creation"],
+        "path": Path(form["path"]).name,
+        "sha256": form.get("sha256"),
+    }
+
+
+def form_path(form: dict, docs_path=None, blobs_path=None) -> Path:
+    """File of a normalized form: a blob if the dump has its digest, else in docs/."""
+    if form.get("sha256") is not None:
+        return Path(blobs_path or BLOBS_PATH) / form["sha256"][:2] / form["path"]
+    return Path(docs_path or DOCS_BASE_PATH) / form["path"]
+
+
+def normalize_document(doc: dict) -> dict:
+    """Map a flattened DiagnosticReport (one line of the dump) to the API fields."""
+    return {
+        "document_id": doc["id"],
+        "resource_type": doc["resourceType"],
+        "patient_id": doc["subject.reference"],
+        "last_updated": doc["meta.lastUpdated"],
+        "presented_form": [normalize_form(form) for form in doc["presentedForm"]],
+    }
+
+
+def iter_records(json_path, offset: int = 0) -> Iterator[Tuple[dict, int]]:
+    """
+    Yield (normalized document, end offset of its line) for the lines of the dump
+    after byte `offset`. A last line without newline is still being written and is
+    not read.
+    """
+    with open(json_path, "rb") as fin:
+        fin.seek(offset)
+        for line in fin:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            if line.strip():
+                yield normalize_document(json.loads(line)), offset
+
+
+def read_documents(json_path=DOCUMENTS_JSON) -> Iterable[dict]:
+    return (doc for doc, _ in iter_records(json_path))
+
+
+def read_patients(json_path=PATIENTS_JSON) -> List[dict]:
+    with open(json_path) as fin:
+        return [
+            {"patient_id": p["patient_id"], "mtb_creation": p.get("mtb_creation")}
+            for p in json.load(fin)
+        ]
+
+
+class Catalog:
+    def __init__(self, documents: Iterable[dict] = (), patients: Iterable[str] = ()):
+        self.documents: Dict[str, dict] = {}
+        self.by_patient: Dict[str, List[str]] = defaultdict(list)
+        self.forms: Dict[Tuple[str, str], dict] = {}
+        self._document_json: Dict[str, bytes] = {}
+        self.patients: List[str] = []
+        self.patients_json = b"[]"
+
+        self.add_documents(documents)
+        self.set_patients(patients)
+
+    def add_documents(self, documents: Iterable[dict]):
+        """Add documents; a document whose id is already known replaces the old one."""
+        for doc in documents:
+            old = self.documents.get(doc["document_id"])
+            if old is not None:
+                self._remove(old)
+            self._add(doc, dumps(doc))
+
+    def _add(self, doc: dict, content: bytes):
+        document_id = doc["document_id"]
+        self.documents[document_id] = doc
+        self.by_patient[doc["patient_id"]].append(document_id)
+        for form in doc["presented_form"]:
+            self.forms[(document_id, form["url"])] = form
+        self._document_json[document_id] = content
+
+    def _remove(self, doc: dict):
+        document_id = doc["document_id"]
+        self.by_patient[doc["patient_id"]].remove(document_id)
+        for form in doc["presented_form"]:
+            self.forms.pop((document_id, form["url"]), None)
+
+    def set_patients(self, patients: Iterable[str]):
+        self.patients = list(patients)
+        self.patients_json = dumps(self.patients)
+
+    def __len__(self) -> int:
+        return len(self.documents)
+
+    def document(self, document_id: str) -> Optional[dict]:
+        return self.documents.get(document_id)
+
+    def document_json(self, document_id: str) -> Optional[bytes]:
+        return self._document_json.get(document_id)
+
+    def documents_json(self, patient_id: str) -> bytes:
+        ids = self.by_patient.get(patient_id, ())
+        return b"[" + b",".join(self._document_json[i] for i in ids) + b"]"
+
+    def form(self, document_id: str, url: str) -> Optional[dict]:
+        return self.forms.get((document_id, url))
+
+    def updated(
+        self, documents: Iterable[dict] = (), patients: Optional[Iterable[str]] = None
+    ) -> "Catalog":
+        """Copy of the catalog with documents added (and patients replaced)."""
+        documents = list(documents)
+        new = copy.copy(self)
+        new.documents = dict(self.documents)
+        new.forms = dict(self.forms)
+        new._document_json = dict(self._document_json)
+        # the per-patient lists are shared, copy the ones that change
+        new.by_patient = defaultdict(list, self.by_patient)
+        for doc in documents:
+            old = self.documents.get(doc["document_id"])
+            for patient_id in [doc["patient_id"], old and old["patient_id"]]:
+                if patient_id in self.by_patient:
+                    new.by_patient[patient_id] = list(self.by_patient[patient_id])
+        new.add_documents(documents)
+        if patients is not None:
+            new.set_patients(patients)
+        return new
+
+    @classmethod
+    def from_db(cls, con: sqlite3.Connection) -> "Catalog":
+        catalog = cls()
+        for doc, content in iter_db_documents(con, with_json=True):
+            catalog._add(doc, content)
+        catalog.set_patients(p["patient_id"] for p in iter_db_patients(con))
+        return catalog
+
+
+def source_stats(documents_json, patients_json) -> Dict[str, int]:
+    stats = {"version": CATALOG_VERSION}
+    for name, path in [("documents", documents_json), ("patients", patients_json)]:
+        stat = os.stat(path)
+        stats[f"{name}_size"] = stat.st_size
+        stats[f"{name}_mtime_ns"] = stat.st_mtime_ns
+    return stats
+
+
+def read_meta(con: sqlite3.Connection) -> Dict[str, int]:
+    return dict(con.execute("SELECT key, value FROM meta"))
+
+
+def is_stale(documents_json, patients_json, db_path) -> bool:
+    if not Path(db_path).exists():
+        return True
+    try:
+        with closing(sqlite3.connect(db_path)) as con:
+            meta = read_meta(con)
+    except sqlite3.DatabaseError:
+        return True
+    stats = source_stats(documents_json, patients_json)
+    return any(meta.get(key) != value for key, value in stats.items())
+
+
+def compile_catalog(
+    documents_json=DOCUMENTS_JSON, patients_json=PATIENTS_JSON, db_path=CATALOG_DB
+):
+    """Compile the dumps into a new catalog file, replacing the old one atomically."""
+    db_path = Path(db_path)
+    tmp_path = db_path.with_suffix(".tmp")
+    tmp_path.unlink(missing_ok=True)
+    stats = source_stats(documents_json, patients_json)
+
+    # Later versions of a document replace earlier ones (and move to the end)
+    documents = {}
+    offset = 0
+    for doc, offset in iter_records(documents_json):
+        documents.pop(doc["document_id"], None)
+        documents[doc["document_id"]] = doc
+    patients = read_patients(patients_json)
+
+    with closing(sqlite3.connect(tmp_path)) as con:
+        con.executescript(SCHEMA)
+        insert_documents(con, documents.values())
+        con.executemany(
+            "INSERT INTO patients VALUES (?, ?)",
+            ((p["patient_id"], p["mtb_creation"]) for p in patients),
+        )
+        stats["documents_offset"] = offset
+        con.executemany("INSERT INTO meta VALUES (?, ?)", stats.items())
+        con.commit()
+    os.replace(tmp_path, db_path)
+    print(f"Compiled {len(documents):,} documents, {len(patients):,} patients.")
+
+
+def insert_documents(con: sqlite3.Connection, documents: Iterable[dict]):
+    for doc in documents:
+        document_id = doc["document_id"]
+        con.execute("DELETE FROM documents WHERE document_id = ?", (document_id,))
+        con.execute("DELETE FROM forms WHERE document_id = ?", (document_id,))
+        con.execute(
+            "INSERT INTO documents VALUES (?, ?, ?, ?, ?)",
+            (
+                document_id,
+                doc["patient_id"],
+                doc["resource_type"],
+                doc["last_updated"],
+                dumps(doc),
+            ),
+        )
+        con.executemany(
+            "INSERT INTO forms VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (
+                (
+                    document_id,
+                    i,
+                    form["url"],
+                    form["content_type"],
+                    form["creation"],
+                    form["path"],
+                    form["sha256"],
+                )
+                for i, form in enumerate(doc["presented_form"])
+            ),
+        )
+
+
+def append_to_catalog(
+    db_path,
+    documents: List[dict],
+    offset: int,
+    stats: Dict[str, int],
+    patients: Optional[List[dict]] = None,
+):
+    """Add documents read up to `offset` of the dump (and replace the patients)."""
+    with closing(sqlite3.connect(db_path, timeout=1)) as con:
+        with con:
+            insert_documents(con, documents)
+            if patients is not None:
+                con.execute("DELETE FROM patients")
+                con.executemany(
+                    "INSERT INTO patients VALUES (?, ?)",
+                    ((p["patient_id"], p["mtb_creation"]) for p in patients),
+                )
+            stats = {**stats, "documents_offset": offset}
+            con.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)", stats.items())
+
+
+def connect_catalog(
+    documents_json=DOCUMENTS_JSON, patients_json=PATIENTS_JSON, db_path=CATALOG_DB
+) -> sqlite3.Connection:
+    """Open the compiled catalog, (re)compiling it first if a dump changed."""
+    if is_stale(documents_json, patients_json, db_path):
+        compile_catalog(documents_json, patients_json, db_path)
+    return sqlite3.connect(db_path, check_same_thread=False)
+
+
+def iter_db_documents(con: sqlite3.Connection, with_json: bool = False):
+    """Yield documents in dump order (or (document, json) with `with_json`)."""
+    rows = con.execute(
+        """
+        SELECT d.document_id, d.patient_id, d.resource_type, d.last_updated, d.json,
+               f.url, f.content_type, f.creation, f.path, f.sha256
+        FROM documents d LEFT JOIN forms f ON f.document_id = d.document_id
+        ORDER BY d.rowid, f.position
+        """
+    )
+    for _, group in groupby(rows, key=lambda row: row[0]):
+        group = list(group)
+        document_id, patient_id, resource_type, last_updated, content = group[0][:5]
+        doc = {
+            "document_id": document_id,
+            "resource_type": resource_type,
+            "patient_id": patient_id,
+            "last_updated": last_updated,
+            "presented_form": [
+                {
+                    "url": url,
+                    "content_type": ct,
+                    "creation": creation,
+                    "path": path,
+                    "sha256": sha256,
+                }
+                for *_, url, ct, creation, path, sha256 in group
+                if url is not None
+            ],
+        }
+        yield (doc, content) if with_json else doc
+
+
+def iter_db_patients(con: sqlite3.Connection) -> Iterator[dict]:
+    rows = con.execute("SELECT patient_id, mtb_creation FROM patients ORDER BY rowid")
+    for patient_id, mtb_creation in rows:
+        yield {"patient_id": patient_id, "mtb_creation": mtb_creation}
+
+
+def load_catalog(
+    documents_json=DOCUMENTS_JSON, patients_json=PATIENTS_JSON, db_path=CATALOG_DB
+) -> Catalog:
+    with closing(connect_catalog(documents_json, patients_json, db_path)) as con:
+        return Catalog.from_db(con)
+
+
+class CatalogWatcher:
+    """
+    Keeps `state.catalog` current while the FHIR scripts append to the dumps.
+
+    Every `interval` seconds the dumps are checked with `stat`. New lines of the
+    documents dump are parsed from the last read offset on and added to a copy of the
+    catalog, which then replaces `state.catalog` in one assignment; requests keep using
+    the catalog they started with. The (small) patients file is re-read when it changed.
+    Appends are also written to the compiled catalog, so a restart does not recompile.
+    If the documents dump was truncated or replaced, everything is reloaded.
+    """
+
+    def __init__(
+        self,
+        state,
+        documents_json=DOCUMENTS_JSON,
+        patients_json=PATIENTS_JSON,
+        db_path=CATALOG_DB,
+        interval: float = 2.0,
+    ):
+        self.state = state
+        self.documents_json = documents_json
+        self.patients_json = patients_json
+        self.db_path = db_path
+        self.interval = interval
+        self._offset = 0
+        self._inode = None
+        self._patients_stat = None
+        self._task = None
+
+    def load(self):
+        with closing(
+            connect_catalog(self.documents_json, self.patients_json, self.db_path)
+        ) as con:
+            catalog = Catalog.from_db(con)
+            self._offset = read_meta(con)["documents_offset"]
+        self._inode = os.stat(self.documents_json).st_ino
+        self._patients_stat = self._stat(self.patients_json)
+        self.state.catalog = catalog
+
+    @staticmethod
+    def _stat(path) -> Tuple[int, int]:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+
+    def poll(self) -> bool:
+        """Apply changes of the dumps; returns whether the catalog changed."""
+        stat = os.stat(self.documents_json)
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            logger.info("%s was replaced, reloading catalog", self.documents_json)
+            self.load()
+            return True
+
+        documents, offset = [], self._offset
+        if stat.st_size > self._offset:
+            for doc, offset in iter_records(self.documents_json, self._offset):
+                documents.append(doc)
+
+        patients = None
+        patients_stat = self._stat(self.patients_json)
+        if patients_stat != self._patients_stat:
+            patients = read_patients(self.patients_json)
+
+        if not documents and patients is None:
+            self._offset = offset
+            return False
+
+        patient_ids = None if patients is None else [p["patient_id"] for p in patients]
+        self.state.catalog = self.state.catalog.updated(documents, patient_ids)
+        try:
+            append_to_catalog(
+                self.db_path,
+                documents,
+                offset,
+                source_stats(self.documents_json, self.patients_json),
+                patients,
+            )
+        except sqlite3.Error:
+            # the in-memory catalog is current; the file is recompiled on restart
+            logger.exception("Could not update %s", self.db_path)
+        self._offset = offset
+        self._patients_stat = patients_stat
+        logger.info("Catalog: added %d documents", len(documents))
+        return True
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await asyncio.to_thread(self.poll)
+            except Exception:  # pylint: disable=W0718
+                logger.exception("Catalog refresh failed")
+
+    def start(self):
+        if self.interval > 0:
+            self._task = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+def main(args):
+    if args.force or is_stale(args.documents_json, args.patients_json, args.db_path):
+        compile_catalog(args.documents_json, args.patients_json, args.db_path)
+    else:
+        print(f"{args.db_path} is up to date.")
+
+
+def arg_parser():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--documents_json", type=Path, default=DOCUMENTS_JSON)
+    parser.add_argument("--patients_json", type=Path, default=PATIENTS_JSON)
+    parser.add_argument("--db_path", type=Path, default=CATALOG_DB)
+    parser.add_argument(
+        "--force", action="store_true", help="Compile even if the catalog is current."
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(arg_parser())
@@ -0,0 +1,163 @@
+import asyncio
+from typing import List, Optional, Tuple
+
+from llama_index.core.base.llms.types import ChatMessage
+from llama_index.core.chat_engine import ContextChatEngine as BaseContextChatEngine
+from llama_index.core.chat_engine.types import (
+    AgentChatResponse,
+    StreamingAgentChatResponse,
+    ToolOutput,
+)
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+from raw.budget import TokenBudget, node_content
+
+# Keep references to pending tasks so they are not garbage collected mid-stream
+_background_tasks = set()
+
+
+class ContextChatEngine(BaseContextChatEngine):
+    """
+    ContextChatEngine that consumes the LLM stream on the caller's event loop.
+
+    The upstream `astream_chat` drains the stream in a helper thread running a second
+    event loop. This breaks LLMs with a pooled `httpx.AsyncClient` (connections are
+    bound to the loop that opened them) and costs one thread per streamed response.
+
+    Retrieval is exposed separately (`aretrieve`) so that callers can inspect the
+    retrieved nodes (e.g., for caching) and pass them back to `achat`/`astream_chat`.
+
+    With a `token_budget` (see raw.budget), chunks and history are fit into the prompt
+    budget before the LLM call and the decisions are kept in `budget_report`.
+    """
+
+    token_budget: Optional[TokenBudget] = None
+    budget_report: Optional[dict] = None
+
+    @classmethod
+    def from_defaults(
+        cls, *args, token_budget: Optional[TokenBudget] = None, **kwargs
+    ) -> "ContextChatEngine":
+        chat_engine = super().from_defaults(*args, **kwargs)
+        chat_engine.token_budget = token_budget
+        return chat_engine
+
+    async def aretrieve(self, message: str) -> List[NodeWithScore]:
+        nodes = await self._retriever.aretrieve(message)
+        for postprocessor in self._node_postprocessors:
+            nodes = postprocessor.postprocess_nodes(
+                nodes, query_bundle=QueryBundle(message)
+            )
+        return nodes
+
+    async def _agenerate_context(
+        self, message: str, nodes: Optional[List[NodeWithScore]] = None
+    ) -> Tuple[str, List[NodeWithScore]]:
+        if nodes is None:
+            nodes = await self.aretrieve(message)
+        return self._format_context(nodes), nodes
+
+    def _format_context(self, nodes: List[NodeWithScore]) -> str:
+        context_str = "\n\n".join([node_content(n) for n in nodes])
+        return self._context_template.format(context_str=context_str)
+
+    async def _aprepare_messages(
+        self,
+        message: str,
+        chat_history: Optional[List[ChatMessage]],
+        nodes: Optional[List[NodeWithScore]],
+    ) -> Tuple[List[ChatMessage], List[ChatMessage], List[NodeWithScore]]:
+        if chat_history is not None:
+            self._memory.set(chat_history)
+        user_message = ChatMessage(content=message, role="user")
+        self._memory.put(user_message)
+
+        if self.token_budget is not None:
+            if nodes is None:
+                nodes = await self.aretrieve(message)
+            metadata = self._llm.metadata
+            system_prompt = "\n".join(
+                m.content or "" for m in self._get_prefix_messages_with_context("")
+            )
+            history, nodes, report = self.token_budget.fit(
+                system_prompt + self._format_context([]),
+                user_message,
+                self._memory.get_all()[:-1],
+                nodes,
+                metadata.context_window,
+                metadata.num_output,
+            )
+            self.budget_report = report.to_dict()
+            prefix_messages = self._get_prefix_messages_with_context(
+                self._format_context(nodes)
+            )
+            return prefix_messages + history + [user_message], prefix_messages, nodes
+
+        context_str_template, nodes = await self._agenerate_context(message, nodes)
+        prefix_messages = self._get_prefix_messages_with_context(context_str_template)
+        initial_token_count = len(
+            self._memory.tokenizer_fn(
+                " ".join([(m.content or "") for m in prefix_messages])
+            )
+        )
+        all_messages = prefix_messages + self._memory.get(
+            initial_token_count=initial_token_count
+        )
+        return all_messages, prefix_messages, nodes
+
+    async def achat(
+        self,
+        message: str,
+        chat_history: Optional[List[ChatMessage]] = None,
+        nodes: Optional[List[NodeWithScore]] = None,
+    ) -> AgentChatResponse:
+        all_messages, prefix_messages, nodes = await self._aprepare_messages(
+            message, chat_history, nodes
+        )
+
+        chat_response = await self._llm.achat(all_messages)
+        ai_message = chat_response.message
+        self._memory.put(ai_message)
+
+        return AgentChatResponse(
+            response=str(chat_response.message.content),
+            sources=[
+                ToolOutput(
+                    tool_name="retriever",
+                    content=str(prefix_messages[0]),
+                    raw_input={"message": message},
+                    raw_output=prefix_messages[0],
+                )
+            ],
+            source_nodes=nodes,
+        )
+
+    async def astream_chat(
+        self,
+        message: str,
+        chat_history: Optional[List[ChatMessage]] = None,
+        nodes: Optional[List[NodeWithScore]] = None,
+    ) -> StreamingAgentChatResponse:
+        all_messages, prefix_messages, nodes = await self._aprepare_messages(
+            message, chat_history, nodes
+        )
+
+        chat_response = StreamingAgentChatResponse(
+            achat_stream=await self._llm.astream_chat(all_messages),
+            sources=[
+                ToolOutput(
+                    tool_name="retriever",
+                    content=str(prefix_messages[0]),
+                    raw_input={"message": message},
+                    raw_output=prefix_messages[0],
+                )
+            ],
+            source_nodes=nodes,
+        )
+        task = asyncio.create_task(
+            chat_response.awrite_response_to_history(self._memory)
+        )
+        _background_tasks.add(task)
+        task.add_done_callback(_background_tasks.discard)
+
+        return chat_response
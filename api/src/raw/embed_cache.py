@@ -0,0 +1,292 @@
+"""
+Persistent, content-addressed cache of chunk embeddings. Re-indexing unchanged
+documents then costs a hash and a lookup per chunk instead of a forward pass.
+
+Keys are SHA-256 digests of the embedded text and a namespace (embedding model and
+chunking parameters). Each model gets its own directory with
+
+- vectors.f32: float32 matrix (one row per key), memory-mapped for reads
+- keys.bin: 32-byte digests in row order
+- used.f64: last access time per row (used for eviction)
+
+Rows are appended as they are added; eviction rewrites the files and keeps the most
+recently used rows that fit the size budget.
+
+Several processes (e.g., `engine update` and `fhir_import`) may share a directory.
+Appends, eviction and flushes hold an exclusive `flock` on the lock file and first
+pick up the rows other processes appended since (or reload the files if one of them
+evicted rows, counted by `generation` in meta.json).
+"""
+
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = "./cache/embeddings"
+DIGEST_SIZE = 32
+
+
+def cache_key(text: str, namespace: str) -> bytes:
+    return hashlib.sha256(f"{namespace}\0{text}".encode("utf-8")).digest()
+
+
+class EmbeddingCache:
+    def __init__(self, path, max_bytes: Optional[int] = None):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.dim = None
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self._rows: Dict[bytes, int] = {}
+        self._used: List[float] = []
+        self._vectors = None
+        self._lock = threading.Lock()
+        # pylint: disable=R1732
+        self._lock_fd = open(self.path / "lock", "a+b")
+        with self._lock, self._file_lock():
+            self._load()
+
+    @property
+    def _vectors_file(self):
+        return self.path / "vectors.f32"
+
+    @property
+    def _keys_file(self):
+        return self.path / "keys.bin"
+
+    @property
+    def _used_file(self):
+        return self.path / "used.f64"
+
+    @property
+    def _meta_file(self):
+        return self.path / "meta.json"
+
+    @contextmanager
+    def _file_lock(self):
+        """Exclusive lock on the directory across processes."""
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _read_meta(self) -> Optional[dict]:
+        if not self._meta_file.exists():
+            return None
+        with open(self._meta_file) as fin:
+            return json.load(fin)
+
+    def _write_meta(self):
+        self._write(
+            self._meta_file,
+            json.dumps({"dim": self.dim, "generation": self.generation}).encode(),
+        )
+
+    def _file_rows(self) -> int:
+        n_keys = 0
+        if self._keys_file.exists():
+            n_keys = self._keys_file.stat().st_size // DIGEST_SIZE
+        n_vectors = 0
+        if self._vectors_file.exists():
+            n_vectors = self._vectors_file.stat().st_size // (4 * self.dim)
+        return min(n_keys, n_vectors)
+
+    def _load(self):
+        self._rows = {}
+        self._used = []
+        self._vectors = None
+        meta = self._read_meta()
+        if meta is None:
+            return
+        self.dim = meta["dim"]
+        self.generation = meta.get("generation", 0)
+
+        keys = self._keys_file.read_bytes() if self._keys_file.exists() else b""
+        n_rows = self._file_rows()
+
+        # Drop partially written rows (e.g., after a crash during an append)
+        for path, row_size in [
+            (self._keys_file, DIGEST_SIZE),
+            (self._vectors_file, 4 * self.dim),
+        ]:
+            if path.exists() and path.stat().st_size != n_rows * row_size:
+                os.truncate(path, n_rows * row_size)
+        self._rows = {
+            keys[i * DIGEST_SIZE : (i + 1) * DIGEST_SIZE]: i for i in range(n_rows)
+        }
+        used = np.zeros(n_rows, dtype=np.float64)
+        if self._used_file.exists():
+            stored = np.fromfile(self._used_file, dtype=np.float64)[:n_rows]
+            used[: len(stored)] = stored
+        self._used = used.tolist()
+
+    def _sync(self):
+        """Catch up with the files (holding the file lock)."""
+        meta = self._read_meta()
+        if meta is None:
+            return
+        if self.dim is None or meta.get("generation", 0) != self.generation:
+            # Another process evicted rows: row numbers changed
+            self._load()
+            return
+
+        n_rows, n_known = self._file_rows(), len(self._used)
+        if n_rows <= n_known:
+            return
+        with open(self._keys_file, "rb") as fin:
+            fin.seek(n_known * DIGEST_SIZE)
+            keys = fin.read((n_rows - n_known) * DIGEST_SIZE)
+        for i in range(n_rows - n_known):
+            self._rows[keys[i * DIGEST_SIZE : (i + 1) * DIGEST_SIZE]] = n_known + i
+        self._used.extend([0.0] * (n_rows - n_known))
+
+    def _merge_used(self) -> np.ndarray:
+        """Access times of this and the other processes."""
+        used = np.asarray(self._used, dtype=np.float64)
+        if self._used_file.exists():
+            stored = np.fromfile(self._used_file, dtype=np.float64)[: len(used)]
+            used[: len(stored)] = np.maximum(used[: len(stored)], stored)
+        return used
+
+    def _matrix(self) -> np.ndarray:
+        n_rows = len(self._used)
+        if self._vectors is None or self._vectors.shape[0] != n_rows:
+            self._vectors = np.memmap(
+                self._vectors_file, dtype=np.float32, mode="r", shape=(n_rows, self.dim)
+            )
+        return self._vectors
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @property
+    def nbytes(self) -> int:
+        return len(self._used) * (4 * (self.dim or 0) + DIGEST_SIZE + 8)
+
+    def get_many(self, keys: Sequence[bytes]) -> List[Optional[List[float]]]:
+        with self._lock, self._file_lock():
+            self._sync()
+            rows = [self._rows.get(key) for key in keys]
+            hits = [row for row in rows if row is not None]
+            self.hits += len(hits)
+            self.misses += len(rows) - len(hits)
+            if not hits:
+                return [None] * len(keys)
+
+            matrix = self._matrix()
+            now = time.time()
+            result = []
+            for row in rows:
+                if row is None:
+                    result.append(None)
+                else:
+                    self._used[row] = now
+                    result.append(matrix[row].tolist())
+            return result
+
+    def put_many(self, keys: Sequence[bytes], embeddings: Sequence[List[float]]):
+        with self._lock, self._file_lock():
+            # Rows are numbered by the files, which other processes may have appended to
+            self._sync()
+            new = {}
+            for key, embedding in zip(keys, embeddings):
+                if key not in self._rows:
+                    new[key] = embedding
+            if not new:
+                return
+
+            vectors = np.asarray(list(new.values()), dtype=np.float32)
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+                self._write_meta()
+
+            # Append vectors before keys: a crash in between leaves an unreferenced row
+            with open(self._vectors_file, "ab") as fout:
+                fout.write(vectors.tobytes())
+            with open(self._keys_file, "ab") as fout:
+                fout.write(b"".join(new.keys()))
+
+            now = time.time()
+            for key in new:
+                self._rows[key] = len(self._used)
+                self._used.append(now)
+
+    def evict(self, max_bytes: Optional[int] = None) -> int:
+        """Drop least recently used rows until the cache fits `max_bytes`."""
+        max_bytes = max_bytes or self.max_bytes
+        with self._lock, self._file_lock():
+            self._sync()
+            if max_bytes is None or self.nbytes <= max_bytes:
+                return 0
+
+            row_bytes = 4 * self.dim + DIGEST_SIZE + 8
+            n_keep = max_bytes // row_bytes
+            used = self._merge_used()
+            keep = np.sort(np.argsort(-used, kind="stable")[:n_keep])
+
+            keys = [None] * len(self._used)
+            for key, row in self._rows.items():
+                keys[row] = key
+            keys = [keys[row] for row in keep]
+            vectors = np.array(self._matrix()[keep])
+            used = used[keep]
+
+            self._vectors = None
+            self._write(self._vectors_file, vectors.tobytes())
+            self._write(self._keys_file, b"".join(keys))
+            self._write(self._used_file, used.tobytes())
+            # Other processes reload on their next access
+            self.generation += 1
+            self._write_meta()
+
+            n_evicted = len(self._used) - len(keep)
+            self._rows = {key: row for row, key in enumerate(keys)}
+            self._used = used.tolist()
+            return n_evicted
+
+    @staticmethod
+    def _write(path: Path, content: bytes):
+        tmp_path = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp_path, "wb") as fout:
+            fout.write(content)
+        os.replace(tmp_path, path)
+
+    def flush(self):
+        with self._lock, self._file_lock():
+            self._sync()
+            if self._used:
+                self._write(self._used_file, self._merge_used().tobytes())
+
+    def close(self):
+        self.evict()
+        self.flush()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "path": str(self.path),
+            "entries": len(self),
+            "dim": self.dim,
+            "size_mb": self.nbytes / 2**20,
+            "max_size_mb": self.max_bytes / 2**20 if self.max_bytes else None,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+def model_cache_dir(base_dir, model_name: str) -> Path:
+    # one directory per model, as embedding dimensions differ between models
+    slug = hashlib.sha256(model_name.encode("utf-8")).hexdigest()[:16]
+    return Path(base_dir) / slug
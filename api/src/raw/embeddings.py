@@ -0,0 +1,264 @@
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+
+from raw.embed_cache import EmbeddingCache, cache_key
+
+
+class ThreadedEmbedding(BaseEmbedding):
+    """
+    Wraps a synchronous (e.g., local sentence-transformers) embedding model so that the
+    async API runs the forward pass in a worker thread instead of blocking the event
+    loop. The synchronous API calls the wrapped model directly.
+    """
+
+    _model: BaseEmbedding = PrivateAttr()
+
+    def __init__(self, model: BaseEmbedding, **kwargs: Any) -> None:
+        super().__init__(
+            model_name=model.model_name,
+            embed_batch_size=model.embed_batch_size,
+            **kwargs,
+        )
+        self._model = model
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "ThreadedEmbedding"
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._model._get_query_embedding(query)  # pylint: disable=W0212
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._model._get_text_embedding(text)  # pylint: disable=W0212
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return self._model._get_text_embeddings(texts)  # pylint: disable=W0212
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return await asyncio.to_thread(self._get_query_embedding, query)
+
+    async def _aget_text_embedding(self, text: str) -> Embedding:
+        return await asyncio.to_thread(self._get_text_embedding, text)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return await asyncio.to_thread(self._get_text_embeddings, texts)
+
+
+class CachedEmbedding(ThreadedEmbedding):
+    """
+    Looks up text (chunk) embeddings in a persistent `EmbeddingCache` before calling
+    the wrapped model. `namespace` must identify everything besides the text that
+    determines the embedding (model, chunking parameters).
+    """
+
+    namespace: str = Field(description="Namespace of the cache keys.")
+
+    _cache: EmbeddingCache = PrivateAttr()
+
+    def __init__(self, model: BaseEmbedding, cache: EmbeddingCache, **kwargs: Any):
+        super().__init__(model, **kwargs)
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def cache(self) -> EmbeddingCache:
+        return self._cache
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        keys = [cache_key(text, self.namespace) for text in texts]
+        embeddings = self._cache.get_many(keys)
+        missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+        if missing:
+            computed = super()._get_text_embeddings([texts[i] for i in missing])
+            for i, embedding in zip(missing, computed):
+                embeddings[i] = embedding
+            self._cache.put_many([keys[i] for i in missing], computed)
+        return embeddings
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent embedding requests into one forward pass. The first request
+    opens a window of `window` seconds; everything that arrives until the window closes
+    (or until `max_batch_size` requests are pending) is embedded as one batch. Batches
+    run one at a time so that requests arriving during a forward pass form the next
+    batch instead of competing for the CPU.
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], List[Embedding]],
+        window: float = 0.005,
+        max_batch_size: int = 32,
+    ):
+        self.embed_fn = embed_fn
+        self.window = window
+        self.max_batch_size = max_batch_size
+        self._pending = []
+        self._timer = None
+        self._lock = None
+        self._tasks = set()
+
+        self.batches = 0
+        self.batched_requests = 0
+        self.max_batch = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    async def embed(self, text: str) -> Embedding:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future, loop.time()))
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._flush)
+        return await future
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            task = asyncio.ensure_future(self._run(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, batch):
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            texts = list(dict.fromkeys(text for text, _, _ in batch))
+            try:
+                embeddings = await asyncio.to_thread(self.embed_fn, texts)
+            except Exception as e:  # pylint: disable=W0718
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                return
+
+        by_text = dict(zip(texts, embeddings))
+        for text, future, enqueued in batch:
+            self.total_wait += now - enqueued
+            self.max_wait = max(self.max_wait, now - enqueued)
+            if not future.done():
+                future.set_result(by_text[text])
+        self.batches += 1
+        self.batched_requests += len(batch)
+        self.max_batch = max(self.max_batch, len(batch))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "requests": self.batched_requests,
+            "mean_batch_size": self.batched_requests / max(self.batches, 1),
+            "max_batch_size": self.max_batch,
+            "mean_queue_wait_ms": 1000
+            * self.total_wait
+            / max(self.batched_requests, 1),
+            "max_queue_wait_ms": 1000 * self.max_wait,
+        }
+
+
+class QueryEmbedding(ThreadedEmbedding):
+    """
+    Embedding model for concurrent chat traffic. Query embeddings are served from an
+    LRU cache of recent query strings; misses from async callers are micro-batched
+    with `EmbeddingBatcher`.
+
+    Batched queries are embedded with the model's text embedding, which is only correct
+    for symmetric models without query instructions (like paraphrase-MiniLM).
+    """
+
+    cache_size: int = Field(default=1024, description="Number of cached queries.")
+    batch_window: float = Field(
+        default=0.005,
+        description="Seconds to wait for concurrent queries before embedding a batch. Set to 0 to disable batching.",
+    )
+    max_batch_size: int = Field(default=32, description="Maximum batch size.")
+
+    _cache: OrderedDict = PrivateAttr()
+    _cache_lock: threading.Lock = PrivateAttr()
+    _batcher: Optional[EmbeddingBatcher] = PrivateAttr()
+    _hits: int = PrivateAttr()
+    _misses: int = PrivateAttr()
+
+    def __init__(self, model: BaseEmbedding, **kwargs: Any) -> None:
+        super().__init__(model, **kwargs)
+        self._cache = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._batcher = None
+        if self.batch_window > 0:
+            self._batcher = EmbeddingBatcher(
+                self._get_text_embeddings,
+                window=self.batch_window,
+                max_batch_size=self.max_batch_size,
+            )
+        self._hits = 0
+        self._misses = 0
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "QueryEmbedding"
+
+    def _cache_get(self, query: str) -> Optional[Embedding]:
+        with self._cache_lock:
+            embedding = self._cache.get(query)
+            if embedding is None:
+                self._misses += 1
+                return None
+            self._hits += 1
+            self._cache.move_to_end(query)
+            return embedding
+
+    def _cache_put(self, query: str, embedding: Embedding) -> None:
+        with self._cache_lock:
+            self._cache[query] = embedding
+            self._cache.move_to_end(query)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        embedding = self._cache_get(query)
+        if embedding is None:
+            embedding = super()._get_query_embedding(query)
+            self._cache_put(query, embedding)
+        return embedding
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        embedding = self._cache_get(query)
+        if embedding is not None:
+            return embedding
+
+        if self._batcher is None:
+            embedding = await asyncio.to_thread(super()._get_query_embedding, query)
+        else:
+            embedding = await self._batcher.embed(query)
+        self._cache_put(query, embedding)
+        return embedding
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._hits + self._misses
+        stats = {
+            "cache_size": len(self._cache),
+            "cache_hits": self._hits,
+            "cache_misses": self._misses,
+            "cache_hit_rate": self._hits / lookups if lookups else 0.0,
+        }
+        if self._batcher is not None:
+            stats["batching"] = self._batcher.stats()
+        return stats
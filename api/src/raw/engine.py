@@ -1,7 +1,11 @@
 import argparse
+import atexit
 import os
+import threading
+import time
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, List, Optional
 
 from llama_index.core import (
     Settings,
@@ -10,22 +14,112 @@ from llama_index.core import (
     VectorStoreIndex,
     load_index_from_storage,
 )
-from llama_index.core.node_parser import SimpleNodeParser
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.embeddings.utils import resolve_embed_model
 from llama_index.core.schema import Document
+from llama_index.core.vector_stores.types import (
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
 from llama_index.vector_stores.qdrant import QdrantVectorStore
 from qdrant_client import AsyncQdrantClient, QdrantClient, models
-from tqdm import tqdm
 
+from raw.embed_cache import DEFAULT_CACHE_DIR, EmbeddingCache, model_cache_dir
+from raw.embeddings import CachedEmbedding, QueryEmbedding
+from raw.ingest import (
+    DEFAULT_EMBED_BATCH_SIZE,
+    DEFAULT_UPLOAD_BATCH_SIZE,
+    DEFAULT_UPLOAD_WORKERS,
+    bulk_insert,
+)
+from raw.manifest import Manifest
+from raw.node_parser import MTBNodeParser
 from raw.ollama import Ollama
+from raw.onnx_embedding import (
+    DEFAULT_ONNX_DIR,
+    compare,
+    export,
+    export_dir,
+    load_onnx_embedding,
+    quantize,
+)
+from raw.vector_cache import vector_cache_from_env
+
+EMBED_MODEL = "local:sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+# PyTorch (sentence-transformers) or ONNX Runtime (fp32/int8, see raw.onnx_embedding)
+EMBED_BACKENDS = ["torch", "onnx", "onnx-int8"]
+# Reference texts of the accuracy check
+SAMPLE_TEXTS = [
+    "Was ist die Diagnose?",
+    "Adenokarzinom der Lunge, Erstdiagnose 03/2021, cT2a cN2 cM1b",
+    "Bisheriger Therapieverlauf: 4 Zyklen Carboplatin/Pemetrexed, danach Progress",
+    "Molekulares Profil: KRAS G12C Mutation, PD-L1 TPS 60%",
+    "Welche Therapie empfiehlt das Tumorboard?",
+    "Beschluss: Therapie mit Sotorasib, Re-Evaluation nach 3 Monaten",
+    "Histologie: invasives duktales Mammakarzinom, G3, HER2 negativ",
+    "Komorbiditäten: arterielle Hypertonie, Diabetes mellitus Typ 2",
+]
+
+
+class ProfileQdrantVectorStore(QdrantVectorStore):
+    """
+    Sends the search parameters of the collection profile (`search_params`, see
+    `collection_search_params`) with dense queries, e.g., rescoring of quantized
+    vectors. Without them, the chat route would search with other parameters than
+    the ones benchmarked for the profile.
+    """
+
+    search_params: Optional[Any] = None
 
+    def _query_points_kwargs(self, query: VectorStoreQuery, kwargs: dict) -> dict:
+        qdrant_filters = kwargs.get("qdrant_filters")
+        return {
+            "collection_name": self.collection_name,
+            "query": query.query_embedding,
+            "limit": query.similarity_top_k,
+            "query_filter": (
+                qdrant_filters
+                if qdrant_filters is not None
+                else self._build_query_filter(query)
+            ),
+            "search_params": self.search_params,
+        }
 
-def get_index():
-    vector_store = QdrantVectorStore(
+    def _is_dense(self, query: VectorStoreQuery) -> bool:
+        return not self.enable_hybrid and query.mode == VectorStoreQueryMode.DEFAULT
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if not self._is_dense(query):
+            return super().query(query, **kwargs)
+        response = self._client.query_points(**self._query_points_kwargs(query, kwargs))
+        return self.parse_to_query_result(response.points)
+
+    async def aquery(
+        self, query: VectorStoreQuery, **kwargs: Any
+    ) -> VectorStoreQueryResult:
+        if not self._is_dense(query):
+            return await super().aquery(query, **kwargs)
+        response = await self._aclient.query_points(
+            **self._query_points_kwargs(query, kwargs)
+        )
+        return self.parse_to_query_result(response.points)
+
+
+def get_vector_store(
+    client: Optional[QdrantClient] = None,
+    aclient: Optional[AsyncQdrantClient] = None,
+) -> ProfileQdrantVectorStore:
+    return ProfileQdrantVectorStore(
         collection_name=os.environ["QDRANT_COLLECTION"],
-        client=QdrantClient(os.environ["QDRANT_LOCATION"]),
-        aclient=AsyncQdrantClient(os.environ["QDRANT_LOCATION"]),
+        client=client or QdrantClient(os.environ["QDRANT_LOCATION"]),
+        aclient=aclient or AsyncQdrantClient(os.environ["QDRANT_LOCATION"]),
     )
 
+
+def get_index(vector_store: Optional[QdrantVectorStore] = None):
+    vector_store = vector_store or get_vector_store()
+
     if Path("./storage").exists():
         # This is necessary to support updating: https://github.com/run-llama/llama_index/issues/8832
         storage_context = StorageContext.from_defaults(
@@ -40,7 +134,103 @@ def get_index():
     return index
 
 
-def init_settings():
+class IndexManager:
+    """
+    Process-wide owner of the Qdrant clients, the vector store and the index.
+
+    The API creates one manager at startup and shares it across requests. Call
+    `reload()` after the index was rebuilt (e.g., with `raw.engine update`) to pick up
+    the new docstore without restarting the process. The optional per-patient vector
+    cache (see raw.vector_cache) is cleared on reload.
+    """
+
+    def __init__(
+        self,
+        client: Optional[QdrantClient] = None,
+        aclient: Optional[AsyncQdrantClient] = None,
+    ):
+        self.client = client or QdrantClient(os.environ["QDRANT_LOCATION"])
+        self.aclient = aclient or AsyncQdrantClient(os.environ["QDRANT_LOCATION"])
+        self.vector_store = get_vector_store(self.client, self.aclient)
+        self.vector_cache = vector_cache_from_env(
+            self.client, self.vector_store.collection_name
+        )
+        self._index = None
+        self._lock = threading.Lock()
+
+    @property
+    def index(self) -> VectorStoreIndex:
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = get_index(self.vector_store)
+        return self._index
+
+    def reload(self) -> VectorStoreIndex:
+        # The profile may have changed with the index (e.g., `raw.engine configure`)
+        self.vector_store.search_params = collection_search_params(
+            self.client, self.vector_store.collection_name
+        )
+        # Build the new index before swapping so requests never see a partial index
+        index = get_index(self.vector_store)
+        with self._lock:
+            self._index = index
+        if self.vector_cache is not None:
+            self.vector_cache.invalidate()
+        return index
+
+    async def aclose(self):
+        self.client.close()
+        await self.aclient.close()
+
+
+def get_embed_model(backend: Optional[str] = None) -> BaseEmbedding:
+    """
+    The embedding model on the backend (default: EMBED_BACKEND or torch). The ONNX
+    backends export the model to EMBED_ONNX_DIR on first use and run with
+    EMBED_THREADS threads per forward pass (default: number of CPUs).
+    """
+    backend = backend or os.environ.get("EMBED_BACKEND", "torch")
+    if backend == "torch":
+        return resolve_embed_model(EMBED_MODEL)
+    if backend in ["onnx", "onnx-int8"]:
+        threads = os.environ.get("EMBED_THREADS")
+        return load_onnx_embedding(
+            EMBED_MODEL.removeprefix("local:"),
+            base_dir=os.environ.get("EMBED_ONNX_DIR", DEFAULT_ONNX_DIR),
+            quantized=backend == "onnx-int8",
+            threads=int(threads) if threads else None,
+        )
+    raise ValueError(f"Invalid embedding backend {backend}")
+
+
+def embed_model_id(backend: Optional[str] = None) -> str:
+    """Identifies the embeddings of the backend (e.g., in embedding cache keys)."""
+    backend = backend or os.environ.get("EMBED_BACKEND", "torch")
+    # int8 embeddings differ slightly; fp32 ONNX ones only by rounding
+    return f"{EMBED_MODEL}|int8" if backend == "onnx-int8" else EMBED_MODEL
+
+
+def check_embeddings(backend: str, min_cosine: float) -> bool:
+    """Compare the embeddings of the backend to the PyTorch embeddings."""
+    result = compare(get_embed_model("torch"), get_embed_model(backend), SAMPLE_TEXTS)
+    print(f"{backend}: " + ", ".join(f"{k} {v:.4f}" for k, v in result.items()))
+    return result["min_cosine"] >= min_cosine
+
+
+def get_embedding_cache() -> EmbeddingCache:
+    base_dir = os.environ.get("EMBED_CACHE_DIR", DEFAULT_CACHE_DIR)
+    max_mb = float(os.environ.get("EMBED_CACHE_MAX_MB", 2048))
+    return EmbeddingCache(
+        model_cache_dir(base_dir, EMBED_MODEL), max_bytes=int(max_mb * 2**20)
+    )
+
+
+def init_settings(embedding_cache: bool = False):
+    """
+    Configure LLM, embedding model and node parser. With `embedding_cache`, chunk
+    embeddings are read from/written to the persistent embedding cache (for indexing).
+    """
     Settings.llm = Ollama(
         model="mixtral:latest",
         base_url=os.environ["OLLAMA_BASE_URL"],
@@ -48,11 +238,27 @@ def init_settings():
         temperature=0,
     )
 
-    node_parser = SimpleNodeParser.from_defaults(chunk_size=512, chunk_overlap=32)
+    # One node per protocol section/field, sentence splitting for other documents
+    node_parser = MTBNodeParser(chunk_size=512, chunk_overlap=32)
     # Embeddings leaderboard: https://huggingface.co/spaces/mteb/leaderboard
     # MiniLM strikes a balance of being fast (384 dims) and doing good on major languages
-    Settings.embed_model = (
-        "local:sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+    embed_model = get_embed_model()
+    # Forward pass size during indexing (the default of 10 underutilizes the CPU)
+    embed_model.embed_batch_size = int(os.environ.get("EMBED_BATCH_SIZE", 64))
+    if embedding_cache:
+        cache = get_embedding_cache()
+        atexit.register(cache.close)
+        embed_model = CachedEmbedding(
+            embed_model,
+            cache,
+            namespace=f"{embed_model_id()}|{node_parser.class_name()}|{node_parser.chunk_size}|{node_parser.chunk_overlap}",
+        )
+    # The local model is synchronous, run it in a thread for async (API) callers
+    # Repeated queries are cached, concurrent queries are embedded as one batch
+    Settings.embed_model = QueryEmbedding(
+        embed_model,
+        cache_size=int(os.environ.get("EMBED_QUERY_CACHE_SIZE", 1024)),
+        batch_window=float(os.environ.get("EMBED_BATCH_WINDOW_MS", 5)) / 1000,
     )
     Settings.node_parser = node_parser
 
@@ -61,41 +267,302 @@ def get_llm():
     return Settings.llm
 
 
-def load_documents(data_path) -> List[Document]:
-    docs = SimpleDirectoryReader(data_path, filename_as_id=True).load_data()
+def load_documents(data_path=None, input_files=None) -> List[Document]:
+    docs = SimpleDirectoryReader(
+        data_path, input_files=input_files, filename_as_id=True
+    ).load_data()
     for doc in docs:
         doc.metadata["patient_id"] = Path(doc.metadata["file_name"]).stem
     return docs
 
 
-def create_index(documents: List[Document]):
-    index = get_index()
-    client = index.vector_store.client
-    collection_name = index.vector_store.collection_name
-    for doc in tqdm(documents, desc="Insert documents into index."):
-        print(doc.get_doc_id())
-        index.insert(doc)
+# QdrantVectorStore stores the node metadata at the top level of the payload
+PATIENT_ID_KEY = "patient_id"
 
-    index.vector_store.client.create_payload_index(
-        collection_name=collection_name,
-        field_name="metadata.patient_id",
-        field_type=models.PayloadSchemaType.KEYWORD,
+
+@dataclass
+class CollectionProfile:
+    """Qdrant collection settings, applied after indexing (see COLLECTION_PROFILES)."""
+
+    description: str
+    # Per-patient HNSW graphs only (m=0): every search is filtered by patient
+    hnsw: models.HnswConfigDiff = field(
+        default_factory=lambda: models.HnswConfigDiff(payload_m=16, m=0)
+    )
+    # Patient id as tenant key: points of a patient are co-located in storage
+    tenant: bool = False
+    quantization: Optional[models.ScalarQuantization] = None
+    # Vectors, HNSW graphs, payload and payload index on disk (memory-mapped)
+    on_disk: bool = False
+    optimizers: Optional[models.OptimizersConfigDiff] = None
+    # Search parameters that go with the profile (e.g., rescoring)
+    search_params: Optional[models.SearchParams] = None
+
+
+INT8 = models.ScalarQuantization(
+    scalar=models.ScalarQuantizationConfig(
+        type=models.ScalarType.INT8, quantile=0.99, always_ram=True
     )
+)
+# Quantized candidates are rescored with the original vectors
+RESCORE = models.SearchParams(
+    quantization=models.QuantizationSearchParams(rescore=True, oversampling=2.0)
+)
+# Fewer, larger segments (a filtered search visits every segment); segments are
+# indexed from 20 MB on, smaller ones are searched exhaustively
+TENANT_OPTIMIZERS = models.OptimizersConfigDiff(
+    default_segment_number=2, indexing_threshold=20000
+)
+
+COLLECTION_PROFILES = {
+    "default": CollectionProfile("Keyword index on the patient id, per-patient HNSW"),
+    "tenant": CollectionProfile(
+        "Patient id as tenant key", tenant=True, optimizers=TENANT_OPTIMIZERS
+    ),
+    "quantized": CollectionProfile(
+        "Tenant key and int8 scalar quantization (4x less vector memory), rescoring",
+        tenant=True,
+        quantization=INT8,
+        optimizers=TENANT_OPTIMIZERS,
+        search_params=RESCORE,
+    ),
+    "on_disk": CollectionProfile(
+        "Tenant key, int8 vectors in RAM, original vectors and payload on disk",
+        hnsw=models.HnswConfigDiff(payload_m=16, m=0, on_disk=True),
+        tenant=True,
+        quantization=INT8,
+        on_disk=True,
+        optimizers=TENANT_OPTIMIZERS,
+        search_params=RESCORE,
+    ),
+}
+DEFAULT_PROFILE = "default"
+
 
+def apply_profile(client: QdrantClient, collection_name: str, profile: str):
+    """
+    Apply a collection profile. Settings of other profiles are reset (e.g.,
+    quantization is disabled), Qdrant rebuilds the segments in the background.
+    """
+    settings = COLLECTION_PROFILES[profile]
+    client.create_payload_index(
+        collection_name=collection_name,
+        field_name=PATIENT_ID_KEY,
+        field_schema=models.KeywordIndexParams(
+            type=models.KeywordIndexType.KEYWORD,
+            is_tenant=settings.tenant,
+            on_disk=settings.on_disk,
+        ),
+    )
     client.update_collection(
         collection_name=collection_name,
-        hnsw_config=models.HnswConfigDiff(payload_m=16, m=0),
+        hnsw_config=settings.hnsw,
+        quantization_config=settings.quantization or models.Disabled.DISABLED,
+        vectors_config={"": models.VectorParamsDiff(on_disk=settings.on_disk)},
+        collection_params=models.CollectionParamsDiff(on_disk_payload=settings.on_disk),
+        optimizers_config=settings.optimizers,
     )
 
+
+def collection_search_params(
+    client: QdrantClient, collection_name: str
+) -> Optional[models.SearchParams]:
+    """
+    Search parameters of the profile applied to the collection: the quantized
+    profiles rescore (see COLLECTION_PROFILES), the others use the server defaults.
+    """
+    if not client.collection_exists(collection_name):
+        return None
+    if client.get_collection(collection_name).config.quantization_config is None:
+        return None
+    return RESCORE
+
+
+def configure_collection(index, profile: str = DEFAULT_PROFILE):
+    apply_profile(
+        index.vector_store.client, index.vector_store.collection_name, profile
+    )
+
+
+# Payload keys the API filters on (see raw.routes.chat) and their index types
+FILTER_KEYS = {PATIENT_ID_KEY: models.PayloadSchemaType.KEYWORD}
+
+
+def check_payload_indexes(
+    client: QdrantClient, collection_name: str, create: bool = True
+) -> Dict[str, str]:
+    """
+    Compare the payload indexes of the collection with the filter keys of the API.
+    Without an index, every filtered search checks the payload of each candidate.
+    Returns the status per key: "indexed", "created" or (without `create`) "missing".
+    """
+    if not client.collection_exists(collection_name):
+        return {}
+    schema = client.get_collection(collection_name).payload_schema
+    report = {}
+    for key, schema_type in FILTER_KEYS.items():
+        info = schema.get(key)
+        if info is not None and info.data_type == schema_type:
+            report[key] = "indexed"
+        elif create:
+            client.create_payload_index(
+                collection_name=collection_name,
+                field_name=key,
+                field_schema=schema_type,
+            )
+            report[key] = "created"
+        else:
+            report[key] = "missing" if info is None else f"type {info.data_type}"
+    return report
+
+
+def timed_ms(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, (time.perf_counter() - start) * 1000
+
+
+def explain_search(
+    client: QdrantClient,
+    collection_name: str,
+    patient_id: str,
+    query_vector: List[float],
+    top_k: int = 3,
+) -> dict:
+    """
+    How Qdrant (likely) answers the patient-filtered search of the chat route, with
+    timings of the search and of an exact search. Qdrant searches the points of a
+    patient exhaustively via the payload index if their vectors are smaller than
+    `full_scan_threshold`, else it uses the per-patient HNSW graphs (`payload_m`).
+    """
+    info = client.get_collection(collection_name)
+    vectors = info.config.params.vectors
+    if isinstance(vectors, dict):
+        vectors = next(iter(vectors.values()))
+    hnsw = info.config.hnsw_config
+    index_info = info.payload_schema.get(PATIENT_ID_KEY)
+    patient_filter = models.Filter(
+        must=[
+            models.FieldCondition(
+                key=PATIENT_ID_KEY, match=models.MatchValue(value=patient_id)
+            )
+        ]
+    )
+    points = client.count(
+        collection_name=collection_name, count_filter=patient_filter, exact=True
+    ).count
+
+    vector_kb = points * vectors.size * 4 / 1024
+    if index_info is None:
+        strategy = "no payload index: the filter is checked on every candidate point"
+    elif vector_kb < hnsw.full_scan_threshold:
+        strategy = "payload index, exhaustive search over the patient's points"
+    elif hnsw.payload_m:
+        strategy = "payload index, per-patient HNSW graph"
+    else:
+        strategy = "payload index, HNSW search with the filter"
+
+    def search(params=None):
+        return client.query_points(
+            collection_name=collection_name,
+            query=query_vector,
+            query_filter=patient_filter,
+            limit=top_k,
+            search_params=params,
+        ).points
+
+    found, search_ms = timed_ms(search)
+    exact, exact_ms = timed_ms(search, models.SearchParams(exact=True))
+    return {
+        "patient_id": patient_id,
+        "points": points,
+        "payload_index": (
+            {
+                "key": PATIENT_ID_KEY,
+                "type": str(index_info.data_type.value),
+                "is_tenant": getattr(index_info.params, "is_tenant", None),
+            }
+            if index_info is not None
+            else None
+        ),
+        "hnsw": {
+            "m": hnsw.m,
+            "payload_m": hnsw.payload_m,
+            "full_scan_threshold_kb": hnsw.full_scan_threshold,
+        },
+        "quantization": info.config.quantization_config is not None,
+        "strategy": strategy,
+        "search_ms": search_ms,
+        "exact_search_ms": exact_ms,
+        # share of the exact top-k found by the search
+        "recall": (
+            len({p.id for p in found} & {p.id for p in exact}) / len(exact)
+            if exact
+            else None
+        ),
+    }
+
+
+def create_index(
+    documents: List[Document], profile: str = DEFAULT_PROFILE, **bulk_kwargs
+):
+    index = get_index()
+    print(f"Insert {len(documents):,} documents into index.")
+    nodes = bulk_insert(index, documents, **bulk_kwargs)
+    configure_collection(index, profile)
     index.storage_context.persist(persist_dir="./storage")
 
+    manifest = Manifest.load() or Manifest()
+    manifest.record(documents, nodes)
+    manifest.save()
 
-def update_index(documents: List[Document]):
+
+def delete_files(index, manifest: Manifest, paths: List[str]):
+    """Delete the vectors and docstore entries of files in the manifest."""
+    node_ids = []
+    for path in paths:
+        entry = manifest.remove(path)
+        if entry.node_ids:
+            node_ids.extend(entry.node_ids)
+        else:
+            # entries recorded without node ids (see update_index): delete by filter
+            for doc_id in entry.doc_ids:
+                index.vector_store.delete(doc_id)
+        for doc_id in entry.doc_ids:
+            index.docstore.delete_document(doc_id, raise_error=False)
+
+    if node_ids:
+        index.vector_store.client.delete(
+            collection_name=index.vector_store.collection_name,
+            points_selector=models.PointIdsList(points=node_ids),
+        )
+
+
+def update_index(data_path, **bulk_kwargs):
     index = get_index()
-    updated = index.refresh_ref_docs(documents)
-    for doc, is_new in zip(documents, updated):
-        print(doc.get_doc_id(), f"Updated: {is_new}")
+    manifest = Manifest.load()
+
+    if manifest is None:
+        # Index predates the manifest: refresh all documents once and record them
+        documents = load_documents(data_path)
+        updated = index.refresh_ref_docs(documents)
+        for doc, is_new in zip(documents, updated):
+            print(doc.get_doc_id(), f"Updated: {is_new}")
+        manifest = Manifest()
+        manifest.record(documents, [])
+    else:
+        diff = manifest.diff(data_path)
+        print(diff)
+        delete_files(index, manifest, diff.changed + diff.removed)
+
+        files = diff.new + diff.changed
+        if files:
+            documents = load_documents(input_files=files)
+            nodes = bulk_insert(index, documents, **bulk_kwargs)
+            manifest.record(documents, nodes)
+
     index.storage_context.persist(persist_dir="./storage")
+    manifest.save()
 
 
 def delete_index():
@@ -105,15 +572,63 @@ def delete_index():
     client.delete_collection(collection_name=collection_name)
 
 
+def print_cache_stats():
+    stats = get_embedding_cache().stats()
+    # Hits and misses are counted per process, a freshly opened cache has none
+    for key in ["hits", "misses", "hit_rate"]:
+        del stats[key]
+    for key, value in stats.items():
+        print(f"{key}: {value}")
+
+
 def main(args):
-    init_settings()
+    if args.command == "cache-stats":
+        print_cache_stats()
+        return
+    if args.command == "configure":
+        # Only touches the collection, no models needed
+        vector_store = get_vector_store()
+        apply_profile(vector_store.client, vector_store.collection_name, args.profile)
+        return
+    if args.command == "export-onnx":
+        model_name = EMBED_MODEL.removeprefix("local:")
+        model_dir = export_dir(
+            os.environ.get("EMBED_ONNX_DIR", DEFAULT_ONNX_DIR), model_name
+        )
+        export(model_name, model_dir)
+        print(f"Exported {model_name} to {model_dir}, int8: {quantize(model_dir)}")
+        return
+    if args.command == "check-embeddings":
+        if not check_embeddings(args.backend, args.min_cosine):
+            raise SystemExit(f"Cosine similarity below {args.min_cosine}")
+        return
+    if args.command == "check-indexes":
+        vector_store = get_vector_store()
+        report = check_payload_indexes(
+            vector_store.client, vector_store.collection_name, create=not args.dry_run
+        )
+        for key, status in report.items():
+            print(f"{key}: {status}")
+        return
+
+    init_settings(embedding_cache=True)
 
     if args.command == "create":
         documents = load_documents(args.data_path)
-        create_index(documents)
+        create_index(
+            documents,
+            profile=args.profile,
+            embed_batch_size=args.embed_batch_size,
+            upload_batch_size=args.upload_batch_size,
+            upload_workers=args.upload_workers,
+        )
     elif args.command == "update":
-        documents = load_documents(args.data_path)
-        update_index(documents)
+        update_index(
+            args.data_path,
+            embed_batch_size=args.embed_batch_size,
+            upload_batch_size=args.upload_batch_size,
+            upload_workers=args.upload_workers,
+        )
     elif args.command == "delete":
         delete_index()
     else:
@@ -127,7 +642,16 @@ def arg_parser():
     parser.add_argument(
         "command",
         help="What operation to do on the index.",
-        choices=["create", "update", "delete"],
+        choices=[
+            "create",
+            "update",
+            "delete",
+            "configure",
+            "check-indexes",
+            "export-onnx",
+            "check-embeddings",
+            "cache-stats",
+        ],
     )
     parser.add_argument(
         "--data_path",
@@ -135,6 +659,48 @@ def arg_parser():
         help="Where to read documents from (pdf, txt, ...).",
         required=False,
     )
+    parser.add_argument(
+        "--profile",
+        default=DEFAULT_PROFILE,
+        choices=list(COLLECTION_PROFILES),
+        help="Collection settings (create, configure). "
+        + "; ".join(f"{k}: {v.description}" for k, v in COLLECTION_PROFILES.items()),
+    )
+    parser.add_argument(
+        "--dry_run",
+        action="store_true",
+        help="Only report missing payload indexes (check-indexes).",
+    )
+    parser.add_argument(
+        "--backend",
+        default="onnx-int8",
+        choices=EMBED_BACKENDS[1:],
+        help="Embedding backend compared to PyTorch (check-embeddings).",
+    )
+    parser.add_argument(
+        "--min_cosine",
+        type=float,
+        default=0.98,
+        help="Minimum cosine similarity to the PyTorch embeddings (check-embeddings).",
+    )
+    parser.add_argument(
+        "--embed_batch_size",
+        type=int,
+        default=DEFAULT_EMBED_BATCH_SIZE,
+        help="Number of chunks embedded per batch.",
+    )
+    parser.add_argument(
+        "--upload_batch_size",
+        type=int,
+        default=DEFAULT_UPLOAD_BATCH_SIZE,
+        help="Number of chunks per upsert request to Qdrant.",
+    )
+    parser.add_argument(
+        "--upload_workers",
+        type=int,
+        default=DEFAULT_UPLOAD_WORKERS,
+        help="Number of parallel upsert requests to Qdrant.",
+    )
     return parser.parse_args()
 
 
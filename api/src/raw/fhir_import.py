@@ -1,11 +1,53 @@
-import json
+"""
+Index the documents of the MTB patients (see ../fhir) as a streaming pipeline:
+
+1. documents are read one by one from the compiled catalog (see raw.catalog) and
+   filtered by the MTB cutoff
+2. text is extracted from the selected attachments in a process pool
+3. chunks are embedded and upserted by `BulkInserter` (see raw.ingest)
+
+At most `max_pending` files are extracted ahead of the embedder and embedded batches
+wait in a bounded upload queue, so memory does not grow with the corpus and the first
+vectors are in Qdrant after the first embedding batch.
+"""
+
+import argparse
+import sqlite3
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from datetime import datetime
 from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
 
 from llama_index.core.readers import SimpleDirectoryReader
+from llama_index.core.readers.file.base import default_file_metadata_func
+from llama_index.core.schema import Document
 
-from raw.engine import create_index, init_settings
+from raw.catalog import (
+    BLOBS_PATH,
+    CATALOG_DB,
+    DOCS_BASE_PATH,
+    DOCUMENTS_JSON,
+    PATIENTS_JSON,
+    connect_catalog,
+    form_path,
+    iter_db_documents,
+    iter_db_patients,
+)
+from raw.engine import (
+    COLLECTION_PROFILES,
+    DEFAULT_PROFILE,
+    configure_collection,
+    get_index,
+    init_settings,
+)
+from raw.ingest import (
+    DEFAULT_EMBED_BATCH_SIZE,
+    DEFAULT_UPLOAD_BATCH_SIZE,
+    DEFAULT_UPLOAD_WORKERS,
+    BulkInserter,
+)
 from raw.loader import PDFReaderPlus, TesseractReader
+from raw.manifest import Manifest
 
 INDEXING_PRIORITY = {
     "text/plain; charset=UTF-8": 0,
@@ -17,6 +59,16 @@ INDEXING_PRIORITY = {
     "application/zip": 999,
 }
 
+# Same as SimpleDirectoryReader.load_data: keep only file_path for embeddings and LLM
+EXCLUDED_METADATA_KEYS = [
+    "file_name",
+    "file_type",
+    "file_size",
+    "creation_date",
+    "last_modified_date",
+    "last_accessed_date",
+]
+
 PDF_READER = PDFReaderPlus(language="deu")
 IMAGE_READER = TesseractReader()
 CUSTOM_READERS = {
@@ -28,105 +80,225 @@ CUSTOM_READERS = {
 }
 
 
-PATIENTS_JSON = Path("../fhir/data/mtb-patients.json")
-DOCUMENTS_JSON = Path("../fhir/data/patient-documents.jsonl")
-DOCS_BASE_PATH = Path("../fhir/data/docs/")
-
-
 def str_to_datetime(date_str):
     date_format = "%Y-%m-%dT%H:%M:%S.%f%z"
     return datetime.strptime(date_str, date_format)
 
 
-def main():
-    with open(PATIENTS_JSON) as fin:
-        patients = json.load(fin)
-
-    for doc in patients:
-        doc["mtb_creation"] = str_to_datetime(doc["mtb_creation"])
-
-    # Determine date of first MTB protocol for each patient
+def load_cutoffs(con: sqlite3.Connection) -> Dict[str, datetime]:
+    """Date of the first MTB protocol for each patient."""
     # We will only keep documents *before* that timestamp.
     cutoffs = {}
-    patients = sorted(patients, key=lambda doc: doc["mtb_creation"])
-    for doc in patients:
+    for doc in iter_db_patients(con):
         patient_id = doc["patient_id"]
-        if patient_id in cutoffs:
-            continue
-        cutoffs[patient_id] = doc["mtb_creation"]
-
-    docs = []
-    with open(DOCUMENTS_JSON) as fin:
-        for line in fin.readlines():
-            doc = json.loads(line)
-            doc["patient_id"] = doc.pop("subject.reference")
-            docs.append(doc)
-
-    # metadata = {file_name: metadata}
-    #
-    # Example
-    # =======
-    # metadata['2c31892d26bde905dc49de72550d02c96eaabd787f46b258c8d9f9eb209cd45f.tiff']
-    # {'id': '2c31892d26bde905dc49de72550d02c96eaabd787f46b258c8d9f9eb209cd45f',
-    #  'meta.lastUpdated': '2023-03-21T08:25:52.182+00:00',
-    #  'patient_id': 'Patient/70cd56ad887462a0bff46c879ea4dfb478b1035e07da61596ba75a526105aad3',
-    #  'presentedForm': [{'contentType': 'image/tiff',
-    #                     'creation': '2023-03-21T09:17:41.000+01:00',
-    #                     'path': '2c31892d26bde905dc49de72550d02c96eaabd787f46b258c8d9f9eb209cd45f.tiff',
-    #                     'url': 'https://ship.ume.de/app/docs/medico/101873289'}],
-    #  'resourceType': 'DiagnosticReport'}
-    metadata = {}
+        mtb_creation = str_to_datetime(doc["mtb_creation"])
+        if patient_id not in cutoffs or mtb_creation < cutoffs[patient_id]:
+            cutoffs[patient_id] = mtb_creation
+    return cutoffs
+
+
+def select_attachments(
+    docs: Iterable[dict], cutoffs: Dict[str, datetime], counts: Dict[str, int]
+) -> Iterator[Tuple[dict, dict]]:
+    """
+    Yield (form, document) of the attachment to index for each document. An
+    attachment whose content (sha256) was already selected for the patient is skipped,
+    e.g., a binary presented by several reports.
+
+    Example document
+    ================
+    {'document_id': '2c31892d26bde905dc49de72550d02c96eaabd787f46b258c8d9f9eb209cd45f',
+     'resource_type': 'DiagnosticReport',
+     'patient_id': 'Patient/70cd56ad887462a0bff46c879ea4dfb478b1035e07da61596ba75a526105aad3',
+     'last_updated': '2023-03-21T08:25:52.182+00:00',
+     'presented_form': [{'url': 'https://ship.ume.de/app/docs/medico/101873289',
+                         'content_type': 'image/tiff',
+                         'creation': '2023-03-21T09:17:41.000+01:00',
+                         'path': '2c31892d26bde905dc49de72550d02c96eaabd787f46b258c8d9f9eb209cd45f.tiff',
+                         'sha256': None}]}
+    """
+    seen = set()
     for doc in docs:
+        counts["total"] += 1
         patient_id = doc["patient_id"]
-        last_updated = str_to_datetime(doc["meta.lastUpdated"])
+        last_updated = str_to_datetime(doc["last_updated"])
         cutoff = cutoffs[patient_id]
 
         if last_updated >= cutoff:
             # skip document as it came after first MTB
             continue
 
-        doc["presentedForm"] = sorted(
-            doc["presentedForm"], key=lambda x: INDEXING_PRIORITY[x["contentType"]]
+        forms = sorted(
+            doc["presented_form"], key=lambda x: INDEXING_PRIORITY[x["content_type"]]
         )
-        if len(doc["presentedForm"]) == 0:
+        if len(forms) == 0:
             # skip document as there is no attachment
             continue
 
-        for form in doc["presentedForm"]:
-            form["path"] = Path(form["path"]).name
-
         # select the first attachment for indexing
-        form = doc["presentedForm"][0]
-        if INDEXING_PRIORITY[form["contentType"]] == 999:
+        form = forms[0]
+        if INDEXING_PRIORITY[form["content_type"]] == 999:
             # skip document as there is no compatible attachment
             continue
-        metadata[form["path"]] = doc
-
-    print(f"Total documents: {len(docs):,}")
-    print(f"Documents to index: {len(metadata):,}")
+        if form["sha256"] is not None:
+            key = (patient_id, form["sha256"])
+            if key in seen:
+                counts["duplicates"] = counts.get("duplicates", 0) + 1
+                continue
+            seen.add(key)
+        counts["selected"] += 1
+        yield form, doc
 
-    files_to_index = metadata.keys()
-    files_to_index = [DOCS_BASE_PATH / f for f in files_to_index]
 
-    reader = SimpleDirectoryReader(
-        input_files=files_to_index,
+def load_file(path: Path, patient_id: str) -> List[Document]:
+    """Extract the text of one attachment (runs in a worker process)."""
+    docs = SimpleDirectoryReader.load_file(
+        path,
+        default_file_metadata_func,
+        CUSTOM_READERS,
         filename_as_id=True,
-        file_extractor=CUSTOM_READERS,
     )
-    print("Load documents from files.")
-    docs = reader.load_data(show_progress=True, num_workers=8)
-
-    # Add metadata (presented forms, ship ID, patient_id, ...)
-    # and drop paths and redundant file names
+    # Add patient_id and drop paths and redundant file names
     for doc in docs:
         doc.doc_id = Path(doc.doc_id).name
-        file_name = Path(doc.metadata["file_path"]).name
-        doc.metadata["file_name"] = file_name
-        doc.metadata["patient_id"] = metadata[file_name]["patient_id"]
+        doc.metadata["file_name"] = Path(doc.metadata["file_path"]).name
+        doc.metadata["patient_id"] = patient_id
+        doc.excluded_embed_metadata_keys.extend(EXCLUDED_METADATA_KEYS)
+        doc.excluded_llm_metadata_keys.extend(EXCLUDED_METADATA_KEYS)
+    return docs
+
+
+def init_worker(ocr_workers: int):
+    """Configure the PDF reader of an extraction worker (see `extract_documents`)."""
+    PDF_READER.parallel_ocr = ocr_workers > 0
+    PDF_READER.ocr_workers = ocr_workers or None
+
 
-    init_settings()
-    create_index(docs)
+def extract_documents(
+    files: Iterable[Tuple[Path, str]],
+    workers: int = 8,
+    max_pending: int = 32,
+    ocr_workers: int = 0,
+) -> Iterator[List[Document]]:
+    """
+    Extract (path, patient_id) pairs in a process pool, yielding the documents of
+    each file as soon as it is done. At most `max_pending` files are in flight. With
+    `ocr_workers`, each worker OCRs the scanned pages of a PDF in its own pool of
+    `ocr_workers` processes (`workers * ocr_workers` OCR processes in total).
+    """
+    with ProcessPoolExecutor(
+        max_workers=workers, initializer=init_worker, initargs=(ocr_workers,)
+    ) as executor:
+        pending = set()
+        for path, patient_id in files:
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(executor.submit(load_file, path, patient_id))
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+
+def main(args):
+    # Load the models first so that the first extracted files go straight to the embedder
+    init_settings(embedding_cache=True)
+    index = get_index()
+    manifest = Manifest.load() or Manifest()
+
+    con = connect_catalog(args.documents_json, args.patients_json, args.catalog)
+    counts = {"total": 0, "selected": 0}
+    cutoffs = load_cutoffs(con)
+    selected = select_attachments(iter_db_documents(con), cutoffs, counts)
+    files = (
+        (form_path(form, args.docs_path, args.blobs_path), doc["patient_id"])
+        for form, doc in selected
+    )
+
+    print("Load, embed and upload documents.")
+    num_docs = 0
+    with BulkInserter(
+        index,
+        embed_batch_size=args.embed_batch_size,
+        upload_batch_size=args.upload_batch_size,
+        upload_workers=args.upload_workers,
+    ) as inserter:
+        for docs in extract_documents(
+            files, args.workers, args.max_pending, args.ocr_workers
+        ):
+            nodes = inserter.add_documents(docs)
+            manifest.record(docs, nodes)
+            num_docs += len(docs)
+    con.close()
+
+    print(f"Total documents: {counts['total']:,}")
+    print(f"Documents to index: {counts['selected']:,}")
+    print(f"Duplicate attachments skipped: {counts.get('duplicates', 0):,}")
+    print(f"Documents indexed: {num_docs:,}")
+    inserter.report()
+
+    configure_collection(index, args.profile)
+    index.storage_context.persist(persist_dir="./storage")
+    manifest.save()
+
+
+def arg_parser():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument("--patients_json", type=Path, default=PATIENTS_JSON)
+    parser.add_argument("--documents_json", type=Path, default=DOCUMENTS_JSON)
+    parser.add_argument("--catalog", type=Path, default=CATALOG_DB)
+    parser.add_argument("--docs_path", type=Path, default=DOCS_BASE_PATH)
+    parser.add_argument("--blobs_path", type=Path, default=BLOBS_PATH)
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="Number of processes extracting text (PDF parsing, OCR).",
+    )
+    parser.add_argument(
+        "--ocr_workers",
+        type=int,
+        default=0,
+        help="Processes per worker that OCR the scanned pages of a PDF in parallel "
+        "(0: OCR the pages one after the other in the worker).",
+    )
+    parser.add_argument(
+        "--max_pending",
+        type=int,
+        default=32,
+        help="Maximum number of files extracted ahead of the embedder.",
+    )
+    parser.add_argument(
+        "--profile",
+        default=DEFAULT_PROFILE,
+        choices=list(COLLECTION_PROFILES),
+        help="Collection settings (see raw.engine.COLLECTION_PROFILES).",
+    )
+    parser.add_argument(
+        "--embed_batch_size",
+        type=int,
+        default=DEFAULT_EMBED_BATCH_SIZE,
+        help="Number of chunks embedded per batch.",
+    )
+    parser.add_argument(
+        "--upload_batch_size",
+        type=int,
+        default=DEFAULT_UPLOAD_BATCH_SIZE,
+        help="Number of chunks per upsert request to Qdrant.",
+    )
+    parser.add_argument(
+        "--upload_workers",
+        type=int,
+        default=DEFAULT_UPLOAD_WORKERS,
+        help="Number of parallel upsert requests to Qdrant.",
+    )
+    return parser.parse_args()
 
 
 if __name__ == "__main__":
-    main()
+    main(arg_parser())
@@ -0,0 +1,175 @@
+"""
+File responses with conditional requests (ETag/Last-Modified -> 304) and single byte
+ranges (Range -> 206), for Starlette versions whose FileResponse supports neither.
+
+The body (or the requested range) is read in chunks of `chunk_size` in a worker thread,
+so memory per request stays bounded and the event loop is not blocked.
+"""
+
+import hashlib
+import os
+import re
+import stat
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Mapping, Optional, Tuple
+
+import anyio
+from starlette.requests import Request
+from starlette.responses import Response
+from starlette.types import Receive, Scope, Send
+
+RANGE_RE = re.compile(r"bytes=(\d*)-(\d*)")
+
+
+def make_etag(stat_result: os.stat_result) -> str:
+    digest = hashlib.md5(
+        f"{stat_result.st_mtime_ns}-{stat_result.st_size}".encode(),
+        usedforsecurity=False,
+    )
+    return f'"{digest.hexdigest()}"'
+
+
+def not_modified(request: Request, etag: str, mtime: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return etag in tags or "*" in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            return int(mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single byte range into (start, end), both inclusive. Returns None for
+    ranges we serve as a full response (multiple ranges, malformed headers) and
+    raises ValueError for unsatisfiable ranges.
+    """
+    match = RANGE_RE.fullmatch(header.strip())
+    if match is None:
+        return None
+    start, end = match.groups()
+    if not start and not end:
+        return None
+    if not start:
+        # suffix range: the last `end` bytes
+        length = int(end)
+        if length == 0:
+            raise ValueError(header)
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError(header)
+    return start, end
+
+
+class FileRangeResponse(Response):
+    chunk_size = 256 * 1024
+
+    def __init__(
+        self,
+        path,
+        stat_result: os.stat_result,
+        status_code: int = 200,
+        offset: int = 0,
+        count: Optional[int] = None,
+        headers: Optional[Mapping[str, str]] = None,
+        media_type: Optional[str] = None,
+    ):
+        self.path = path
+        self.status_code = status_code
+        self.media_type = media_type
+        self.background = None
+        self.offset = offset
+        self.count = stat_result.st_size - offset if count is None else count
+        self.init_headers(headers)
+        self.headers["content-length"] = str(self.count)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": self.status_code,
+                "headers": self.raw_headers,
+            }
+        )
+        if scope["method"].upper() == "HEAD" or self.count == 0:
+            await send({"type": "http.response.body", "body": b""})
+        else:
+            async with await anyio.open_file(self.path, mode="rb") as fin:
+                await fin.seek(self.offset)
+                remaining = self.count
+                while remaining > 0:
+                    chunk = await fin.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send(
+                        {
+                            "type": "http.response.body",
+                            "body": chunk,
+                            "more_body": remaining > 0,
+                        }
+                    )
+                if remaining > 0:
+                    # file was truncated while sending
+                    await send({"type": "http.response.body", "body": b""})
+
+
+def file_response(
+    request: Request,
+    path,
+    media_type: Optional[str] = None,
+    headers: Optional[Mapping[str, str]] = None,
+    etag: Optional[str] = None,
+) -> Response:
+    """
+    Serve `path` honoring If-None-Match/If-Modified-Since, Range and If-Range. Without
+    `etag`, the ETag is derived from the modification time and size.
+    """
+    stat_result = os.stat(path)
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise FileNotFoundError(path)
+
+    etag = etag or make_etag(stat_result)
+    headers = {
+        **(headers or {}),
+        "accept-ranges": "bytes",
+        "etag": etag,
+        "last-modified": formatdate(stat_result.st_mtime, usegmt=True),
+        # attachments are patient data: the browser may keep them, but must revalidate
+        "cache-control": "private, no-cache",
+    }
+    if not_modified(request, etag, stat_result.st_mtime):
+        return Response(status_code=304, headers=headers)
+
+    size = stat_result.st_size
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header is not None and (if_range is None or if_range == etag):
+        try:
+            byte_range = parse_range(range_header, size)
+        except ValueError:
+            return Response(
+                status_code=416, headers={**headers, "content-range": f"bytes */{size}"}
+            )
+        if byte_range is not None:
+            start, end = byte_range
+            headers["content-range"] = f"bytes {start}-{end}/{size}"
+            return FileRangeResponse(
+                path,
+                stat_result,
+                status_code=206,
+                offset=start,
+                count=end - start + 1,
+                headers=headers,
+                media_type=media_type,
+            )
+
+    return FileRangeResponse(path, stat_result, headers=headers, media_type=media_type)
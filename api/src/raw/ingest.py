@@ -0,0 +1,195 @@
+"""
+Bulk ingestion into the vector store index. Documents pass three stages:
+
+1. chunking with the configured transformations (`Settings.transformations`)
+2. embedding in large batches (`embed_batch_size` chunks per forward pass)
+3. upserts to the vector store by a pool of upload threads
+
+Embedded batches are handed to the upload threads through a bounded queue, so the
+embedder keeps working while uploads are in flight and memory stays bounded when
+uploads fall behind.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import List, Optional, Sequence
+
+from llama_index.core import Settings, VectorStoreIndex
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.schema import BaseNode, Document, MetadataMode
+
+DEFAULT_EMBED_BATCH_SIZE = 256
+DEFAULT_UPLOAD_BATCH_SIZE = 128
+DEFAULT_UPLOAD_WORKERS = 4
+DEFAULT_QUEUE_SIZE = 8
+
+
+@dataclass
+class StageStats:
+    name: str
+    chunks: int = 0
+    seconds: float = 0.0
+
+    @property
+    def chunks_per_sec(self) -> float:
+        return self.chunks / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self) -> str:
+        return f"{self.name}: {self.chunks:,} chunks in {self.seconds:.1f}s ({self.chunks_per_sec:,.1f} chunks/s)"
+
+
+def embed_nodes(nodes: Sequence[BaseNode], embed_model: BaseEmbedding) -> None:
+    texts = [node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes]
+    embeddings = embed_model.get_text_embedding_batch(texts)
+    for node, embedding in zip(nodes, embeddings):
+        node.embedding = embedding
+
+
+class BulkInserter:
+    """
+    Inserts documents into a `VectorStoreIndex` whose vector store keeps the text
+    (e.g., Qdrant). Documents can be added incrementally; call `close()` (or use the
+    inserter as a context manager) to flush pending chunks and wait for all uploads.
+
+    Only document hashes are written to the docstore, exactly like
+    `VectorStoreIndex.insert`, so that `refresh_ref_docs` keeps working.
+
+    Parallel uploads need a Qdrant server; the local (in-memory/on-disk) mode of
+    qdrant-client is not thread-safe and must be used with `upload_workers=1`.
+    """
+
+    def __init__(
+        self,
+        index: VectorStoreIndex,
+        embed_model: Optional[BaseEmbedding] = None,
+        embed_batch_size: int = DEFAULT_EMBED_BATCH_SIZE,
+        upload_batch_size: int = DEFAULT_UPLOAD_BATCH_SIZE,
+        upload_workers: int = DEFAULT_UPLOAD_WORKERS,
+        queue_size: int = DEFAULT_QUEUE_SIZE,
+    ):
+        self.index = index
+        self.embed_model = embed_model or Settings.embed_model
+        self.embed_batch_size = embed_batch_size
+        self.upload_batch_size = upload_batch_size
+        self.upload_workers = upload_workers
+
+        self.stats = {
+            "chunk": StageStats("chunk"),
+            "embed": StageStats("embed"),
+            "upload": StageStats("upload"),
+        }
+        self._pending: List[BaseNode] = []
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._executor = None
+        self._workers = []
+        self._stats_lock = threading.Lock()
+        self._upload_start = None
+        self._collection_ready = False
+        self._error = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _start_workers(self):
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.upload_workers, thread_name_prefix="upload"
+        )
+        self._workers = [
+            self._executor.submit(self._upload_worker)
+            for _ in range(self.upload_workers)
+        ]
+
+    def _upload(self, nodes: List[BaseNode]):
+        self.index.vector_store.add(nodes)
+        with self._stats_lock:
+            self.stats["upload"].chunks += len(nodes)
+
+    def _upload_worker(self):
+        while True:
+            nodes = self._queue.get()
+            if nodes is None:
+                return
+            if self._error is not None:
+                # keep draining so that the embedder never blocks on a full queue
+                continue
+            try:
+                self._upload(nodes)
+            except Exception as e:  # pylint: disable=W0718
+                self._error = e
+
+    def _check_error(self):
+        if self._error is not None:
+            raise self._error
+
+    def add_documents(self, documents: Sequence[Document]) -> List[BaseNode]:
+        start = time.perf_counter()
+        nodes = run_transformations(list(documents), Settings.transformations)
+        self.stats["chunk"].seconds += time.perf_counter() - start
+        self.stats["chunk"].chunks += len(nodes)
+
+        for doc in documents:
+            self.index.docstore.set_document_hash(doc.get_doc_id(), doc.hash)
+        self.add_nodes(nodes)
+        return nodes
+
+    def add_nodes(self, nodes: Sequence[BaseNode]):
+        self._pending.extend(nodes)
+        while len(self._pending) >= self.embed_batch_size:
+            batch = self._pending[: self.embed_batch_size]
+            self._pending = self._pending[self.embed_batch_size :]
+            self._embed_and_enqueue(batch)
+
+    def _embed_and_enqueue(self, nodes: List[BaseNode]):
+        start = time.perf_counter()
+        embed_nodes(nodes, self.embed_model)
+        self.stats["embed"].seconds += time.perf_counter() - start
+        self.stats["embed"].chunks += len(nodes)
+
+        if not self._collection_ready:
+            # The first upload creates the collection, which must not happen in parallel
+            self._upload_start = time.perf_counter()
+            self._upload(nodes)
+            self._collection_ready = True
+            self._start_workers()
+            return
+
+        for i in range(0, len(nodes), self.upload_batch_size):
+            self._check_error()
+            self._queue.put(nodes[i : i + self.upload_batch_size])
+
+    def close(self):
+        if self._pending:
+            batch, self._pending = self._pending, []
+            self._embed_and_enqueue(batch)
+
+        if self._executor is not None:
+            for _ in self._workers:
+                self._queue.put(None)
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._upload_start is not None:
+            self.stats["upload"].seconds = time.perf_counter() - self._upload_start
+        self._check_error()
+
+        self.index.storage_context.index_store.add_index_struct(self.index.index_struct)
+
+    def report(self):
+        for stage in self.stats.values():
+            print(stage)
+
+
+def bulk_insert(
+    index: VectorStoreIndex, documents: Sequence[Document], **kwargs
+) -> List[BaseNode]:
+    """Insert documents and return the inserted nodes."""
+    with BulkInserter(index, **kwargs) as inserter:
+        nodes = inserter.add_documents(documents)
+    inserter.report()
+    return nodes
@@ -1,35 +1,109 @@
+import multiprocessing
+import multiprocessing.util
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterator, List, Optional
 
 import fitz
 import pytesseract
 from fsspec import AbstractFileSystem
+from fsspec.implementations.local import LocalFileSystem
 from llama_index.core.readers.base import BaseReader
 from llama_index.core.readers.file.base import get_default_fs
 from llama_index.core.schema import Document
-from PIL import Image
+from PIL import Image, ImageSequence
 
 
 class TesseractReader(BaseReader):
-    """Docx parser."""
+    """
+    Image parser (OCR with tesseract). Multi-page images (e.g., TIFF) yield one
+    document per frame; frames are decoded one at a time.
+    """
+
+    def __init__(self, language: str = "deu") -> None:
+        self.language = language
 
     # pylint: disable=W0221
-    def load_data(
+    def lazy_load_data(
         self,
         file: Path,
         extra_info: Optional[Dict] = None,
         fs: Optional[AbstractFileSystem] = None,
-    ) -> List[Document]:
+    ) -> Iterator[Document]:
         fs = fs or get_default_fs()
-        with fs.open(file, "rb") as fin:
-            img = Image.open(fin)
-            text = pytesseract.image_to_string(img, lang="deu")
-
         metadata = {"file_name": file.name}
         if extra_info is not None:
             metadata.update(extra_info)
 
-        return [Document(text=text, metadata=metadata or {})]
+        with fs.open(file, "rb") as fin:
+            img = Image.open(fin)
+            n_frames = getattr(img, "n_frames", 1)
+            for frame_number, frame in enumerate(ImageSequence.Iterator(img)):
+                text = pytesseract.image_to_string(frame, lang=self.language)
+                if n_frames == 1:
+                    yield Document(text=text, metadata=metadata)
+                else:
+                    yield Document(
+                        text=text,
+                        metadata={"page_label": str(frame_number), **metadata},
+                    )
+
+    # pylint: disable=W0221
+    def load_data(
+        self,
+        file: Path,
+        extra_info: Optional[Dict] = None,
+        fs: Optional[AbstractFileSystem] = None,
+    ) -> List[Document]:
+        return list(self.lazy_load_data(file, extra_info=extra_info, fs=fs))
+
+
+_OCR_POOL = None
+
+
+def _shutdown_ocr_pool(pool: ProcessPoolExecutor, pid: int):
+    # The OCR processes inherit the finalizer (fork), only the owner shuts down
+    if os.getpid() == pid:
+        pool.shutdown()
+
+
+def get_ocr_pool(max_workers: Optional[int] = None) -> ProcessPoolExecutor:
+    """
+    Process pool shared by all readers (one per process, sized to the machine by
+    default). The pool is created on the first call; asking for another size later
+    raises a ValueError.
+    """
+    global _OCR_POOL  # pylint: disable=W0603
+    max_workers = max_workers or os.cpu_count()
+    if _OCR_POOL is None:
+        _OCR_POOL = ProcessPoolExecutor(max_workers=max_workers)
+        # Worker processes skip atexit and would wait for the pool's processes forever.
+        # Shut down before multiprocessing closes the pool's queues (exitpriority 10).
+        multiprocessing.util.Finalize(
+            None,
+            _shutdown_ocr_pool,
+            args=(_OCR_POOL, os.getpid()),
+            exitpriority=100,
+        )
+    # pylint: disable=W0212
+    elif _OCR_POOL._max_workers != max_workers:
+        raise ValueError(
+            f"The OCR pool has {_OCR_POOL._max_workers} workers, not {max_workers}"
+        )
+    return _OCR_POOL
+
+
+def page_to_image(page) -> Image.Image:
+    pix = page.get_pixmap()
+    return Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+
+
+def ocr_page(path: str, page_number: int, language: str) -> str:
+    """Render and OCR one page of a PDF (runs in the OCR pool)."""
+    with fitz.open(path) as pdf:
+        img = page_to_image(pdf[page_number])
+    return pytesseract.image_to_string(img, lang=language)
 
 
 class PDFReaderPlus(BaseReader):
@@ -40,53 +114,94 @@ class PDFReaderPlus(BaseReader):
     - PDFReader: llama_index.readers.file.docs.base.PDFReader https://github.com/run-llama/llama_index/blob/main/llama-index-integrations/readers/llama-index-readers-file/llama_index/readers/file/docs/base.py#L21
     - fitz: https://pymupdf.readthedocs.io/en/latest/installation.html
     - PyTesseract: https://pypi.org/project/pytesseract/
+
+
+    With `parallel_ocr`, every page is a separate task: pages with a text layer are
+    extracted inline, image-only pages are rendered and OCR'd in a process pool of
+    `ocr_workers` processes that is shared across files (see `get_ocr_pool`). Pages are
+    returned in page order. Parallel OCR is only used for files on the local file
+    system. In a child process (e.g., the extraction workers of `raw.fhir_import`),
+    each of which would start its own pool, `ocr_workers` must be given explicitly;
+    otherwise, and in daemonic processes that cannot have children (the workers of
+    `SimpleDirectoryReader.load_data(num_workers=...)`), pages are OCR'd sequentially.
     """
 
     def __init__(
-        self, return_full_document: Optional[bool] = False, language: str = "eng"
+        self,
+        return_full_document: Optional[bool] = False,
+        language: str = "eng",
+        parallel_ocr: bool = False,
+        ocr_workers: Optional[int] = None,
     ) -> None:
         self.return_full_document = return_full_document
         self.language = language
+        self.parallel_ocr = parallel_ocr
+        self.ocr_workers = ocr_workers
 
     def text_or_ocr(self, page):
         text = page.get_text()
         if len(text) == 0:
-            pix = page.get_pixmap()
-            img = Image.frombytes("RGB", [pix.width, pix.height], pix.samples)
+            img = page_to_image(page)
             text = pytesseract.image_to_string(img, lang=self.language)
         return text
 
+    def use_ocr_pool(self) -> bool:
+        if not self.parallel_ocr or multiprocessing.current_process().daemon:
+            return False
+        # A pool sized to the machine in every worker would oversubscribe the CPUs
+        return self.ocr_workers is not None or multiprocessing.parent_process() is None
+
+    def iter_page_texts(self, pdf, path: Optional[str] = None) -> Iterator[str]:
+        """Page texts in page order. At most one page image is held in memory."""
+        if path is None or not self.use_ocr_pool():
+            for page in pdf:
+                yield self.text_or_ocr(page)
+            return
+
+        # Submit all image-only pages first so that the pool works ahead of the consumer
+        pool = get_ocr_pool(self.ocr_workers)
+        texts = []
+        for page_number, page in enumerate(pdf):
+            text = page.get_text()
+            if len(text) == 0:
+                text = pool.submit(ocr_page, path, page_number, self.language)
+            texts.append(text)
+        for text in texts:
+            yield text.result() if isinstance(text, Future) else text
+
     # pylint: disable=W0221
-    def load_data(
+    def lazy_load_data(
         self,
         file: Path,
         extra_info: Optional[Dict] = None,
         fs: Optional[AbstractFileSystem] = None,
-    ) -> List[Document]:
-
+    ) -> Iterator[Document]:
         fs = fs or get_default_fs()
+        path = str(file) if isinstance(fs, LocalFileSystem) else None
 
         with fs.open(file, "rb") as fp:
-            pdf = fitz.open(fp)
-            num_pages = len(pdf)
-
-            docs = []
-            if self.return_full_document:
-                text = ""
-                metadata = {"file_name": fp.name}
-                for page in range(num_pages):
-                    text += self.text_or_ocr(pdf[page])
-                docs.append(Document(text=text, metadata=metadata))
-
-            else:
-                for page in range(num_pages):
-                    text = self.text_or_ocr(pdf[page])
+            with fitz.open(fp) as pdf:
+                texts = self.iter_page_texts(pdf, path)
+
+                if self.return_full_document:
+                    metadata = {"file_name": fp.name}
+                    yield Document(text="".join(texts), metadata=metadata)
+                    return
+
+                for page, text in enumerate(texts):
                     page_label = str(page)
 
                     metadata = {"page_label": page_label, "file_name": fp.name}
                     if extra_info is not None:
                         metadata.update(extra_info)
 
-                    docs.append(Document(text=text, metadata=metadata))
+                    yield Document(text=text, metadata=metadata)
 
-            return docs
+    # pylint: disable=W0221
+    def load_data(
+        self,
+        file: Path,
+        extra_info: Optional[Dict] = None,
+        fs: Optional[AbstractFileSystem] = None,
+    ) -> List[Document]:
+        return list(self.lazy_load_data(file, extra_info=extra_info, fs=fs))
@@ -1,10 +1,15 @@
 import logging
-import uvicorn
+import os
+from contextlib import asynccontextmanager
 
+import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from raw.engine import init_settings
+from raw.budget import token_budget_from_env
+from raw.cache import response_cache_from_env
+from raw.catalog import CatalogWatcher
+from raw.engine import IndexManager, check_payload_indexes, get_llm, init_settings
 from raw.routes import chat, fhir
 
 logger = logging.getLogger("uvicorn")
@@ -12,14 +17,40 @@ logger.setLevel(logging.INFO)
 
 
 if __name__ == "__main__":
-    import os
     os.environ["QDRANT_LOCATION"] = 'http://localhost:6333/'
     os.environ["QDRANT_COLLECTION"] = 'mtb_protocols'
     os.environ["OLLAMA_BASE_URL"] = 'https://mirage.kite.ume.de/ollama'
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One set of Qdrant clients and one loaded index per process
+    app.state.index_manager = IndexManager()
+    app.state.index_manager.reload()
+    # Filtered searches without a payload index check every point
+    manager = app.state.index_manager
+    indexes = check_payload_indexes(
+        manager.client, manager.vector_store.collection_name
+    )
+    for key, status in indexes.items():
+        logger.info("Payload index %s: %s", key, status)
+    app.state.response_cache = response_cache_from_env()
+    app.state.token_budget = token_budget_from_env()
+    # Load the FHIR catalog and follow appends to the dumps
+    catalog_watcher = CatalogWatcher(
+        app.state, interval=float(os.environ.get("CATALOG_WATCH_INTERVAL", 2))
+    )
+    catalog_watcher.load()
+    catalog_watcher.start()
+    yield
+    await catalog_watcher.stop()
+    await app.state.index_manager.aclose()
+    # Close the pooled connections to the Ollama server
+    await get_llm().aclose()
+
+
 init_settings()
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 app.include_router(chat.router)
 app.include_router(fhir.router)
 
@@ -0,0 +1,139 @@
+"""
+Manifest of indexed files: path -> (size, mtime, content hash, document ids, node ids).
+
+The manifest lets `update_index` find new, changed and removed files with one `stat`
+per file. File contents are only hashed when size or mtime changed, and only new or
+changed files are read, parsed and embedded. Vectors of changed and removed files are
+deleted from the vector store by node id.
+"""
+
+import hashlib
+import json
+import os
+from collections import defaultdict
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from llama_index.core.schema import BaseNode, Document
+
+DEFAULT_MANIFEST_PATH = Path("./storage/manifest.json")
+
+
+def file_hash(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as fin:
+        for block in iter(lambda: fin.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def manifest_key(path) -> str:
+    # Absolute paths: documents record their absolute file_path, --data_path may be
+    # relative
+    return str(Path(path).resolve())
+
+
+def list_files(data_path) -> Dict[str, os.stat_result]:
+    # Same selection as SimpleDirectoryReader(data_path): not recursive, no hidden files
+    files = {}
+    with os.scandir(data_path) as entries:
+        for entry in entries:
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+            files[manifest_key(Path(data_path) / entry.name)] = entry.stat()
+    return files
+
+
+@dataclass
+class FileEntry:
+    size: int
+    mtime_ns: int
+    sha256: str
+    doc_ids: List[str] = field(default_factory=list)
+    node_ids: List[str] = field(default_factory=list)
+
+
+@dataclass
+class ManifestDiff:
+    new: List[str] = field(default_factory=list)
+    changed: List[str] = field(default_factory=list)
+    removed: List[str] = field(default_factory=list)
+    unchanged: int = 0
+
+    def __str__(self) -> str:
+        return f"new: {len(self.new):,}, changed: {len(self.changed):,}, removed: {len(self.removed):,}, unchanged: {self.unchanged:,}"
+
+
+class Manifest:
+    def __init__(self, path=DEFAULT_MANIFEST_PATH, files=None):
+        self.path = Path(path)
+        self.files: Dict[str, FileEntry] = files or {}
+
+    @classmethod
+    def load(cls, path=DEFAULT_MANIFEST_PATH) -> Optional["Manifest"]:
+        path = Path(path)
+        if not path.exists():
+            return None
+        with open(path) as fin:
+            files = json.load(fin)
+        return cls(path, {k: FileEntry(**v) for k, v in files.items()})
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as fout:
+            json.dump({k: asdict(v) for k, v in self.files.items()}, fout)
+        os.replace(tmp_path, self.path)
+
+    def diff(self, data_path) -> ManifestDiff:
+        """
+        Compare the manifest with the files in `data_path`. Files whose content is
+        unchanged but whose mtime changed (e.g., after a copy) get their stat updated.
+        """
+        diff = ManifestDiff()
+        files = list_files(data_path)
+        prefix = manifest_key(data_path)
+        for path, stat in files.items():
+            entry = self.files.get(path)
+            if entry is None:
+                diff.new.append(path)
+            elif entry.size == stat.st_size and entry.mtime_ns == stat.st_mtime_ns:
+                diff.unchanged += 1
+            elif entry.sha256 == file_hash(path):
+                entry.size, entry.mtime_ns = stat.st_size, stat.st_mtime_ns
+                diff.unchanged += 1
+            else:
+                diff.changed.append(path)
+
+        for path in self.files:
+            if path not in files and str(Path(manifest_key(path)).parent) == prefix:
+                diff.removed.append(path)
+        return diff
+
+    def record(self, documents: Sequence[Document], nodes: Sequence[BaseNode]):
+        """Add (or replace) the entries of the files the documents were loaded from."""
+        doc_ids = defaultdict(list)
+        path_by_doc = {}
+        for doc in documents:
+            path = manifest_key(doc.metadata["file_path"])
+            doc_ids[path].append(doc.get_doc_id())
+            path_by_doc[doc.get_doc_id()] = path
+
+        node_ids = defaultdict(list)
+        for node in nodes:
+            node_ids[path_by_doc[node.ref_doc_id]].append(node.node_id)
+
+        for path, ids in doc_ids.items():
+            stat = os.stat(path)
+            self.files[path] = FileEntry(
+                size=stat.st_size,
+                mtime_ns=stat.st_mtime_ns,
+                sha256=file_hash(path),
+                doc_ids=ids,
+                node_ids=node_ids[path],
+            )
+
+    def remove(self, path: str) -> FileEntry:
+        # keys of manifests written before keys were made absolute may be relative
+        return self.files.pop(path if path in self.files else manifest_key(path))
@@ -0,0 +1,99 @@
+"""
+Node parser that splits MTB protocols along their structure (see
+raw.preprocessing.mtb_parser): one node per field of a section (or per section
+without fields), with the section and field names in the metadata. Marker tables are
+rendered one row per line. Fields longer than `chunk_size` and documents that are not
+(parseable) protocols are split with the sentence splitter, as before.
+
+Retrieved nodes then hold a single topic (e.g., the diagnosis) instead of a 512-token
+window that straddles several sections, so the LLM context is shorter.
+"""
+
+from typing import Any, Dict, List, Sequence
+
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.node_parser import NodeParser, SentenceSplitter
+from llama_index.core.node_parser.node_utils import build_nodes_from_splits
+from llama_index.core.schema import BaseNode, MetadataMode, TextNode
+from llama_index.core.utils import get_tqdm_iterable
+
+from raw.preprocessing.mtb_parser import parse
+
+# Documents with fewer known sections (besides the header) are not protocols
+MIN_SECTIONS = 2
+
+
+def render_markers(rows: List[Dict[str, str]]) -> str:
+    return "\n".join(
+        "; ".join(f"{column}: {value}" for column, value in row.items() if value)
+        for row in rows
+    )
+
+
+class MTBNodeParser(NodeParser):
+    chunk_size: int = Field(default=512, description="Maximum tokens per node.")
+    chunk_overlap: int = Field(
+        default=32, description="Token overlap of nodes split from one field."
+    )
+
+    _splitter: SentenceSplitter = PrivateAttr()
+
+    def __init__(self, chunk_size: int = 512, chunk_overlap: int = 32, **kwargs: Any):
+        super().__init__(chunk_size=chunk_size, chunk_overlap=chunk_overlap, **kwargs)
+        self._splitter = SentenceSplitter(
+            chunk_size=chunk_size, chunk_overlap=chunk_overlap
+        )
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MTBNodeParser"
+
+    def _parse_nodes(
+        self, nodes: Sequence[BaseNode], show_progress: bool = False, **kwargs: Any
+    ) -> List[BaseNode]:
+        all_nodes = []
+        for node in get_tqdm_iterable(nodes, show_progress, "Parsing nodes"):
+            all_nodes.extend(self.split_node(node))
+        return all_nodes
+
+    def _split_text(self, text: str, node: BaseNode, metadata: Dict[str, Any]):
+        """Split like the sentence splitter: chunk and metadata fit `chunk_size`."""
+        metadata_node = TextNode(
+            metadata={**node.metadata, **metadata},
+            excluded_embed_metadata_keys=node.excluded_embed_metadata_keys,
+            excluded_llm_metadata_keys=node.excluded_llm_metadata_keys,
+        )
+        metadata_str = max(
+            metadata_node.get_metadata_str(MetadataMode.EMBED),
+            metadata_node.get_metadata_str(MetadataMode.LLM),
+            key=len,
+        )
+        return self._splitter.split_text_metadata_aware(text, metadata_str)
+
+    def split_node(self, node: BaseNode) -> List[TextNode]:
+        text = node.get_content(metadata_mode=MetadataMode.NONE)
+        sections = parse(text)
+        if len(sections) <= MIN_SECTIONS:
+            return build_nodes_from_splits(
+                self._split_text(text, node, {}), node, id_func=self.id_func
+            )
+
+        nodes = []
+        for section in sections:
+            for field, value in section.items():
+                if field == "_name":
+                    continue
+                content = render_markers(value) if field == "marker" else value
+                if not content.strip():
+                    continue
+                metadata = {"section": section["_name"]}
+                if field != "_text":
+                    metadata["field"] = field
+                for split_node in build_nodes_from_splits(
+                    self._split_text(content, node, metadata),
+                    node,
+                    id_func=self.id_func,
+                ):
+                    split_node.metadata = {**split_node.metadata, **metadata}
+                    nodes.append(split_node)
+        return nodes
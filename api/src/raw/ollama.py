@@ -3,25 +3,30 @@ Patched version of Ollama to allow unsigned https traffic (https://github.com/ru
 """
 
 import json
-from typing import Any, Dict, Sequence, Tuple
+from typing import Any, Dict, Iterator, Optional, Sequence, Tuple
 
 import httpx
 from httpx import Timeout
 from llama_index.core.base.llms.types import (
     ChatMessage,
     ChatResponse,
+    ChatResponseAsyncGen,
     ChatResponseGen,
     CompletionResponse,
+    CompletionResponseAsyncGen,
     CompletionResponseGen,
     LLMMetadata,
     MessageRole,
 )
-from llama_index.core.bridge.pydantic import Field
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
 from llama_index.core.constants import DEFAULT_CONTEXT_WINDOW, DEFAULT_NUM_OUTPUTS
 from llama_index.core.llms.callbacks import llm_chat_callback, llm_completion_callback
 from llama_index.core.llms.custom import CustomLLM
 
 DEFAULT_REQUEST_TIMEOUT = 30.0
+DEFAULT_MAX_CONNECTIONS = 32
+DEFAULT_MAX_KEEPALIVE_CONNECTIONS = 16
+DEFAULT_KEEPALIVE_EXPIRY = 120.0
 
 
 def get_addtional_kwargs(
@@ -30,6 +35,31 @@ def get_addtional_kwargs(
     return {k: v for k, v in response.items() if k not in exclude}
 
 
+def http2_available() -> bool:
+    try:
+        import h2  # pylint: disable=C0415,W0611
+    except ImportError:
+        return False
+    return True
+
+
+def to_chat_response(raw: Dict[str, Any], text: Optional[str] = None) -> ChatResponse:
+    message = raw["message"]
+    delta = None
+    if text is not None:
+        delta = message.get("content")
+    return ChatResponse(
+        message=ChatMessage(
+            content=message.get("content") if text is None else text,
+            role=MessageRole(message.get("role")),
+            additional_kwargs=get_addtional_kwargs(message, ("content", "role")),
+        ),
+        delta=delta,
+        raw=raw,
+        additional_kwargs=get_addtional_kwargs(raw, ("message",)),
+    )
+
+
 class Ollama(CustomLLM):
     base_url: str = Field(
         default="http://localhost:11434",
@@ -58,6 +88,27 @@ class Ollama(CustomLLM):
         default_factory=dict,
         description="Additional model parameters for the Ollama API.",
     )
+    max_connections: int = Field(
+        default=DEFAULT_MAX_CONNECTIONS,
+        description="Maximum number of concurrent connections to the Ollama API server.",
+        gt=0,
+    )
+    max_keepalive_connections: int = Field(
+        default=DEFAULT_MAX_KEEPALIVE_CONNECTIONS,
+        description="Maximum number of idle connections kept open for reuse.",
+        ge=0,
+    )
+    keepalive_expiry: float = Field(
+        default=DEFAULT_KEEPALIVE_EXPIRY,
+        description="Seconds after which an idle connection is closed.",
+    )
+    http2: bool = Field(
+        default=True,
+        description="Use HTTP/2 if the server supports it (requires the h2 package).",
+    )
+
+    _client: Optional[httpx.Client] = PrivateAttr(default=None)
+    _async_client: Optional[httpx.AsyncClient] = PrivateAttr(default=None)
 
     @classmethod
     def class_name(cls) -> str:
@@ -84,9 +135,52 @@ class Ollama(CustomLLM):
             **self.additional_kwargs,
         }
 
-    @llm_chat_callback()
-    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
-        payload = {
+    @property
+    def _client_kwargs(self) -> Dict[str, Any]:
+        return {
+            "timeout": Timeout(self.request_timeout),
+            "limits": httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive_connections,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            "http2": self.http2 and http2_available(),
+            "verify": False,
+        }
+
+    @property
+    def client(self) -> httpx.Client:
+        """Pooled client shared by all synchronous calls."""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.Client(**self._client_kwargs)
+        return self._client
+
+    @property
+    def async_client(self) -> httpx.AsyncClient:
+        """Pooled client shared by all asynchronous calls.
+
+        The connections are bound to the event loop of the first call, so the
+        client must only be used from that loop (e.g., the loop of the API server).
+        """
+        if self._async_client is None or self._async_client.is_closed:
+            self._async_client = httpx.AsyncClient(**self._client_kwargs)
+        return self._async_client
+
+    def close(self) -> None:
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+
+    async def aclose(self) -> None:
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+        self.close()
+
+    def _chat_payload(
+        self, messages: Sequence[ChatMessage], stream: bool, **kwargs: Any
+    ) -> Dict[str, Any]:
+        return {
             "model": self.model,
             "messages": [
                 {
@@ -97,142 +191,174 @@ class Ollama(CustomLLM):
                 for message in messages
             ],
             "options": self._model_kwargs,
-            "stream": False,
+            "stream": stream,
             **kwargs,
         }
 
-        with httpx.Client(
-            timeout=Timeout(self.request_timeout), verify=False
-        ) as client:
-            response = client.post(
-                url=f"{self.base_url}/api/chat",
-                json=payload,
-            )
-            response.raise_for_status()
-            raw = response.json()
-            message = raw["message"]
-            return ChatResponse(
-                message=ChatMessage(
-                    content=message.get("content"),
-                    role=MessageRole(message.get("role")),
-                    additional_kwargs=get_addtional_kwargs(
-                        message, ("content", "role")
-                    ),
-                ),
-                raw=raw,
-                additional_kwargs=get_addtional_kwargs(raw, ("message",)),
-            )
+    def _completion_payload(
+        self, prompt: str, stream: bool, **kwargs: Any
+    ) -> Dict[str, Any]:
+        return {
+            self.prompt_key: prompt,
+            "model": self.model,
+            "options": self._model_kwargs,
+            "stream": stream,
+            **kwargs,
+        }
+
+    @staticmethod
+    def _completion_response(raw: Dict[str, Any]) -> CompletionResponse:
+        return CompletionResponse(
+            text=raw.get("response"),
+            raw=raw,
+            additional_kwargs=get_addtional_kwargs(raw, ("response",)),
+        )
+
+    # The streaming endpoints send one JSON object per line (NDJSON). The chunk
+    # parsers are shared by the sync and async streams; `text` is the text so far.
+
+    @staticmethod
+    def _chat_chunk(line: str, text: str) -> Optional[ChatResponse]:
+        """Response of one line of /api/chat, None once the answer is done."""
+        chunk = json.loads(line)
+        if "done" in chunk and chunk["done"]:
+            return None
+        return to_chat_response(chunk, text=text + chunk["message"].get("content"))
+
+    @staticmethod
+    def _completion_chunk(line: str, text: str) -> CompletionResponse:
+        """Response of one line of /api/generate."""
+        chunk = json.loads(line)
+        delta = chunk.get("response")
+        return CompletionResponse(
+            delta=delta,
+            text=text + delta,
+            raw=chunk,
+            additional_kwargs=get_addtional_kwargs(chunk, ("response",)),
+        )
+
+    def _chat_stream(self, lines: Iterator[str]) -> ChatResponseGen:
+        text = ""
+        for line in lines:
+            if line:
+                response = self._chat_chunk(line, text)
+                if response is None:
+                    break
+                text = response.message.content
+                yield response
+
+    def _completion_stream(self, lines: Iterator[str]) -> CompletionResponseGen:
+        text = ""
+        for line in lines:
+            if line:
+                response = self._completion_chunk(line, text)
+                text = response.text
+                yield response
+
+    @llm_chat_callback()
+    def chat(self, messages: Sequence[ChatMessage], **kwargs: Any) -> ChatResponse:
+        response = self.client.post(
+            url=f"{self.base_url}/api/chat",
+            json=self._chat_payload(messages, stream=False, **kwargs),
+        )
+        response.raise_for_status()
+        return to_chat_response(response.json())
 
     @llm_chat_callback()
     def stream_chat(
         self, messages: Sequence[ChatMessage], **kwargs: Any
     ) -> ChatResponseGen:
-        payload = {
-            "model": self.model,
-            "messages": [
-                {
-                    "role": message.role.value,
-                    "content": message.content,
-                    **message.additional_kwargs,
-                }
-                for message in messages
-            ],
-            "options": self._model_kwargs,
-            "stream": True,
-            **kwargs,
-        }
+        with self.client.stream(
+            method="POST",
+            url=f"{self.base_url}/api/chat",
+            json=self._chat_payload(messages, stream=True, **kwargs),
+        ) as response:
+            response.raise_for_status()
+            yield from self._chat_stream(response.iter_lines())
+
+    @llm_completion_callback()
+    def complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponse:
+        response = self.client.post(
+            url=f"{self.base_url}/api/generate",
+            json=self._completion_payload(prompt, stream=False, **kwargs),
+        )
+        response.raise_for_status()
+        return self._completion_response(response.json())
+
+    @llm_completion_callback()
+    def stream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseGen:
+        with self.client.stream(
+            method="POST",
+            url=f"{self.base_url}/api/generate",
+            json=self._completion_payload(prompt, stream=True, **kwargs),
+        ) as response:
+            response.raise_for_status()
+            yield from self._completion_stream(response.iter_lines())
+
+    @llm_chat_callback()
+    async def achat(
+        self, messages: Sequence[ChatMessage], **kwargs: Any
+    ) -> ChatResponse:
+        response = await self.async_client.post(
+            url=f"{self.base_url}/api/chat",
+            json=self._chat_payload(messages, stream=False, **kwargs),
+        )
+        response.raise_for_status()
+        return to_chat_response(response.json())
 
-        with httpx.Client(
-            timeout=Timeout(self.request_timeout), verify=False
-        ) as client:
-            with client.stream(
+    @llm_chat_callback()
+    async def astream_chat(
+        self, messages: Sequence[ChatMessage], **kwargs: Any
+    ) -> ChatResponseAsyncGen:
+        async def gen() -> ChatResponseAsyncGen:
+            async with self.async_client.stream(
                 method="POST",
                 url=f"{self.base_url}/api/chat",
-                json=payload,
+                json=self._chat_payload(messages, stream=True, **kwargs),
             ) as response:
                 response.raise_for_status()
                 text = ""
-                for line in response.iter_lines():
+                async for line in response.aiter_lines():
                     if line:
-                        chunk = json.loads(line)
-                        if "done" in chunk and chunk["done"]:
+                        chat_response = self._chat_chunk(line, text)
+                        if chat_response is None:
                             break
-                        message = chunk["message"]
-                        delta = message.get("content")
-                        text += delta
-                        yield ChatResponse(
-                            message=ChatMessage(
-                                content=text,
-                                role=MessageRole(message.get("role")),
-                                additional_kwargs=get_addtional_kwargs(
-                                    message, ("content", "role")
-                                ),
-                            ),
-                            delta=delta,
-                            raw=chunk,
-                            additional_kwargs=get_addtional_kwargs(chunk, ("message",)),
-                        )
+                        text = chat_response.message.content
+                        yield chat_response
+
+        return gen()
 
     @llm_completion_callback()
-    def complete(
+    async def acomplete(
         self, prompt: str, formatted: bool = False, **kwargs: Any
     ) -> CompletionResponse:
-        payload = {
-            self.prompt_key: prompt,
-            "model": self.model,
-            "options": self._model_kwargs,
-            "stream": False,
-            **kwargs,
-        }
-
-        with httpx.Client(
-            timeout=Timeout(self.request_timeout), verify=False
-        ) as client:
-            response = client.post(
-                url=f"{self.base_url}/api/generate",
-                json=payload,
-            )
-            response.raise_for_status()
-            raw = response.json()
-            text = raw.get("response")
-            return CompletionResponse(
-                text=text,
-                raw=raw,
-                additional_kwargs=get_addtional_kwargs(raw, ("response",)),
-            )
+        response = await self.async_client.post(
+            url=f"{self.base_url}/api/generate",
+            json=self._completion_payload(prompt, stream=False, **kwargs),
+        )
+        response.raise_for_status()
+        return self._completion_response(response.json())
 
     @llm_completion_callback()
-    def stream_complete(
+    async def astream_complete(
         self, prompt: str, formatted: bool = False, **kwargs: Any
-    ) -> CompletionResponseGen:
-        payload = {
-            self.prompt_key: prompt,
-            "model": self.model,
-            "options": self._model_kwargs,
-            "stream": True,
-            **kwargs,
-        }
-
-        with httpx.Client(
-            timeout=Timeout(self.request_timeout), verify=False
-        ) as client:
-            with client.stream(
+    ) -> CompletionResponseAsyncGen:
+        async def gen() -> CompletionResponseAsyncGen:
+            async with self.async_client.stream(
                 method="POST",
                 url=f"{self.base_url}/api/generate",
-                json=payload,
+                json=self._completion_payload(prompt, stream=True, **kwargs),
             ) as response:
                 response.raise_for_status()
                 text = ""
-                for line in response.iter_lines():
+                async for line in response.aiter_lines():
                     if line:
-                        chunk = json.loads(line)
-                        delta = chunk.get("response")
-                        text += delta
-                        yield CompletionResponse(
-                            delta=delta,
-                            text=text,
-                            raw=chunk,
-                            additional_kwargs=get_addtional_kwargs(
-                                chunk, ("response",)
-                            ),
-                        )
+                        completion = self._completion_chunk(line, text)
+                        text = completion.text
+                        yield completion
+
+        return gen()
@@ -0,0 +1,185 @@
+"""
+ONNX Runtime backend of the embedding model for CPU-only nodes.
+
+`export` converts a Hugging Face encoder (e.g., sentence-transformers/paraphrase-
+multilingual-MiniLM-L12-v2) to ONNX (needs torch, only for the export) and `quantize`
+stores an int8 copy: the weights of the linear layers are quantized ahead of time, the
+activations at run time (dynamic quantization). `OnnxEmbedding` runs an exported model
+with onnxruntime and pools like the sentence-transformers model (mean over the tokens,
+L2-normalized).
+
+int8 embeddings are close to, but not equal to, the PyTorch embeddings. `compare`
+reports the cosine similarity to reference embeddings (see `raw.engine
+check-embeddings`).
+"""
+
+import os
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+
+DEFAULT_ONNX_DIR = "./cache/onnx"
+MODEL_FILE = "model.onnx"
+INT8_MODEL_FILE = "model_int8.onnx"
+# max_seq_length of the sentence-transformers MiniLM models
+DEFAULT_MAX_LENGTH = 128
+OPSET = 14
+
+
+def export_dir(base_dir, model_name: str) -> Path:
+    return Path(base_dir) / model_name.replace("/", "--")
+
+
+def export(model_name: str, output_dir) -> Path:
+    """Export the encoder (last hidden state) and its tokenizer to `output_dir`."""
+    # pylint: disable=C0415
+    import torch
+    from transformers import AutoModel, AutoTokenizer
+
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModel.from_pretrained(model_name)
+    model.config.return_dict = False
+    model.eval()
+
+    inputs = dict(tokenizer(["Molekulares Tumorboard"], return_tensors="pt"))
+    axes = {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (inputs,),
+            str(output_dir / MODEL_FILE),
+            input_names=list(inputs),
+            output_names=["last_hidden_state"],
+            dynamic_axes={name: axes for name in [*inputs, "last_hidden_state"]},
+            opset_version=OPSET,
+        )
+    tokenizer.save_pretrained(output_dir)
+    return output_dir / MODEL_FILE
+
+
+def quantize(model_dir) -> Path:
+    """Store an int8 copy of the exported model (dynamic quantization)."""
+    # pylint: disable=C0415
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    model_dir = Path(model_dir)
+    quantize_dynamic(
+        model_dir / MODEL_FILE,
+        model_dir / INT8_MODEL_FILE,
+        weight_type=QuantType.QInt8,
+    )
+    return model_dir / INT8_MODEL_FILE
+
+
+class OnnxEmbedding(BaseEmbedding):
+    """
+    Embeds with an exported model (see `export`) in onnxruntime. One forward pass uses
+    `threads` threads; more threads than physical cores slow it down.
+    """
+
+    model_dir: str = Field(description="Directory of the exported model.")
+    quantized: bool = Field(default=False, description="Use the int8 model.")
+    threads: int = Field(
+        default_factory=os.cpu_count, description="Threads per forward pass."
+    )
+    max_length: int = Field(
+        default=DEFAULT_MAX_LENGTH, description="Texts are truncated to this."
+    )
+    normalize: bool = Field(default=True, description="L2-normalize embeddings.")
+
+    _session: Any = PrivateAttr()
+    _tokenizer: Any = PrivateAttr()
+    _input_names: List[str] = PrivateAttr()
+
+    def __init__(self, model_dir, **kwargs: Any) -> None:
+        # pylint: disable=C0415
+        import onnxruntime as ort
+        from transformers import AutoTokenizer
+
+        super().__init__(model_dir=str(model_dir), **kwargs)
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = self.threads
+        options.inter_op_num_threads = 1
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        model_file = INT8_MODEL_FILE if self.quantized else MODEL_FILE
+        self._session = ort.InferenceSession(
+            str(Path(model_dir) / model_file),
+            options,
+            providers=["CPUExecutionProvider"],
+        )
+        self._input_names = [i.name for i in self._session.get_inputs()]
+        self._tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "OnnxEmbedding"
+
+    def _embed(self, texts: List[str]) -> List[Embedding]:
+        inputs = self._tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="np",
+        )
+        feed = {name: inputs[name].astype(np.int64) for name in self._input_names}
+        hidden = self._session.run(None, feed)[0]
+        # Mean over the tokens without padding
+        mask = inputs["attention_mask"][..., None].astype(np.float32)
+        embeddings = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        if self.normalize:
+            embeddings = normalize(embeddings)
+        return embeddings.tolist()
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._embed([query])[0]
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._embed([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        return self._embed(texts)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return self._get_query_embedding(query)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def load_onnx_embedding(
+    model_name: str,
+    base_dir=DEFAULT_ONNX_DIR,
+    quantized: bool = False,
+    threads: Optional[int] = None,
+    **kwargs: Any,
+) -> OnnxEmbedding:
+    """The exported model in `base_dir`; exported (and quantized) on first use."""
+    model_dir = export_dir(base_dir, model_name)
+    if not (model_dir / MODEL_FILE).exists():
+        export(model_name, model_dir)
+    if quantized and not (model_dir / INT8_MODEL_FILE).exists():
+        quantize(model_dir)
+    if threads is not None:
+        kwargs["threads"] = threads
+    return OnnxEmbedding(
+        model_dir, quantized=quantized, model_name=model_name, **kwargs
+    )
+
+
+def compare(
+    reference: BaseEmbedding, candidate: BaseEmbedding, texts: List[str]
+) -> Dict[str, float]:
+    """Cosine similarity of the candidate's to the reference embeddings of `texts`."""
+    expected = normalize(np.array(reference.get_text_embedding_batch(texts)))
+    actual = normalize(np.array(candidate.get_text_embedding_batch(texts)))
+    cosine = (expected * actual).sum(axis=1)
+    return {"min_cosine": float(cosine.min()), "mean_cosine": float(cosine.mean())}
@@ -1,8 +1,12 @@
 """
 Parse ASCII renderings of .docx MTB-protocols. Documents are parsed line-by-line. Section boundaries are identified through a whitelist of section headers. The parser does not yield proper results when section headers are not separated by newlines.
+
+Many protocols are parsed with `parse_corpus`, which streams results from a process pool.
 """
 
-from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Iterable, Iterator, List, Tuple
 
 SECTIONS = {
     "Patient:": [
@@ -67,66 +71,86 @@ RENAME = {
 }
 
 
+# Header lookups: section header -> field lookup (field header -> field name). Dict
+# lookups of the stripped line are faster than a regex alternation over all headers.
+SECTION_FIELDS = {
+    name: {field: RENAME.get(field, field) for field in fields}
+    for name, fields in SECTIONS.items()
+}
+MARKERS_FIELD = "Molekulares Profil & prädiktive Marker"
+# Headers of typical protocols are shorter; longer ones mean a broken conversion
+MAX_HEADER_LENGTH = 200
+
+
+def _join(section: dict) -> dict:
+    return {
+        key: value if key == "_name" else "\n".join(value) + "\n"
+        for key, value in section.items()
+    }
+
+
 def parse(txt, debug=False):
+    """
+    Split a protocol into sections (dicts of field name -> text, see `SECTIONS`) in a
+    single pass. Returns [] if the conversion of the protocol is broken.
+    """
     sections = []
-
-    allowed_sections = SECTIONS.keys()
-    allowed_fields = []
-    section = defaultdict(str)
-    section["_name"] = "header"
+    section_fields = SECTION_FIELDS
+    # lines of each field are collected in lists and joined once at the end
+    section = {"_name": "header"}
+    fields = {}
     current_field = "_text"
+    header_length = 0
 
     for line in txt.split("\n"):
         line = line.strip()
 
-        if current_field == "_text" and len(line) == 0:
+        if not line and current_field == "_text":
             # skip blank lines in between section header and start of first field
             continue
-        elif line in allowed_sections:
+
+        next_fields = section_fields.get(line)
+        if next_fields is not None:
             if debug:
                 print("=" * 20, line, "=" * 20)
-
-            # Persist completed section
-            # Cast defaultdict to dict
-            sections.append(dict(section))
-
-            # Start new section
-            section = defaultdict(str)
-            section["_name"] = line
+            sections.append(section)
+            section = {"_name": line}
+            fields = next_fields
             current_field = "_text"
-            allowed_fields = SECTIONS[line]
-        elif line in allowed_fields:
+            continue
+
+        field = fields.get(line)
+        if field is not None:
             if debug:
                 print("-" * 10, line)
-            current_field = RENAME.get(line, line)
-        else:
-            if debug:
-                print(line)
-            section[current_field] += line + "\n"
+            current_field = field
+            continue
 
-        if (
-            len(sections) == 0
-            and section["_name"] == "header"
-            and len(section["_text"]) > 200
-        ):
+        if debug:
+            print(line)
+        lines = section.get(current_field)
+        if lines is None:
+            lines = section[current_field] = []
+        lines.append(line)
+
+        if not sections:
             # for a small fraction of documents the docx --> ASCII conversion is broken (there are too few newlines)
             # when we find that the header grows larger than a typical header, we skip parsing altogether
-            return []
+            header_length += len(line) + 1
+            if header_length > MAX_HEADER_LENGTH:
+                return []
 
-    sections.append(dict(section))
+    sections.append(section)
+    sections = [_join(section) for section in sections]
 
     for section in sections:
         if (
             section["_name"] == "Molekularpathologische Analyse"
-            and "Molekulares Profil & prädiktive Marker" in section
+            and MARKERS_FIELD in section
         ):
-            markers = section.pop("Molekulares Profil & prädiktive Marker")
+            markers = section.pop(MARKERS_FIELD)
             try:
-
-                markers = parse_markers(
-                    "Molekulares Profil & prädiktive Marker\n" + markers
-                )
-                section["marker"] = markers
+                section["marker"] = parse_markers(MARKERS_FIELD + "\n" + markers)
             except ValueError:
                 section["marker"] = []
 
@@ -157,32 +181,55 @@ def parse_markers(s):
     s = s.strip()
 
     # Table format seems to be inconsistent (2-3 newlines in between header and first row).
-    header_sep = "\n\n\n" if "\n\n\n" in s else "\n\n"
-    columns = s[: s.index(header_sep)].strip().split("\n")
-    data = s[s.index(header_sep) + len(header_sep) :].split("\n")
+    header_end = s.find("\n\n\n")
+    header_sep = 3
+    if header_end < 0:
+        header_end = s.index("\n\n")
+        header_sep = 2
+    columns = s[:header_end].strip().split("\n")
+    data = s[header_end + header_sep :].split("\n")
+
+    # a row is one value per column followed by a separating line
+    n_columns = len(columns)
     rows = []
-    row = {}
-    i = 0
-    for line in data:
-        if i < len(columns):
-            row[columns[i]] = line
-            i += 1
-        else:
-            i = 0
-            rows.append(row)
-            row = {}
-    if len(row) > 0:
-        for c in columns:
-            if c not in row:
-                row[c] = ""
+    for start in range(0, len(data), n_columns + 1):
+        row = dict(zip(columns, data[start : start + n_columns]))
+        if start + n_columns >= len(data):
+            # last row: trailing values may be missing
+            for c in columns:
+                row.setdefault(c, "")
         rows.append(row)
     return rows
 
 
 def parse_type(txt):
-    if "prädiagnostisch" in txt[:250].lower():
+    start = txt[:250].lower()
+    if "prädiagnostisch" in start:
         return "prädiagnostisch"
-    elif "postdiagnostisch" in txt[:250].lower():
+    elif "postdiagnostisch" in start:
         return "postdiagnostisch"
     else:
         return "other"
+
+
+def parse_file(path) -> List[dict]:
+    with open(path, encoding="utf-8") as fin:
+        return parse(fin.read())
+
+
+def parse_corpus(
+    paths: Iterable, workers: int = 8, chunksize: int = 16
+) -> Iterator[Tuple[Path, List[dict]]]:
+    """
+    Parse protocol files in `workers` processes, yielding (path, sections) in the order
+    of `paths` as soon as they are parsed. With workers <= 1, files are parsed in this
+    process.
+    """
+    paths = [Path(path) for path in paths]
+    if workers <= 1:
+        for path in paths:
+            yield path, parse_file(path)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        yield from zip(paths, executor.map(parse_file, paths, chunksize=chunksize))
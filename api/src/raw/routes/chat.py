@@ -1,16 +1,24 @@
 import datetime
 import json
 import logging
+import re
+import time
 from typing import Any, Dict, List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Request, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import StreamingResponse
-from llama_index.core.chat_engine.types import BaseChatEngine
+from llama_index.core import Settings, VectorStoreIndex
 from llama_index.core.llms import ChatMessage, CompletionResponse, MessageRole
+from llama_index.core.schema import QueryBundle
 from llama_index.core.vector_stores.types import ExactMatchFilter, MetadataFilters
 from pydantic import BaseModel
 
-from raw.engine import get_index
+from raw.budget import TokenBudget
+from raw.cache import ResponseCache
+from raw.chat_engine import ContextChatEngine
+from raw.engine import explain_search, timed_ms
+from raw.vector_cache import PatientVectorCache, PatientVectorRetriever
 
 logger = logging.getLogger("uvicorn")
 logger.setLevel(logging.INFO)
@@ -57,27 +65,110 @@ class ChatResponse(BaseModel):
     created_at: str
     total_duration: float
     done: bool
+    cached: bool = False
+    # token budget decisions (see raw.budget), not set for cached answers
+    budget: Optional[Dict[str, int]] = None
+
+
+def get_index(request: Request) -> VectorStoreIndex:
+    # Created once per process in the app lifespan (see raw.main)
+    return request.app.state.index_manager.index
+
+
+def get_response_cache(request: Request) -> Optional[ResponseCache]:
+    return getattr(request.app.state, "response_cache", None)
+
+
+def get_token_budget(request: Request) -> Optional[TokenBudget]:
+    return getattr(request.app.state, "token_budget", None)
+
+
+def get_vector_cache(request: Request) -> Optional[PatientVectorCache]:
+    return request.app.state.index_manager.vector_cache
 
 
 @router.post("/chat")
 async def chat(
     request: Request,
     data: ChatData,
-    index: BaseChatEngine = Depends(get_index),
+    index: VectorStoreIndex = Depends(get_index),
+    cache: Optional[ResponseCache] = Depends(get_response_cache),
+    budget: Optional[TokenBudget] = Depends(get_token_budget),
+    vector_cache: Optional[PatientVectorCache] = Depends(get_vector_cache),
 ) -> ChatResponse:
-    return await _chat(request, data, index, stream=False)
+    return await _chat(request, data, index, cache, budget, vector_cache, stream=False)
 
 
 @router.post("/stream_chat")
 async def stream_chat(
     request: Request,
     data: ChatData,
-    index: BaseChatEngine = Depends(get_index),
+    index: VectorStoreIndex = Depends(get_index),
+    cache: Optional[ResponseCache] = Depends(get_response_cache),
+    budget: Optional[TokenBudget] = Depends(get_token_budget),
+    vector_cache: Optional[PatientVectorCache] = Depends(get_vector_cache),
 ) -> ChatResponse:
-    return await _chat(request, data, index, stream=True)
+    return await _chat(request, data, index, cache, budget, vector_cache, stream=True)
+
+
+@router.post("/reload_index")
+async def reload_index(request: Request):
+    """Reload the index after it was rebuilt or updated with `raw.engine`."""
+    await run_in_threadpool(request.app.state.index_manager.reload)
+    return {"reloaded": True}
+
+
+@router.get("/stats")
+def stats(request: Request):
+    cache = get_response_cache(request)
+    vector_cache = get_vector_cache(request)
+    embed_model = Settings.embed_model
+    return {
+        "embedding": embed_model.stats() if hasattr(embed_model, "stats") else None,
+        "response_cache": (
+            {"hits": cache.hits, "misses": cache.misses} if cache is not None else None
+        ),
+        "vector_cache": vector_cache.stats() if vector_cache is not None else None,
+    }
+
+
+@router.get("/explain")
+async def explain(request: Request, patient_id: str, query: str = "Diagnose?"):
+    """How the retrieval of a chat query for the patient is executed, with timings."""
+    manager = request.app.state.index_manager
+    start = time.perf_counter()
+    embedding = await Settings.embed_model.aget_query_embedding(query)
+    embedding_ms = (time.perf_counter() - start) * 1000
+    report = await run_in_threadpool(
+        explain_search,
+        manager.client,
+        manager.vector_store.collection_name,
+        patient_id,
+        embedding,
+    )
+    report["embedding_ms"] = embedding_ms
+    vector_cache = get_vector_cache(request)
+    if vector_cache is not None:
+        retriever = PatientVectorRetriever(
+            vector_cache, patient_id, Settings.embed_model, similarity_top_k=3
+        )
+        cached = vector_cache.lookup(patient_id) is not None
+        _, report["vector_cache_ms"] = await run_in_threadpool(
+            timed_ms, retriever.retrieve, QueryBundle(query, embedding=embedding)
+        )
+        report["vector_cache_hit"] = cached
+    return report
 
 
-async def _chat(request: Request, data: ChatData, index: BaseChatEngine, stream=False):
+async def _chat(
+    request: Request,
+    data: ChatData,
+    index: VectorStoreIndex,
+    cache: Optional[ResponseCache] = None,
+    budget: Optional[TokenBudget] = None,
+    vector_cache: Optional[PatientVectorCache] = None,
+    stream=False,
+):
     if len(data.messages) == 0:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -99,63 +190,148 @@ async def _chat(request: Request, data: ChatData, index: BaseChatEngine, stream=
         for m in data.messages
     ]
 
-    chat_engine = index.as_chat_engine(
-        similarity_top_k=3,
-        chat_mode="context",
-        use_async=False,
-        filters=MetadataFilters(
-            filters=[
-                ExactMatchFilter(
-                    key="patient_id",
-                    value=data.patient_id,
-                )
-            ]
-        ),
+    if vector_cache is not None:
+        # exact search over the patient's cached vectors, no Qdrant round trip
+        retriever = PatientVectorRetriever(
+            vector_cache, data.patient_id, Settings.embed_model, similarity_top_k=3
+        )
+    else:
+        retriever = index.as_retriever(
+            similarity_top_k=3,
+            filters=MetadataFilters(
+                filters=[
+                    ExactMatchFilter(
+                        key="patient_id",
+                        value=data.patient_id,
+                    )
+                ]
+            ),
+        )
+    chat_engine = ContextChatEngine.from_defaults(
+        retriever=retriever, token_budget=budget
     )
 
+    start = datetime.datetime.utcnow()
+    nodes = await chat_engine.aretrieve(last_message.content)
+
+    cache_key = None
+    if cache is not None:
+        cache_key = cache.make_key(
+            data.patient_id, [*messages, last_message], Settings.llm, nodes
+        )
+        # SQLite I/O, off the event loop
+        cached = await run_in_threadpool(cache.get, cache_key)
+        if cached is not None:
+            if stream:
+                response_generator = cached_stream_generator(cached, start)
+                return StreamingResponse(
+                    response_generator, media_type="application/json"
+                )
+            return {
+                **cached,
+                "created_at": datetime.datetime.utcnow().isoformat() + "Z",
+                "total_duration": duration_ms(start),
+                "done": True,
+                "cached": True,
+            }
+
     if stream:
-        response = await chat_engine.astream_chat(last_message.content, messages)
-        response_generator = stream_chat_generator(response, request)
+        response = await chat_engine.astream_chat(
+            last_message.content, messages, nodes=nodes
+        )
+        response_generator = stream_chat_generator(
+            response,
+            request,
+            cache=cache,
+            cache_key=cache_key,
+            budget=chat_engine.budget_report,
+        )
         return StreamingResponse(response_generator, media_type="application/json")
 
-    start = datetime.datetime.utcnow()
-    response = chat_engine.chat(last_message.content, messages)
-    end = datetime.datetime.utcnow()
-    total_duration = (end - start).total_seconds() * 1000
+    response = await chat_engine.achat(last_message.content, messages, nodes=nodes)
+    source_nodes = serialize_nodes(response.source_nodes)
 
-    source_nodes = [
-        {"node_id": node.id_, "text": node.text, "metadata": node.metadata}
-        for node in response.source_nodes
-    ]
+    if cache is not None:
+        await run_in_threadpool(
+            cache.set,
+            cache_key,
+            {"source_nodes": source_nodes, "message": response.response},
+        )
 
     data = {
         "source_nodes": source_nodes,
         "message": response.response,
         "created_at": datetime.datetime.utcnow().isoformat() + "Z",
-        "total_duration": total_duration,
+        "total_duration": duration_ms(start),
         "done": True,
+        "budget": chat_engine.budget_report,
     }
     return data
 
 
-async def stream_chat_generator(response, request):
+def serialize_nodes(nodes):
+    return [
+        {"node_id": node.id_, "text": node.text, "metadata": node.metadata}
+        for node in nodes
+    ]
+
+
+def duration_ms(start):
+    return (datetime.datetime.utcnow() - start).total_seconds() * 1000
+
+
+async def cached_stream_generator(cached, start):
+    """Replay a cached answer in the same format as `stream_chat_generator`."""
+    yield json.dumps(
+        {
+            "source_nodes": cached["source_nodes"],
+            "message": "",
+            "created_at": datetime.datetime.utcnow().isoformat() + "Z",
+            "total_duration": 0,
+            "done": False,
+            "cached": True,
+        }
+    )
+
+    # Word-sized deltas so clients render the replay like a generated answer
+    for delta in re.findall(r"\s*\S+\s*|\s+", cached["message"]):
+        yield json.dumps(
+            {
+                "created_at": datetime.datetime.utcnow().isoformat() + "Z",
+                "message": delta,
+                "done": False,
+            }
+        ) + "\n"
+
+    yield json.dumps(
+        {
+            "created_at": datetime.datetime.utcnow().isoformat() + "Z",
+            "message": "",
+            "done": True,
+            "total_duration": duration_ms(start),
+        }
+    ) + "\n"
+
+
+async def stream_chat_generator(
+    response, request, cache=None, cache_key=None, budget=None
+):
     start = datetime.datetime.utcnow()
 
     # First reply: source nodes
-    source_nodes = [
-        {"node_id": node.id_, "text": node.text, "metadata": node.metadata}
-        for node in response.source_nodes
-    ]
+    source_nodes = serialize_nodes(response.source_nodes)
     data = {
         "source_nodes": source_nodes,
         "message": "",
         "created_at": datetime.datetime.utcnow().isoformat() + "Z",
         "total_duration": 0,
         "done": False,
+        "budget": budget,
     }
     yield json.dumps(data)
 
     # Subsequent replies: generated tokens
+    text = ""
     async for response in response.async_response_gen():
         if await request.is_disconnected():
             # If client closes connection, stop sending events
@@ -163,6 +339,7 @@ async def stream_chat_generator(response, request):
 
         if isinstance(response, CompletionResponse):
             response = response.delta
+        text += response or ""
 
         yield json.dumps(
             {
@@ -174,6 +351,12 @@ async def stream_chat_generator(response, request):
     end = datetime.datetime.utcnow()
     total_duration = (end - start).total_seconds() * 1000
 
+    # Only cache answers that were streamed completely
+    if cache is not None:
+        await run_in_threadpool(
+            cache.set, cache_key, {"source_nodes": source_nodes, "message": text}
+        )
+
     # Final reply: done and total duration
     yield json.dumps(
         {
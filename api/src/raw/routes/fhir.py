@@ -1,11 +1,12 @@
-from pathlib import Path
-from typing import List
+from typing import List, Optional
 import logging
 
-import pandas as pd
-from fastapi import APIRouter
+from fastapi import APIRouter, Depends, HTTPException, Request, Response
 from pydantic import BaseModel
 
+from raw.catalog import Catalog, form_path
+from raw.files import file_response
+
 router = APIRouter()
 
 logger = logging.getLogger("uvicorn")
@@ -16,6 +17,7 @@ class PresentedForm(BaseModel):
     content_type: str
     creation: str
     path: str
+    sha256: Optional[str] = None
 
 
 class Document(BaseModel):
@@ -30,74 +32,84 @@ class DocumentContent(BaseModel):
     document_id: str
     url: str
     content_type: str
-    creation: str
+    creation: Optional[str]
     content: bytes
 
 
-def load_documents(json_path):
-    df = pd.read_json(json_path, lines=True)
-    df = df.rename(  # pylint: disable=E1101
-        {
-            "id": "document_id",
-            "resourceType": "resource_type",
-            "subject.reference": "patient_id",
-            "meta.lastUpdated": "last_updated",
-            "presentedForm": "presented_form",
-        },
-        axis=1,
-    )
-
-    def rename_forms(presented_forms):
-        forms = []
-        for form in presented_forms:
-            forms.append(
-                {
-                    "url": form["url"],
-                    "content_type": form["contentType"],
-                    "creation": form["creation"],
-                    "path": Path(form["path"]).name,
-                }
-            )
-        return forms
-
-    df["presented_form"] = df["presented_form"].apply(rename_forms)
-    return df
+def get_catalog(request: Request) -> Catalog:
+    return request.app.state.catalog
 
 
-def load_patients(json_path):
-    return pd.read_json(json_path)
+def json_response(content: bytes) -> Response:
+    return Response(content=content, media_type="application/json")
 
 
-df_patients = load_patients("../fhir/data/mtb-patients.json")
-df_documents = load_documents("../fhir/data/patient-documents.jsonl")
-base_path_docs = Path("../fhir/data/docs/")
-
-
-@router.get("/patients")
-def patients() -> List[str]:
-    return df_patients["patient_id"].values.tolist()
+@router.get("/patients", response_model=List[str])
+def patients(catalog: Catalog = Depends(get_catalog)):
+    return json_response(catalog.patients_json)
 
 
 @router.get("/documents", response_model=List[Document])
-def documents(patient_id):
-    mask = df_documents["patient_id"] == f"Patient/{patient_id}"
-    return df_documents[mask].to_dict(orient="records")
+def documents(patient_id, catalog: Catalog = Depends(get_catalog)):
+    return json_response(catalog.documents_json(f"Patient/{patient_id}"))
 
 
 @router.get("/document", response_model=Document)
-def document(document_id):
-    mask = df_documents["document_id"] == document_id
-    return df_documents[mask].iloc[0].to_dict()
-
-
-@router.get("/document_raw")
-def document_raw(document_id, presented_form_url) -> DocumentContent:
-    doc = document(document_id)
-    form = next(
-        form for form in doc["presented_form"] if form["url"] == presented_form_url
-    )
-    path = base_path_docs / Path(form["path"]).name
-    with open(path, "rb") as fin:
+def document(document_id, catalog: Catalog = Depends(get_catalog)):
+    content = catalog.document_json(document_id)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Document not found")
+    return json_response(content)
+
+
+def get_form(document_id, presented_form_url, catalog: Catalog) -> dict:
+    form = catalog.form(document_id, presented_form_url)
+    if form is None:
+        raise HTTPException(status_code=404, detail="Presented form not found")
+    return form
+
+
+@router.get("/document_file")
+def document_file(
+    request: Request,
+    document_id,
+    presented_form_url,
+    catalog: Catalog = Depends(get_catalog),
+):
+    """
+    Attachment as a binary stream (supports Range and conditional requests).
+    Metadata is in the headers: X-Document-Id, X-Presented-Form-Creation (if the
+    attachment has a creation date) and Content-Type; the form url is the one
+    requested.
+    """
+    form = get_form(document_id, presented_form_url, catalog)
+    headers = {
+        "content-disposition": f'inline; filename="{form["path"]}"',
+        "x-document-id": document_id,
+    }
+    # Attachment.creation is optional
+    if form["creation"] is not None:
+        headers["x-presented-form-creation"] = form["creation"]
+    try:
+        return file_response(
+            request,
+            form_path(form),
+            media_type=form["content_type"],
+            headers=headers,
+            # blobs never change, so their digest is a strong validator
+            etag=form["sha256"] and f'"{form["sha256"]}"',
+        )
+    except FileNotFoundError as e:
+        raise HTTPException(status_code=404, detail="File not found") from e
+
+
+@router.get("/document_raw", deprecated=True)
+def document_raw(
+    document_id, presented_form_url, catalog: Catalog = Depends(get_catalog)
+) -> DocumentContent:
+    """Use /document_file, this endpoint base64-encodes the whole file into JSON."""
+    form = get_form(document_id, presented_form_url, catalog)
+    with open(form_path(form), "rb") as fin:
         content = fin.read()
 
     return DocumentContent(
@@ -0,0 +1,252 @@
+"""
+In-process cache of the chunk embeddings of each patient, for exact top-k search.
+
+A chat query only searches the few hundred chunks of one patient. The first query of a
+patient scrolls the patient's points from Qdrant into a contiguous float32 matrix (rows
+normalized, the collection uses cosine distance); later queries are a matrix-vector
+product and a partial sort in process, without a round trip to Qdrant.
+
+Patients are evicted least-recently-used first once the cached matrices and nodes
+exceed the memory budget. Entries are reloaded after `ttl` seconds and dropped when
+the index is reloaded (`/reload_index` after re-indexing), so re-indexed documents are
+picked up.
+
+Configuration (environment):
+- VECTOR_CACHE: "on" to answer chat retrieval from the cache (default: "off")
+- VECTOR_CACHE_MAX_MB: memory budget (default: 512)
+- VECTOR_CACHE_TTL: seconds until a patient is reloaded from Qdrant (default: 600)
+"""
+
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import BaseNode, NodeWithScore, QueryBundle, TextNode
+from llama_index.core.vector_stores.utils import metadata_dict_to_node
+from qdrant_client import QdrantClient, models
+
+DEFAULT_MAX_BYTES = 512 * 2**20
+DEFAULT_TTL = 600.0
+SCROLL_LIMIT = 1024
+
+
+def payload_to_node(point_id, payload: Dict[str, Any]) -> BaseNode:
+    try:
+        return metadata_dict_to_node(payload)
+    except ValueError:
+        # points written without the serialized node (see QdrantVectorStore)
+        return TextNode(id_=str(point_id), text=payload.get("text") or "")
+
+
+@dataclass
+class PatientVectors:
+    matrix: np.ndarray
+    nodes: List[BaseNode]
+    nbytes: int
+    loaded: float
+
+    def top_k(self, query: np.ndarray, k: int) -> List[NodeWithScore]:
+        """Exact cosine top-k (`query` is normalized)."""
+        if len(self.nodes) == 0:
+            return []
+        scores = self.matrix @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [NodeWithScore(node=self.nodes[i], score=float(scores[i])) for i in top]
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+class PatientVectorCache:
+    def __init__(
+        self,
+        client: QdrantClient,
+        collection_name: str,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+        ttl: float = DEFAULT_TTL,
+    ):
+        self.client = client
+        self.collection_name = collection_name
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, PatientVectors]" = OrderedDict()
+        self._lock = threading.Lock()
+        # one load per patient at a time (locks only exist while loading)
+        self._loading: Dict[str, threading.Lock] = {}
+
+    def load(self, patient_id: str) -> PatientVectors:
+        vectors, nodes, offset = [], [], None
+        scroll_filter = models.Filter(
+            must=[
+                models.FieldCondition(
+                    key="patient_id", match=models.MatchValue(value=patient_id)
+                )
+            ]
+        )
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection_name,
+                scroll_filter=scroll_filter,
+                limit=SCROLL_LIMIT,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
+            )
+            for point in points:
+                vectors.append(point.vector)
+                nodes.append(payload_to_node(point.id, point.payload))
+            if offset is None:
+                break
+
+        matrix = np.ascontiguousarray(
+            normalize(np.asarray(vectors, dtype=np.float32)), dtype=np.float32
+        )
+        nbytes = matrix.nbytes + sum(len(node.get_content()) for node in nodes)
+        return PatientVectors(matrix, nodes, nbytes, time.monotonic())
+
+    def lookup(self, patient_id: str) -> Optional[PatientVectors]:
+        """Cached vectors of a patient (None if not cached or expired)."""
+        with self._lock:
+            entry = self._entries.get(patient_id)
+            if entry is None:
+                return None
+            if time.monotonic() - entry.loaded > self.ttl:
+                self._remove(patient_id)
+                return None
+            self._entries.move_to_end(patient_id)
+            return entry
+
+    def get(self, patient_id: str) -> PatientVectors:
+        entry = self.lookup(patient_id)
+        if entry is not None:
+            self._count(hit=True)
+            return entry
+
+        loading = self._loading_lock(patient_id)
+        try:
+            with loading:
+                # loaded by a concurrent request in the meantime
+                entry = self.lookup(patient_id)
+                if entry is not None:
+                    self._count(hit=True)
+                    return entry
+                self._count(hit=False)
+                entry = self.load(patient_id)
+                self._put(patient_id, entry)
+                return entry
+        finally:
+            with self._lock:
+                # waiting requests hold a reference; the entry is cached by now
+                if self._loading.get(patient_id) is loading:
+                    del self._loading[patient_id]
+
+    def _loading_lock(self, patient_id: str) -> threading.Lock:
+        with self._lock:
+            return self._loading.setdefault(patient_id, threading.Lock())
+
+    def _count(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def _put(self, patient_id: str, entry: PatientVectors):
+        with self._lock:
+            self._remove(patient_id)
+            self._entries[patient_id] = entry
+            self.nbytes += entry.nbytes
+            while self.nbytes > self.max_bytes and len(self._entries) > 1:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, patient_id: str):
+        entry = self._entries.pop(patient_id, None)
+        if entry is not None:
+            self.nbytes -= entry.nbytes
+
+    def invalidate(self, patient_id: Optional[str] = None):
+        """Drop one patient (or all, e.g., after re-indexing)."""
+        with self._lock:
+            if patient_id is None:
+                self._entries.clear()
+                self.nbytes = 0
+            else:
+                self._remove(patient_id)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "patients": len(self._entries),
+                "bytes": self.nbytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+class PatientVectorRetriever(BaseRetriever):
+    """Exact top-k over the cached vectors of one patient."""
+
+    def __init__(
+        self,
+        cache: PatientVectorCache,
+        patient_id: str,
+        embed_model: BaseEmbedding,
+        similarity_top_k: int = 3,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self._cache = cache
+        self._patient_id = patient_id
+        self._embed_model = embed_model
+        self._similarity_top_k = similarity_top_k
+
+    def _search(self, embedding) -> List[NodeWithScore]:
+        query = normalize(np.asarray(embedding, dtype=np.float32))
+        return self._cache.get(self._patient_id).top_k(query, self._similarity_top_k)
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        if query_bundle.embedding is None:
+            query_bundle.embedding = self._embed_model.get_agg_embedding_from_queries(
+                query_bundle.embedding_strs
+            )
+        return self._search(query_bundle.embedding)
+
+    async def _aretrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        if query_bundle.embedding is None:
+            query_bundle.embedding = (
+                await self._embed_model.aget_agg_embedding_from_queries(
+                    query_bundle.embedding_strs
+                )
+            )
+        if self._cache.lookup(self._patient_id) is None:
+            # loading scrolls Qdrant: keep the event loop free
+            return await asyncio.to_thread(self._search, query_bundle.embedding)
+        return self._search(query_bundle.embedding)
+
+
+def vector_cache_from_env(
+    client: QdrantClient, collection_name: str
+) -> Optional[PatientVectorCache]:
+    if os.environ.get("VECTOR_CACHE", "off") != "on":
+        return None
+    max_mb = float(os.environ.get("VECTOR_CACHE_MAX_MB", DEFAULT_MAX_BYTES / 2**20))
+    return PatientVectorCache(
+        client,
+        collection_name,
+        max_bytes=int(max_mb * 2**20),
+        ttl=float(os.environ.get("VECTOR_CACHE_TTL", DEFAULT_TTL)),
+    )
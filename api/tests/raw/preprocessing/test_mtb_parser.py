@@ -1,6 +1,33 @@
 from pprint import pprint
 
-from raw.preprocessing.mtb_parser import parse_markers
+from raw.preprocessing.mtb_parser import parse, parse_corpus, parse_markers
+
+PROTOCOL = """Molekulares Tumorboard
+
+Patient:
+
+Pat-ID:
+123
+Name, Vorn., GebDat.:
+Muster, Max, 01.01.1960
+
+Fragestellung:
+
+Therapieempfehlung?
+
+Molekularpathologische Analyse
+Befundtext:
+KRAS-Mutation
+Art der Tumorprobe :
+Biopsie
+Molekulares Profil & prädiktive Marker
+Angewandte Methode
+Alteration
+
+
+NGS-extern
+G13D
+"""
 
 
 def test_parse_markers():
@@ -68,3 +95,47 @@ def test_markers_trailing_ws():
             "Molekulares Profil & prädiktive Marker": "KRAS",
         },
     ]
+
+
+def test_parse():
+    assert parse(PROTOCOL) == [
+        {"_name": "header", "_text": "Molekulares Tumorboard\n"},
+        {
+            "_name": "Patient:",
+            "Pat-ID:": "123\n",
+            "Name, Vorn., GebDatum:": "Muster, Max, 01.01.1960\n\n",
+        },
+        {"_name": "Fragestellung:", "_text": "Therapieempfehlung?\n"},
+        {
+            "_name": "Molekularpathologische Analyse",
+            "Befundtext:": "KRAS-Mutation\n",
+            "Art der Tumorprobe:": "Biopsie\n",
+            "marker": [
+                {
+                    "Molekulares Profil & prädiktive Marker": "NGS-extern",
+                    "Angewandte Methode": "G13D",
+                    "Alteration": "",
+                }
+            ],
+        },
+    ]
+
+
+def test_parse_broken_conversion():
+    # the whole protocol ends up in the header
+    assert parse("Patient: Pat-ID: 123 " * 20) == []
+
+
+def test_parse_corpus(tmp_path):
+    paths = []
+    for i in range(5):
+        path = tmp_path / f"{i}.txt"
+        path.write_text(PROTOCOL.replace("123", str(i)), encoding="utf-8")
+        paths.append(path)
+
+    for workers in [1, 2]:
+        results = list(parse_corpus(paths, workers=workers, chunksize=2))
+        assert [path for path, _ in results] == paths
+        assert [sections[1]["Pat-ID:"] for _, sections in results] == [
+            f"{i}\n" for i in range(5)
+        ]
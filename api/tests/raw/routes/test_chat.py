@@ -0,0 +1,231 @@
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+from typing import Any, Sequence
+
+import httpx
+from fastapi import FastAPI
+from llama_index.core import Document, MockEmbedding, Settings, VectorStoreIndex
+from llama_index.core.llms import (
+    ChatMessage,
+    ChatResponse,
+    ChatResponseAsyncGen,
+    CompletionResponse,
+    CustomLLM,
+    LLMMetadata,
+    MessageRole,
+)
+from llama_index.core.llms.callbacks import llm_chat_callback
+from qdrant_client import QdrantClient, models
+
+from raw.budget import TokenBudget
+from raw.cache import MemoryBackend, ResponseCache
+from raw.routes import chat
+from raw.vector_cache import PatientVectorCache
+
+DELAY = 0.5
+
+
+class SlowLLM(CustomLLM):
+    """Stub LLM that takes DELAY seconds per answer without blocking the event loop."""
+
+    calls: int = 0
+    last_messages: Any = None
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(is_chat_model=True)
+
+    @llm_chat_callback()
+    async def achat(
+        self, messages: Sequence[ChatMessage], **kwargs: Any
+    ) -> ChatResponse:
+        self.calls += 1
+        self.last_messages = list(messages)
+        await asyncio.sleep(DELAY)
+        return ChatResponse(
+            message=ChatMessage(role=MessageRole.ASSISTANT, content="Adenokarzinom")
+        )
+
+    @llm_chat_callback()
+    async def astream_chat(
+        self, messages: Sequence[ChatMessage], **kwargs: Any
+    ) -> ChatResponseAsyncGen:
+        self.calls += 1
+
+        async def gen() -> ChatResponseAsyncGen:
+            text = ""
+            # whitespace around the answer is streamed as generated
+            for delta in ["\n", "Adeno", "karzinom ", "G3\n"]:
+                text += delta
+                yield ChatResponse(
+                    message=ChatMessage(role=MessageRole.ASSISTANT, content=text),
+                    delta=delta,
+                )
+
+        return gen()
+
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        return CompletionResponse(text="Adenokarzinom")
+
+    def stream_complete(self, prompt: str, formatted: bool = False, **kwargs: Any):
+        raise NotImplementedError()
+
+
+def make_app(monkeypatch, cache=None, budget=None):
+    monkeypatch.setattr(Settings, "_llm", SlowLLM())
+    monkeypatch.setattr(Settings, "_embed_model", MockEmbedding(embed_dim=8))
+    index = VectorStoreIndex.from_documents(
+        [
+            Document(text="Diagnose: Adenokarzinom", metadata={"patient_id": "p1"}),
+            Document(text="Diagnose: Melanom", metadata={"patient_id": "p2"}),
+        ]
+    )
+    app = FastAPI()
+    app.include_router(chat.router)
+    app.dependency_overrides[chat.get_index] = lambda: index
+    app.dependency_overrides[chat.get_response_cache] = lambda: cache
+    app.dependency_overrides[chat.get_token_budget] = lambda: budget
+    app.dependency_overrides[chat.get_vector_cache] = lambda: None
+    return app
+
+
+DATA = {
+    "messages": [{"role": "user", "content": "Was ist die Diagnose?"}],
+    "patient_id": "p1",
+}
+
+
+def test_concurrent_chats_overlap(monkeypatch):
+    app = make_app(monkeypatch)
+    n = 5
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            return await asyncio.gather(
+                *[client.post("/chat", json=DATA) for _ in range(n)]
+            )
+
+    start = time.perf_counter()
+    responses = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+
+    assert all(r.status_code == 200 for r in responses)
+    assert responses[0].json()["message"] == "Adenokarzinom"
+    assert [
+        n["metadata"]["patient_id"] for n in responses[0].json()["source_nodes"]
+    ] == ["p1"]
+    # serialized requests would take n * DELAY
+    assert elapsed < 2 * DELAY
+
+
+def test_cached_answer_is_replayed(monkeypatch):
+    app = make_app(monkeypatch, cache=ResponseCache(MemoryBackend()))
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            first = await client.post("/chat", json=DATA)
+            second = await client.post("/chat", json=DATA)
+            streamed = await client.post("/stream_chat", json=DATA)
+            return first, second, streamed
+
+    first, second, streamed = asyncio.run(run())
+    assert Settings.llm.calls == 1
+    assert not first.json()["cached"]
+    assert second.json()["cached"]
+    assert second.json()["message"] == first.json()["message"]
+    assert "Adenokarzinom" in streamed.text
+
+
+def streamed_message(response) -> str:
+    lines = response.text.replace("}{", "}\n{").splitlines()
+    return "".join(json.loads(line)["message"] for line in lines)
+
+
+def test_streamed_answer_is_replayed_unchanged(monkeypatch):
+    app = make_app(monkeypatch, cache=ResponseCache(MemoryBackend()))
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            first = await client.post("/stream_chat", json=DATA)
+            second = await client.post("/stream_chat", json=DATA)
+            return first, second
+
+    first, second = asyncio.run(run())
+    assert Settings.llm.calls == 1
+    assert streamed_message(first) == "\nAdenokarzinom G3\n"
+    assert streamed_message(second) == streamed_message(first)
+
+
+def test_long_history_is_trimmed_to_the_token_budget(monkeypatch):
+    app = make_app(monkeypatch, budget=TokenBudget(max_prompt_tokens=300))
+    history = [
+        {"role": role, "content": "Wie ist der Verlauf der Erkrankung? " * 10}
+        for _ in range(50)
+        for role in ["user", "assistant"]
+    ]
+    data = {**DATA, "messages": history + DATA["messages"]}
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as client:
+            return await client.post("/chat", json=data)
+
+    budget = asyncio.run(run()).json()["budget"]
+    assert budget["prompt_tokens"] <= budget["prompt_budget"] == 300
+    assert budget["nodes_kept"] == 1
+    assert budget["messages_dropped"] > 0
+    # system prompt with context, kept turns, new message
+    assert len(Settings.llm.last_messages) == budget["messages_kept"] + 2
+    assert Settings.llm.last_messages[1].role == MessageRole.USER
+
+
+def test_explain_reports_strategy_and_timings(monkeypatch):
+    app = make_app(monkeypatch)
+    client = QdrantClient(":memory:")
+    client.create_collection(
+        "test", vectors_config=models.VectorParams(size=8, distance="Cosine")
+    )
+    client.upsert(
+        "test",
+        [
+            models.PointStruct(
+                id=i,
+                vector=[float(i + 1)] + [1.0] * 7,
+                payload={"patient_id": f"p{i % 2}", "text": f"Befund {i}"},
+            )
+            for i in range(20)
+        ],
+    )
+    app.state.index_manager = SimpleNamespace(
+        client=client,
+        vector_store=SimpleNamespace(collection_name="test"),
+        vector_cache=PatientVectorCache(client, "test"),
+    )
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as http:
+            params = {"patient_id": "p1", "query": "Was ist die Diagnose?"}
+            return [(await http.get("/explain", params=params)).json() for _ in "ab"]
+
+    cold, warm = asyncio.run(run())
+    assert cold["points"] == 10
+    assert cold["strategy"].startswith("no payload index")
+    assert cold["recall"] == 1.0
+    assert not cold["vector_cache_hit"] and warm["vector_cache_hit"]
+    assert all(k in warm for k in ["embedding_ms", "search_ms", "vector_cache_ms"])
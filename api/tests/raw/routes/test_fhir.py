@@ -0,0 +1,171 @@
+import asyncio
+import json
+
+import httpx
+from fastapi import FastAPI
+
+from raw import catalog
+from raw.catalog import load_catalog
+from raw.routes import fhir
+
+
+def report(doc_id, patient_id, urls):
+    return {
+        "id": doc_id,
+        "resourceType": "DiagnosticReport",
+        "subject.reference": f"Patient/{patient_id}",
+        "meta.lastUpdated": "2023-03-21T08:25:52.182+00:00",
+        "presentedForm": [
+            {
+                "contentType": "text/plain; charset=UTF-8",
+                "creation": "2023-03-21T09:17:41.000+01:00",
+                "path": f"data/docs/{doc_id}.txt",
+                "url": url,
+            }
+            for url in urls
+        ],
+    }
+
+
+class Client:
+    def __init__(self, app):
+        self.app = app
+
+    def get(self, url, **kwargs) -> httpx.Response:
+        async def run():
+            transport = httpx.ASGITransport(app=self.app)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://test"
+            ) as client:
+                return await client.get(url, **kwargs)
+
+        return asyncio.run(run())
+
+
+def make_client(tmp_path, reports):
+    documents_json = tmp_path / "patient-documents.jsonl"
+    documents_json.write_text("".join(json.dumps(r) + "\n" for r in reports))
+    patients_json = tmp_path / "mtb-patients.json"
+    patients_json.write_text(json.dumps([{"patient_id": "p1"}, {"patient_id": "p2"}]))
+
+    app = FastAPI()
+    app.include_router(fhir.router)
+    app.state.catalog = load_catalog(
+        documents_json, patients_json, tmp_path / "catalog.sqlite"
+    )
+    return Client(app)
+
+
+def test_catalog_lookups(tmp_path):
+    client = make_client(
+        tmp_path,
+        [
+            report("d1", "p1", ["u1", "u2"]),
+            report("d2", "p2", ["u3"]),
+            report("d3", "p1", []),
+            # newer version of d1 replaces the old one
+            report("d1", "p1", ["u4"]),
+        ],
+    )
+
+    assert client.get("/patients").json() == ["p1", "p2"]
+
+    docs = client.get("/documents", params={"patient_id": "p1"}).json()
+    assert [d["document_id"] for d in docs] == ["d3", "d1"]
+    assert docs[1]["presented_form"] == [
+        {
+            "url": "u4",
+            "content_type": "text/plain; charset=UTF-8",
+            "creation": "2023-03-21T09:17:41.000+01:00",
+            "path": "d1.txt",
+            "sha256": None,
+        }
+    ]
+    assert client.get("/documents", params={"patient_id": "p3"}).json() == []
+
+    doc = client.get("/document", params={"document_id": "d2"}).json()
+    assert doc["patient_id"] == "Patient/p2"
+    assert client.get("/document", params={"document_id": "d4"}).status_code == 404
+
+    params = {"document_id": "d1", "presented_form_url": "u1"}
+    assert client.get("/document_raw", params=params).status_code == 404
+
+
+def test_document_file_ranges_and_revalidation(tmp_path, monkeypatch):
+    docs_path = tmp_path / "docs"
+    docs_path.mkdir()
+    content = bytes(range(256)) * 1024
+    (docs_path / "d1.txt").write_bytes(content)
+    monkeypatch.setattr(catalog, "DOCS_BASE_PATH", docs_path)
+    client = make_client(tmp_path, [report("d1", "p1", ["u1"])])
+    params = {"document_id": "d1", "presented_form_url": "u1"}
+
+    response = client.get("/document_file", params=params)
+    assert response.status_code == 200
+    assert response.content == content
+    assert response.headers["content-type"].startswith("text/plain")
+    assert response.headers["x-document-id"] == "d1"
+    assert response.headers["accept-ranges"] == "bytes"
+    etag = response.headers["etag"]
+
+    response = client.get(
+        "/document_file", params=params, headers={"If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+    response = client.get(
+        "/document_file",
+        params=params,
+        headers={"If-Modified-Since": response.headers["last-modified"]},
+    )
+    assert response.status_code == 304
+
+    response = client.get(
+        "/document_file", params=params, headers={"Range": "bytes=1000-1999"}
+    )
+    assert response.status_code == 206
+    assert response.headers["content-range"] == f"bytes 1000-1999/{len(content)}"
+    assert response.content == content[1000:2000]
+
+    response = client.get(
+        "/document_file", params=params, headers={"Range": "bytes=-10"}
+    )
+    assert response.content == content[-10:]
+
+    # stale If-Range: full response
+    response = client.get(
+        "/document_file",
+        params=params,
+        headers={"Range": "bytes=0-9", "If-Range": '"stale"'},
+    )
+    assert response.status_code == 200
+    assert len(response.content) == len(content)
+
+    response = client.get(
+        "/document_file", params=params, headers={"Range": f"bytes={len(content)}-"}
+    )
+    assert response.status_code == 416
+    assert response.headers["content-range"] == f"bytes */{len(content)}"
+
+
+def test_document_file_from_blob_store(tmp_path, monkeypatch):
+    sha256 = "ab" + "0" * 62
+    blob_path = tmp_path / "blobs" / "ab" / f"{sha256}.txt"
+    blob_path.parent.mkdir(parents=True)
+    blob_path.write_bytes(b"Befund")
+    monkeypatch.setattr(catalog, "BLOBS_PATH", tmp_path / "blobs")
+    doc = report("d1", "p1", ["u1"])
+    doc["presentedForm"][0].update(path=str(blob_path), sha256=sha256, creation=None)
+    client = make_client(tmp_path, [doc])
+    params = {"document_id": "d1", "presented_form_url": "u1"}
+
+    response = client.get("/document_file", params=params)
+    assert response.content == b"Befund"
+    assert response.headers["etag"] == f'"{sha256}"'
+    # no creation date, no header
+    assert "x-presented-form-creation" not in response.headers
+    response = client.get(
+        "/document_file", params=params, headers={"If-None-Match": f'"{sha256}"'}
+    )
+    assert response.status_code == 304
+    assert client.get("/document_raw", params=params).json()["content"] == "Befund"
@@ -0,0 +1,73 @@
+from llama_index.core.llms import ChatMessage, MessageRole
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from raw.budget import MESSAGE_OVERHEAD, TokenBudget
+
+
+def words(text):
+    return text.split()
+
+
+def node(text, score):
+    return NodeWithScore(node=TextNode(text=text), score=score)
+
+
+def turn(role, n_words):
+    return ChatMessage(role=role, content=" ".join(["wort"] * n_words))
+
+
+def test_short_conversation_keeps_everything():
+    budget = TokenBudget(words)
+    history = [turn(MessageRole.USER, 10), turn(MessageRole.ASSISTANT, 10)]
+    nodes = [node("a " * 100, 0.9), node("b " * 100, 0.8)]
+    kept_history, kept_nodes, report = budget.fit(
+        "Kontext:", turn(MessageRole.USER, 5), history, nodes, 1000, 100
+    )
+    assert kept_history == history
+    assert kept_nodes == nodes
+    assert report.prompt_budget == 900
+    assert report.context_tokens == 200
+    assert report.history_tokens == 20 + 2 * MESSAGE_OVERHEAD
+    assert report.prompt_tokens <= report.prompt_budget
+
+
+def test_long_conversation_is_trimmed_to_the_budget():
+    budget = TokenBudget(words, max_prompt_tokens=400, context_share=0.5)
+    system = ChatMessage(role=MessageRole.SYSTEM, content="Antworte auf deutsch.")
+    history = [system]
+    for _ in range(50):
+        history += [turn(MessageRole.USER, 20), turn(MessageRole.ASSISTANT, 40)]
+    nodes = [node("c " * 100, 0.5), node("a " * 100, 0.9), node("b " * 150, 0.8)]
+
+    kept_history, kept_nodes, report = budget.fit(
+        "Kontext:", turn(MessageRole.USER, 5), history, nodes, 3900, 256
+    )
+
+    assert report.prompt_budget == 400
+    assert report.prompt_tokens <= 400
+    # the best chunk is kept, the next one truncated, the worst dropped
+    assert [n.score for n in kept_nodes] == [0.9, 0.8]
+    assert len(kept_nodes[1].node.text.split()) < 150
+    assert report.nodes_kept == 2
+    assert report.nodes_truncated == 1
+    assert report.nodes_dropped == 1
+    assert report.context_tokens <= report.context_budget
+    # the system message and the newest turns are kept, starting with a user turn
+    assert kept_history[0] is system
+    assert kept_history[1].role == MessageRole.USER
+    assert kept_history[-1] is history[-1]
+    assert report.messages_kept == len(kept_history) - 1
+    assert report.messages_dropped == 100 - report.messages_kept
+
+
+def test_budget_report_does_not_grow_with_history():
+    budget = TokenBudget(words, max_prompt_tokens=500)
+    reports = []
+    for n_turns in [20, 200, 2000]:
+        history = [turn(MessageRole.USER, 30) for _ in range(n_turns)]
+        _, _, report = budget.fit(
+            "Kontext:", turn(MessageRole.USER, 5), history, [], 3900, 256
+        )
+        reports.append(report.to_dict())
+    assert reports[1]["prompt_tokens"] == reports[2]["prompt_tokens"] <= 500
+    assert reports[1]["messages_kept"] == reports[2]["messages_kept"]
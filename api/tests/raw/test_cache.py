@@ -0,0 +1,59 @@
+import time
+
+from llama_index.core.llms import ChatMessage, MessageRole, MockLLM
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from raw.cache import MemoryBackend, ResponseCache, SQLiteBackend
+
+MESSAGES = [ChatMessage(role=MessageRole.USER, content="Was ist die  Diagnose?")]
+
+
+def test_memory_backend_lru():
+    backend = MemoryBackend(max_entries=2)
+    backend.set("a", 1)
+    backend.set("b", 2)
+    assert backend.get("a") == 1
+    backend.set("c", 3)
+    assert backend.get("b") is None
+    assert backend.get("a") == 1
+    assert backend.get("c") == 3
+
+
+def test_memory_backend_ttl():
+    backend = MemoryBackend(ttl=0.01)
+    backend.set("a", 1)
+    time.sleep(0.02)
+    assert backend.get("a") is None
+
+
+def test_sqlite_backend(tmp_path):
+    path = tmp_path / "cache.sqlite"
+    backend = SQLiteBackend(path, max_entries=2)
+    backend.set("a", {"message": "x"})
+    backend.set("b", {"message": "y"})
+    assert backend.get("a") == {"message": "x"}
+    backend.set("c", {"message": "z"})
+    assert backend.get("b") is None
+    assert len(backend) == 2
+
+    # persisted across instances
+    assert SQLiteBackend(path).get("c") == {"message": "z"}
+
+
+def test_key_covers_nodes_and_messages():
+    llm = MockLLM()
+    node = TextNode(text="Diagnose: Adenokarzinom", id_="n1")
+    key = ResponseCache.make_key("p1", MESSAGES, llm, [NodeWithScore(node=node)])
+
+    normalized = [ChatMessage(role=MessageRole.USER, content=" Was ist die Diagnose?")]
+    assert key == ResponseCache.make_key(
+        "p1", normalized, llm, [NodeWithScore(node=node)]
+    )
+    assert key != ResponseCache.make_key(
+        "p2", MESSAGES, llm, [NodeWithScore(node=node)]
+    )
+
+    changed = TextNode(text="Diagnose: Melanom", id_="n1")
+    assert key != ResponseCache.make_key(
+        "p1", MESSAGES, llm, [NodeWithScore(node=changed)]
+    )
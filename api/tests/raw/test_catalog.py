@@ -0,0 +1,102 @@
+import json
+import os
+from types import SimpleNamespace
+
+from raw.catalog import CatalogWatcher, is_stale, load_catalog
+
+
+def report(doc_id, patient_id):
+    return {
+        "id": doc_id,
+        "resourceType": "DiagnosticReport",
+        "subject.reference": patient_id,
+        "meta.lastUpdated": "2023-03-21T08:25:52.182+00:00",
+        "presentedForm": [
+            {
+                "url": f"https://ship/{doc_id}",
+                "contentType": "application/pdf",
+                "creation": "2023-03-21T09:17:41.000+01:00",
+                "path": f"fhir/data/docs/{doc_id}.pdf",
+            }
+        ],
+    }
+
+
+def test_compiled_catalog_is_rebuilt_when_dumps_change(tmp_path):
+    documents_json = tmp_path / "patient-documents.jsonl"
+    documents_json.write_text(json.dumps(report("d1", "Patient/p1")) + "\n")
+    patients_json = tmp_path / "mtb-patients.json"
+    patients_json.write_text(json.dumps([{"patient_id": "Patient/p1"}]))
+    db_path = tmp_path / "catalog.sqlite"
+    sources = (documents_json, patients_json, db_path)
+
+    catalog = load_catalog(*sources)
+    assert not is_stale(*sources)
+    assert catalog.patients == ["Patient/p1"]
+    assert json.loads(catalog.document_json("d1"))["presented_form"][0] == {
+        "url": "https://ship/d1",
+        "content_type": "application/pdf",
+        "creation": "2023-03-21T09:17:41.000+01:00",
+        "path": "d1.pdf",
+        "sha256": None,
+    }
+
+    # any change of size or mtime makes the compiled catalog stale
+    os.remove(documents_json)
+    documents_json.write_text(json.dumps(report("d1", "Patient/p1")) + "\n")
+    os.utime(documents_json, ns=(0, 0))
+    assert is_stale(*sources)
+
+    with open(documents_json, "a") as fout:
+        fout.write(json.dumps(report("d2", "Patient/p1")) + "\n")
+        # incomplete line (being written) is not read
+        fout.write('{"id": "d3"')
+    catalog = load_catalog(*sources)
+    assert [doc["document_id"] for doc in catalog.documents.values()] == ["d1", "d2"]
+    assert json.loads(catalog.documents_json("Patient/p1"))[1]["document_id"] == "d2"
+    assert catalog.form("d2", "https://ship/d2")["path"] == "d2.pdf"
+
+
+def test_watcher_applies_appended_lines(tmp_path):
+    documents_json = tmp_path / "patient-documents.jsonl"
+    documents_json.write_text(json.dumps(report("d1", "Patient/p1")) + "\n")
+    patients_json = tmp_path / "mtb-patients.json"
+    patients_json.write_text(json.dumps([{"patient_id": "Patient/p1"}]))
+    db_path = tmp_path / "catalog.sqlite"
+    state = SimpleNamespace()
+    watcher = CatalogWatcher(state, documents_json, patients_json, db_path)
+    watcher.load()
+    before = state.catalog
+    assert not watcher.poll()
+
+    with open(documents_json, "a") as fout:
+        fout.write(json.dumps(report("d2", "Patient/p1")) + "\n")
+        fout.write(json.dumps(report("d3", "Patient/p2")) + "\n")
+        fout.write('{"id": "d4"')
+    patients_json.write_text(
+        json.dumps([{"patient_id": f"Patient/p{i}"} for i in [1, 2]])
+    )
+    assert watcher.poll()
+
+    catalog = state.catalog
+    assert catalog is not before
+    assert json.loads(catalog.documents_json("Patient/p1"))[1]["document_id"] == "d2"
+    assert catalog.form("d3", "https://ship/d3") is not None
+    assert catalog.patients == ["Patient/p1", "Patient/p2"]
+    # requests holding the old catalog are not affected
+    assert len(before) == 1 and before.by_patient["Patient/p1"] == ["d1"]
+    # the compiled catalog was updated as well
+    assert not is_stale(documents_json, patients_json, db_path)
+    assert len(load_catalog(documents_json, patients_json, db_path)) == 3
+
+    # the incomplete line is read once it is complete
+    with open(documents_json, "a") as fout:
+        fout.write(json.dumps(report("d4", "Patient/p2"))[len('{"id": "d4"') :] + "\n")
+    assert watcher.poll()
+    assert len(state.catalog) == 4
+
+    # replaced dump: full reload
+    documents_json.unlink()
+    documents_json.write_text(json.dumps(report("d5", "Patient/p1")) + "\n")
+    assert watcher.poll()
+    assert list(state.catalog.documents) == ["d5"]
@@ -0,0 +1,78 @@
+from typing import List
+
+import numpy as np
+from llama_index.core import MockEmbedding
+
+from raw.embed_cache import EmbeddingCache, cache_key
+from raw.embeddings import CachedEmbedding
+
+
+class CountingEmbedding(MockEmbedding):
+    texts: List[str] = []
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self.texts.extend(texts)
+        return [np.random.rand(self.embed_dim).tolist() for _ in texts]
+
+
+def test_cache_roundtrip(tmp_path):
+    cache = EmbeddingCache(tmp_path)
+    keys = [cache_key(text, "ns") for text in ["a", "b"]]
+    cache.put_many(keys, [[1.0, 2.0], [3.0, 4.0]])
+    cache.close()
+
+    cache = EmbeddingCache(tmp_path)
+    assert cache.get_many(keys + [cache_key("c", "ns")]) == [
+        [1.0, 2.0],
+        [3.0, 4.0],
+        None,
+    ]
+    assert cache.stats()["hits"] == 2
+
+
+def test_cache_eviction(tmp_path):
+    cache = EmbeddingCache(tmp_path)
+    keys = [cache_key(str(i), "ns") for i in range(10)]
+    cache.put_many(keys, np.eye(10).tolist())
+    cache.get_many(keys[:3])
+
+    row_bytes = cache.nbytes // 10
+    assert cache.evict(max_bytes=3 * row_bytes) == 7
+    assert len(cache) == 3
+
+    cache = EmbeddingCache(tmp_path)
+    assert cache.get_many(keys[:3]) == np.eye(10)[:3].tolist()
+    assert cache.get_many(keys[3:4]) == [None]
+
+
+def test_cached_embedding_skips_known_chunks(tmp_path):
+    model = CountingEmbedding(embed_dim=4, texts=[])
+    embed_model = CachedEmbedding(model, EmbeddingCache(tmp_path), namespace="ns")
+
+    first = embed_model.get_text_embedding_batch(["a", "b"])
+    second = embed_model.get_text_embedding_batch(["b", "c", "a"])
+    assert model.texts == ["a", "b", "c"]
+    assert np.allclose(second[0], first[1])
+    assert np.allclose(second[2], first[0])
+
+
+def test_caches_shared_by_processes(tmp_path):
+    # Each instance stands in for one ingestion process on the same directory
+    first, second = EmbeddingCache(tmp_path), EmbeddingCache(tmp_path)
+    keys = [cache_key(str(i), "ns") for i in range(6)]
+    vectors = np.eye(6).tolist()
+    first.put_many(keys[:2], vectors[:2])
+    second.put_many(keys[2:4], vectors[2:4])
+    first.put_many(keys[4:], vectors[4:])
+    assert second.get_many(keys) == vectors
+
+    second.get_many(keys[4:])
+    assert second.evict(max_bytes=2 * (second.nbytes // 6)) == 4
+    # first numbered its rows before the eviction
+    assert first.get_many(keys) == [None] * 4 + vectors[4:]
+    first.put_many(keys[:1], vectors[:1])
+    first.close()
+    assert (
+        EmbeddingCache(tmp_path).get_many(keys)
+        == vectors[:1] + [None] * 3 + vectors[4:]
+    )
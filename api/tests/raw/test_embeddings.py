@@ -0,0 +1,41 @@
+import asyncio
+from typing import List
+
+from llama_index.core import MockEmbedding
+
+from raw.embeddings import QueryEmbedding
+
+
+class CountingEmbedding(MockEmbedding):
+    batches: List[List[str]] = []
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self.batches.append(texts)
+        return super()._get_text_embeddings(texts)
+
+
+def test_query_cache():
+    embed_model = QueryEmbedding(MockEmbedding(embed_dim=8), batch_window=0)
+    first = embed_model.get_query_embedding("Was ist die Diagnose?")
+    assert embed_model.get_query_embedding("Was ist die Diagnose?") == first
+    assert embed_model.stats()["cache_hits"] == 1
+    assert embed_model.stats()["cache_misses"] == 1
+
+
+def test_concurrent_queries_are_batched():
+    model = CountingEmbedding(embed_dim=8, batches=[])
+    embed_model = QueryEmbedding(model, batch_window=0.05, cache_size=0)
+    queries = [f"Frage {i}" for i in range(10)] + ["Frage 0"]
+
+    async def run():
+        return await asyncio.gather(
+            *[embed_model.aget_query_embedding(q) for q in queries]
+        )
+
+    embeddings = asyncio.run(run())
+    assert len(embeddings) == len(queries)
+    assert model.batches == [[f"Frage {i}" for i in range(10)]]
+
+    stats = embed_model.stats()["batching"]
+    assert stats["batches"] == 1
+    assert stats["max_batch_size"] == len(queries)
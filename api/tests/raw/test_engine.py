@@ -1,2 +1,188 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from llama_index.core import MockEmbedding, Settings
+from llama_index.core.schema import TextNode
+from llama_index.core.vector_stores import ExactMatchFilter, MetadataFilters
+from qdrant_client import AsyncQdrantClient, QdrantClient, models
+
+from raw.engine import (
+    COLLECTION_PROFILES,
+    PATIENT_ID_KEY,
+    RESCORE,
+    IndexManager,
+    apply_profile,
+    check_payload_indexes,
+    collection_search_params,
+    explain_search,
+)
+
+
 def test_foo():
     assert True
+
+
+def test_index_manager_reuses_index(monkeypatch, tmp_path):
+    monkeypatch.setenv("QDRANT_COLLECTION", "test")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Settings, "_embed_model", MockEmbedding(embed_dim=8))
+
+    manager = IndexManager(
+        client=QdrantClient(":memory:"), aclient=AsyncQdrantClient(":memory:")
+    )
+    index = manager.index
+    assert manager.index is index
+
+    manager.reload()
+    assert manager.index is not index
+    asyncio.run(manager.aclose())
+
+
+class RecordingClient:
+    def __init__(self):
+        self.calls = []
+
+    def create_payload_index(self, **kwargs):
+        self.calls.append(("create_payload_index", kwargs))
+
+    def update_collection(self, **kwargs):
+        self.calls.append(("update_collection", kwargs))
+
+
+@pytest.mark.parametrize("profile", list(COLLECTION_PROFILES))
+def test_apply_profile(profile):
+    client = RecordingClient()
+    apply_profile(client, "test", profile)
+    (_, index), (_, update) = client.calls
+
+    # the key the chat route filters on
+    assert index["field_name"] == PATIENT_ID_KEY == "patient_id"
+    assert index["field_schema"].is_tenant == (profile != "default")
+    assert update["hnsw_config"].m == 0
+    quantized = profile in ["quantized", "on_disk"]
+    assert (update["quantization_config"] == models.Disabled.DISABLED) != quantized
+    assert update["vectors_config"][""].on_disk == (profile == "on_disk")
+
+
+def test_apply_profile_to_local_collection():
+    client = QdrantClient(":memory:")
+    client.create_collection(
+        "test", vectors_config=models.VectorParams(size=4, distance="Cosine")
+    )
+    for profile in COLLECTION_PROFILES:
+        apply_profile(client, "test", profile)
+
+
+def test_chat_search_sends_profile_params(monkeypatch, tmp_path):
+    monkeypatch.setenv("QDRANT_COLLECTION", "test")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Settings, "_embed_model", MockEmbedding(embed_dim=4))
+    client = QdrantClient(":memory:")
+    manager = IndexManager(client=client, aclient=AsyncQdrantClient(":memory:"))
+    manager.index.insert_nodes(
+        [
+            TextNode(text=f"Befund {i}", metadata={"patient_id": f"p{i % 2}"})
+            for i in range(10)
+        ]
+    )
+    manager.reload()
+    assert manager.vector_store.search_params is None
+
+    # the local mode ignores quantization
+    info = client.get_collection("test")
+    info.config.quantization_config = COLLECTION_PROFILES["quantized"].quantization
+    monkeypatch.setattr(client, "get_collection", lambda collection_name: info)
+    manager.reload()
+    assert manager.vector_store.search_params == RESCORE
+    assert collection_search_params(QdrantClient(":memory:"), "test") is None
+
+    search_params = []
+    query_points = client.query_points
+
+    def recording_query_points(**kwargs):
+        search_params.append(kwargs["search_params"])
+        return query_points(**kwargs)
+
+    monkeypatch.setattr(client, "query_points", recording_query_points)
+    # as in the chat route
+    retriever = manager.index.as_retriever(
+        similarity_top_k=3,
+        filters=MetadataFilters(
+            filters=[ExactMatchFilter(key="patient_id", value="p1")]
+        ),
+    )
+    nodes = retriever.retrieve("Befund")
+    assert search_params == [RESCORE]
+    assert len(nodes) == 3
+    assert {node.metadata["patient_id"] for node in nodes} == {"p1"}
+
+    # the chat route retrieves asynchronously (the local clients do not share data)
+    async def aquery_points(**kwargs):
+        return recording_query_points(**kwargs)
+
+    monkeypatch.setattr(manager.aclient, "query_points", aquery_points)
+    assert len(asyncio.run(retriever.aretrieve("Befund"))) == 3
+    assert search_params == [RESCORE, RESCORE]
+
+
+def make_collection(n_patients=2, n_chunks=10):
+    client = QdrantClient(":memory:")
+    client.create_collection(
+        "test", vectors_config=models.VectorParams(size=4, distance="Cosine")
+    )
+    client.upsert(
+        "test",
+        [
+            models.PointStruct(
+                id=p * n_chunks + i,
+                vector=[float(p + 1), float(i), 1.0, 0.0],
+                payload={"patient_id": f"p{p}"},
+            )
+            for p in range(n_patients)
+            for i in range(n_chunks)
+        ],
+    )
+    return client
+
+
+class IndexedClient(RecordingClient):
+    def __init__(self, payload_schema):
+        super().__init__()
+        self.payload_schema = payload_schema
+
+    def collection_exists(self, collection_name):
+        return True
+
+    def get_collection(self, collection_name):
+        return SimpleNamespace(payload_schema=self.payload_schema)
+
+
+def test_check_payload_indexes():
+    keyword = models.PayloadIndexInfo(
+        data_type=models.PayloadSchemaType.KEYWORD, points=0
+    )
+    client = IndexedClient({"metadata.patient_id": keyword})
+    assert check_payload_indexes(client, "test", create=False) == {
+        "patient_id": "missing"
+    }
+    assert client.calls == []
+    assert check_payload_indexes(client, "test") == {"patient_id": "created"}
+    assert client.calls[0][1]["field_name"] == "patient_id"
+
+    client = IndexedClient({"patient_id": keyword})
+    assert check_payload_indexes(client, "test") == {"patient_id": "indexed"}
+    assert client.calls == []
+
+    assert check_payload_indexes(QdrantClient(":memory:"), "test") == {}
+
+
+def test_explain_search():
+    client = make_collection()
+    report = explain_search(client, "test", "p1", [2.0, 3.0, 1.0, 0.0])
+    assert report["points"] == 10
+    # the local mode has no payload indexes
+    assert report["payload_index"] is None
+    assert report["strategy"].startswith("no payload index")
+    assert report["recall"] == 1.0
+    assert report["search_ms"] > 0
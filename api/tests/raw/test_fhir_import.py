@@ -0,0 +1,98 @@
+import json
+
+import pytesseract
+
+from raw.catalog import connect_catalog, form_path, iter_db_documents
+from raw.fhir_import import extract_documents, load_cutoffs, select_attachments
+
+from .test_loader import make_pdf
+
+
+def document(doc_id, patient_id, last_updated, forms, sha256=None):
+    return {
+        "id": doc_id,
+        "meta.lastUpdated": last_updated,
+        "subject.reference": patient_id,
+        "presentedForm": [
+            {
+                "url": f"https://ship/{doc_id}{suffix}",
+                "contentType": content_type,
+                "creation": last_updated,
+                "path": f"docs/{doc_id}{suffix}",
+                **({} if sha256 is None else {"sha256": sha256}),
+            }
+            for content_type, suffix in forms
+        ],
+        "resourceType": "DiagnosticReport",
+    }
+
+
+def test_streaming_selection_and_extraction(tmp_path):
+    patients_json = tmp_path / "mtb-patients.json"
+    patients_json.write_text(
+        json.dumps(
+            [
+                {"patient_id": "P1", "mtb_creation": "2023-03-01T00:00:00.000+00:00"},
+                {"patient_id": "P1", "mtb_creation": "2023-01-01T00:00:00.000+00:00"},
+                {"patient_id": "P2", "mtb_creation": "2023-06-01T00:00:00.000+00:00"},
+            ]
+        )
+    )
+    text, zip_ = "text/plain; charset=UTF-8", "application/zip"
+    docs = [
+        document(
+            "a",
+            "P1",
+            "2022-12-01T00:00:00.000+00:00",
+            [("application/pdf", ".pdf"), (text, ".txt")],
+        ),
+        document("b", "P1", "2023-02-01T00:00:00.000+00:00", [(text, ".txt")]),
+        document("c", "P2", "2023-02-01T00:00:00.000+00:00", [(zip_, ".zip")]),
+        document("d", "P2", "2023-02-01T00:00:00.000+00:00", []),
+        document("e", "P2", "2023-05-01T00:00:00.000+00:00", [(text, ".txt")]),
+        # f and g present the same content, h the same content for another patient
+        document("f", "P1", "2022-11-01T00:00:00.000+00:00", [(text, ".txt")], "ab12"),
+        document("g", "P1", "2022-11-02T00:00:00.000+00:00", [(text, ".txt")], "ab12"),
+        document("h", "P2", "2022-11-03T00:00:00.000+00:00", [(text, ".txt")], "ab12"),
+    ]
+    documents_json = tmp_path / "patient-documents.jsonl"
+    documents_json.write_text("".join(json.dumps(doc) + "\n" for doc in docs))
+
+    con = connect_catalog(documents_json, patients_json, tmp_path / "catalog.sqlite")
+    cutoffs = load_cutoffs(con)
+    assert cutoffs["P1"].month == 1
+
+    counts = {"total": 0, "selected": 0}
+    selected = list(select_attachments(iter_db_documents(con), cutoffs, counts))
+    # b is after the first MTB of P1, c has no compatible and d no attachment
+    assert [doc["document_id"] for _, doc in selected] == ["a", "e", "f", "h"]
+    assert counts == {"total": 8, "selected": 4, "duplicates": 1}
+
+    files = []
+    for form, doc in selected:
+        path = form_path(form, tmp_path / "docs", tmp_path / "blobs")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(f"Befund {doc['document_id']}")
+        files.append((path, doc["patient_id"]))
+    assert files[2][0] == tmp_path / "blobs" / "ab" / "f.txt"
+    results = list(extract_documents(files[:2], workers=1, max_pending=1))
+
+    docs = sorted((doc for batch in results for doc in batch), key=lambda d: d.doc_id)
+    assert [doc.doc_id for doc in docs] == ["a.txt", "e.txt"]
+    assert [doc.metadata["patient_id"] for doc in docs] == ["P1", "P2"]
+    assert docs[0].text == "Befund a"
+    assert "file_size" in docs[0].excluded_embed_metadata_keys
+
+
+def test_extraction_with_parallel_ocr(monkeypatch, tmp_path):
+    # forked workers inherit the patched function
+    monkeypatch.setattr(pytesseract, "image_to_string", lambda img, lang: "OCR")
+    path = tmp_path / "scan.pdf"
+    make_pdf(path)
+
+    (docs,) = extract_documents([(path, "P1")], workers=1, ocr_workers=2)
+    assert [doc.text.strip() for doc in docs] == [
+        "Seite mit Text",
+        "OCR",
+        "Noch eine Seite",
+    ]
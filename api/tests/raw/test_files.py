@@ -0,0 +1,48 @@
+import asyncio
+import os
+
+from raw.files import FileRangeResponse
+
+
+def serve(response, method="GET"):
+    messages = []
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": method}
+    asyncio.run(response(scope, None, send))
+    return messages
+
+
+def test_range_is_sent_in_chunks(tmp_path):
+    path = tmp_path / "report.pdf"
+    content = os.urandom(3 * FileRangeResponse.chunk_size + 123)
+    path.write_bytes(content)
+    offset, count = 1000, 2 * FileRangeResponse.chunk_size + 7
+
+    response = FileRangeResponse(
+        path, os.stat(path), status_code=206, offset=offset, count=count
+    )
+    start, *body = serve(response)
+
+    assert start["status"] == 206
+    assert (b"content-length", str(count).encode()) in start["headers"]
+    assert [len(m["body"]) for m in body] == [
+        FileRangeResponse.chunk_size,
+        FileRangeResponse.chunk_size,
+        7,
+    ]
+    assert [m["more_body"] for m in body] == [True, True, False]
+    assert b"".join(m["body"] for m in body) == content[offset : offset + count]
+
+
+def test_full_file_and_head(tmp_path):
+    path = tmp_path / "report.txt"
+    path.write_bytes(b"Befund")
+
+    _, *body = serve(FileRangeResponse(path, os.stat(path)))
+    assert b"".join(m["body"] for m in body) == b"Befund"
+
+    _, *body = serve(FileRangeResponse(path, os.stat(path)), method="HEAD")
+    assert body == [{"type": "http.response.body", "body": b""}]
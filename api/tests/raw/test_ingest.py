@@ -0,0 +1,25 @@
+from llama_index.core import Document, MockEmbedding, Settings, VectorStoreIndex
+from llama_index.vector_stores.qdrant import QdrantVectorStore
+from qdrant_client import QdrantClient
+
+from raw.ingest import bulk_insert
+
+
+def test_bulk_insert(monkeypatch, tmp_path):
+    monkeypatch.setattr(Settings, "_embed_model", MockEmbedding(embed_dim=8))
+    client = QdrantClient(":memory:")
+    vector_store = QdrantVectorStore(collection_name="test", client=client)
+    index = VectorStoreIndex.from_vector_store(vector_store)
+
+    documents = [
+        Document(text=f"Befund {i}", doc_id=f"doc{i}", metadata={"patient_id": "p1"})
+        for i in range(50)
+    ]
+    # the local (in-memory) Qdrant client is not thread-safe: one upload worker
+    nodes = bulk_insert(
+        index, documents, embed_batch_size=8, upload_batch_size=3, upload_workers=1
+    )
+
+    assert client.count("test").count == 50
+    assert len(nodes) == 50
+    assert index.docstore.get_document_hash("doc7") == documents[7].hash
@@ -0,0 +1,94 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import fitz
+import pytesseract
+import pytest
+from PIL import Image
+
+from raw import loader
+from raw.loader import PDFReaderPlus, TesseractReader, get_ocr_pool
+
+
+def make_pdf(path):
+    pdf = fitz.open()
+    pdf.new_page().insert_text((72, 72), "Seite mit Text")
+    image = fitz.open()
+    image.new_page().insert_text((72, 72), "Gescannte Seite")
+    pdf.new_page().insert_image(fitz.Rect(0, 0, 300, 300), pixmap=image[0].get_pixmap())
+    pdf.new_page().insert_text((72, 72), "Noch eine Seite")
+    pdf.save(path)
+
+
+def test_parallel_ocr_keeps_page_order(monkeypatch, tmp_path):
+    # forked OCR workers inherit the patched function
+    monkeypatch.setattr(pytesseract, "image_to_string", lambda img, lang: "OCR")
+    path = tmp_path / "scan.pdf"
+    make_pdf(path)
+
+    expected = PDFReaderPlus().load_data(path)
+    docs = PDFReaderPlus(parallel_ocr=True, ocr_workers=2).load_data(path)
+
+    assert [d.text for d in docs] == [d.text for d in expected]
+    assert [d.text.strip() for d in docs] == [
+        "Seite mit Text",
+        "OCR",
+        "Noch eine Seite",
+    ]
+    assert [d.metadata["page_label"] for d in docs] == ["0", "1", "2"]
+
+
+def uses_ocr_pool():
+    return [
+        PDFReaderPlus(parallel_ocr=True).use_ocr_pool(),
+        PDFReaderPlus(parallel_ocr=True, ocr_workers=2).use_ocr_pool(),
+    ]
+
+
+def test_ocr_pool_in_worker_processes(monkeypatch):
+    assert uses_ocr_pool() == [True, True]
+    assert not PDFReaderPlus().use_ocr_pool()
+    # only with an explicit size in (non-daemonic) worker processes
+    with ProcessPoolExecutor(1) as executor:
+        assert executor.submit(uses_ocr_pool).result() == [False, True]
+    with multiprocessing.Pool(1) as pool:
+        assert pool.apply(uses_ocr_pool) == [False, False]
+
+    monkeypatch.setattr(loader, "_OCR_POOL", None)
+    pool = get_ocr_pool(2)
+    assert get_ocr_pool(2) is pool
+    with pytest.raises(ValueError):
+        get_ocr_pool(3)
+    pool.shutdown()
+
+
+def test_lazy_load_pdf(monkeypatch, tmp_path):
+    monkeypatch.setattr(pytesseract, "image_to_string", lambda img, lang: "OCR")
+    path = tmp_path / "scan.pdf"
+    make_pdf(path)
+
+    docs = PDFReaderPlus().lazy_load_data(path)
+    assert next(docs).text.strip() == "Seite mit Text"
+    assert len(list(docs)) == 2
+
+    (doc,) = PDFReaderPlus(return_full_document=True).load_data(path)
+    assert doc.text == "".join(d.text for d in PDFReaderPlus().load_data(path))
+
+
+def test_multipage_tiff(monkeypatch, tmp_path):
+    monkeypatch.setattr(
+        pytesseract, "image_to_string", lambda img, lang: str(img.getpixel((0, 0)))
+    )
+    path = tmp_path / "scan.tiff"
+    frames = [Image.new("L", (10, 10), color=i) for i in range(3)]
+    frames[0].save(path, save_all=True, append_images=frames[1:])
+
+    docs = TesseractReader().load_data(path)
+    assert [d.text for d in docs] == ["0", "1", "2"]
+    assert [d.metadata["page_label"] for d in docs] == ["0", "1", "2"]
+
+    path = tmp_path / "single.tiff"
+    frames[1].save(path)
+    (doc,) = TesseractReader().load_data(path)
+    assert doc.text == "1"
+    assert "page_label" not in doc.metadata
@@ -0,0 +1,86 @@
+import os
+
+from llama_index.core import MockEmbedding, Settings
+from llama_index.vector_stores.qdrant import QdrantVectorStore
+from qdrant_client import QdrantClient
+
+from raw import engine
+from raw.engine import create_index, load_documents, update_index
+from raw.manifest import Manifest
+
+
+def test_update_touches_only_changed_files(monkeypatch, tmp_path):
+    client = QdrantClient(":memory:")
+    monkeypatch.setattr(
+        engine,
+        "get_vector_store",
+        lambda: QdrantVectorStore(collection_name="test", client=client),
+    )
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Settings, "_embed_model", MockEmbedding(embed_dim=8))
+
+    data_path = tmp_path / "data"
+    data_path.mkdir()
+    for name in ["p1", "p2", "p3"]:
+        (data_path / f"{name}.txt").write_text(f"Befund von {name}")
+
+    create_index(load_documents(data_path), upload_workers=1)
+    manifest = Manifest.load()
+    assert len(manifest.files) == 3
+
+    (data_path / "p1.txt").write_text("Neuer Befund von p1")
+    os.remove(data_path / "p2.txt")
+    (data_path / "p4.txt").write_text("Befund von p4")
+
+    diff = Manifest.load().diff(data_path)
+    assert [os.path.basename(p) for p in diff.new] == ["p4.txt"]
+    assert [os.path.basename(p) for p in diff.changed] == ["p1.txt"]
+    assert [os.path.basename(p) for p in diff.removed] == ["p2.txt"]
+    assert diff.unchanged == 1
+
+    update_index(data_path, upload_workers=1)
+    manifest = Manifest.load()
+    assert sorted(os.path.basename(p) for p in manifest.files) == [
+        "p1.txt",
+        "p3.txt",
+        "p4.txt",
+    ]
+    assert Manifest.load().diff(data_path).unchanged == 3
+
+    # one chunk per file: p2 and the old p1 are gone, p3 kept its vectors
+    points, _ = client.scroll("test", with_payload=True)
+    assert sorted(p.payload["file_name"] for p in points) == [
+        "p1.txt",
+        "p3.txt",
+        "p4.txt",
+    ]
+
+
+def test_update_from_relative_data_path(monkeypatch, tmp_path):
+    client = QdrantClient(":memory:")
+    monkeypatch.setattr(
+        engine,
+        "get_vector_store",
+        lambda: QdrantVectorStore(collection_name="test", client=client),
+    )
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Settings, "_embed_model", MockEmbedding(embed_dim=8))
+
+    # the CLI default --data_path data/
+    os.mkdir("data")
+    for name in ["p1", "p2", "p3"]:
+        (tmp_path / "data" / f"{name}.txt").write_text(f"Befund von {name}")
+    create_index(load_documents("data/"), upload_workers=1)
+
+    os.remove("data/p2.txt")
+    diff = Manifest.load().diff("data/")
+    assert diff.new == diff.changed == []
+    assert [os.path.basename(p) for p in diff.removed] == ["p2.txt"]
+    assert diff.unchanged == 2
+
+    update_index("data/", upload_workers=1)
+    assert client.count("test").count == 2
+    manifest = Manifest.load()
+    assert sorted(manifest.files) == [
+        str(tmp_path.resolve() / "data" / name) for name in ["p1.txt", "p3.txt"]
+    ]
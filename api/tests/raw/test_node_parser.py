@@ -0,0 +1,78 @@
+from llama_index.core import Document
+from llama_index.core.node_parser import SentenceSplitter
+
+from raw.node_parser import MTBNodeParser
+
+PROTOCOL = """Molekulares Tumorboard
+
+Verlauf:
+
+Diagnose:
+Adenokarzinom der Lunge
+Bisheriger Therapieverlauf:
+{therapy}
+
+Fragestellung:
+
+Therapieempfehlung?
+
+Molekularpathologische Analyse
+Molekulares Profil & prädiktive Marker
+Angewandte Methode
+Alteration
+
+
+KRAS
+NGS-extern
+G13D
+"""
+
+
+def test_nodes_per_section_and_field():
+    therapy = "Chemotherapie mit Carboplatin. " * 100
+    doc = Document(text=PROTOCOL.format(therapy=therapy), metadata={"patient_id": "p1"})
+    nodes = MTBNodeParser(chunk_size=128, chunk_overlap=0).get_nodes_from_documents(
+        [doc]
+    )
+
+    fields = [(n.metadata["section"], n.metadata.get("field")) for n in nodes]
+    # the long field is split further
+    n_therapy = fields.count(("Verlauf:", "Bisheriger Therapieverlauf:"))
+    assert n_therapy > 1
+    assert fields == [
+        ("header", None),
+        ("Verlauf:", "Diagnose:"),
+        *[("Verlauf:", "Bisheriger Therapieverlauf:")] * n_therapy,
+        ("Fragestellung:", None),
+        ("Molekularpathologische Analyse", "marker"),
+    ]
+    assert nodes[1].text == "Adenokarzinom der Lunge"
+    assert nodes[-1].text == (
+        "Molekulares Profil & prädiktive Marker: KRAS; "
+        "Angewandte Methode: NGS-extern; Alteration: G13D"
+    )
+    assert all(n.metadata["patient_id"] == "p1" for n in nodes)
+    assert all(n.ref_doc_id == doc.doc_id for n in nodes)
+    assert doc.metadata == {"patient_id": "p1"}
+
+
+def test_fallback_to_sentence_splitter():
+    # the chunks leave room for the metadata, as with the sentence splitter
+    doc = Document(
+        text="Befund vom 01.01.2023. Keine Auffälligkeiten. " * 100,
+        metadata={
+            "file_path": "/data/mtb/protokolle/2023/p1234567.txt",
+            "patient_id": "p1234567",
+        },
+    )
+    nodes = MTBNodeParser(chunk_size=64, chunk_overlap=8).get_nodes_from_documents(
+        [doc]
+    )
+    expected = SentenceSplitter(
+        chunk_size=64, chunk_overlap=8
+    ).get_nodes_from_documents([doc])
+    assert [n.text for n in nodes] == [n.text for n in expected]
+    assert len(nodes) > len(
+        SentenceSplitter(chunk_size=64, chunk_overlap=8).split_text(doc.text)
+    )
+    assert all("section" not in n.metadata for n in nodes)
@@ -0,0 +1,90 @@
+import asyncio
+import json
+
+import httpx
+from llama_index.core.llms import ChatMessage, MessageRole
+
+from raw.ollama import Ollama
+
+MESSAGES = [ChatMessage(role=MessageRole.USER, content="Was ist die Diagnose?")]
+
+
+def handler(request: httpx.Request) -> httpx.Response:
+    payload = json.loads(request.content)
+    if not payload["stream"]:
+        return httpx.Response(
+            200,
+            json={"message": {"role": "assistant", "content": "Adenokarzinom"}},
+        )
+    if request.url.path == "/api/generate":
+        lines = [
+            {"response": "Adeno", "done": False},
+            {"response": "karzinom", "done": False},
+            {"response": "", "done": True},
+        ]
+        return httpx.Response(200, text="\n".join(json.dumps(line) for line in lines))
+    lines = [
+        {"message": {"role": "assistant", "content": "Adeno"}, "done": False},
+        {"message": {"role": "assistant", "content": "karzinom"}, "done": False},
+        {"message": {"role": "assistant", "content": ""}, "done": True},
+    ]
+    return httpx.Response(200, text="\n".join(json.dumps(line) for line in lines))
+
+
+def make_llm():
+    llm = Ollama(model="mixtral:latest", base_url="http://ollama")
+    llm._client = httpx.Client(transport=httpx.MockTransport(handler))
+    llm._async_client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return llm
+
+
+def test_chat_reuses_client():
+    llm = make_llm()
+    client = llm.client
+    assert llm.chat(MESSAGES).message.content == "Adenokarzinom"
+    assert llm.chat(MESSAGES).message.content == "Adenokarzinom"
+    assert llm.client is client
+    llm.close()
+    assert client.is_closed
+
+
+def test_stream_chat():
+    llm = make_llm()
+    responses = list(llm.stream_chat(MESSAGES))
+    assert [r.delta for r in responses] == ["Adeno", "karzinom"]
+    assert responses[-1].message.content == "Adenokarzinom"
+
+
+def test_async_chat():
+    llm = make_llm()
+
+    async def run():
+        response = await llm.achat(MESSAGES)
+        stream = await llm.astream_chat(MESSAGES)
+        deltas = [r.delta async for r in stream]
+        await llm.aclose()
+        return response, deltas
+
+    response, deltas = asyncio.run(run())
+    assert response.message.content == "Adenokarzinom"
+    assert deltas == ["Adeno", "karzinom"]
+    assert llm._async_client is None
+
+
+def test_sync_and_async_streams_agree():
+    llm = make_llm()
+    chat = [(r.delta, r.message.content) for r in llm.stream_chat(MESSAGES)]
+    completion = [(r.delta, r.text) for r in llm.stream_complete("Diagnose?")]
+    assert completion[-1] == ("", "Adenokarzinom")
+
+    async def run():
+        achat = [
+            (r.delta, r.message.content) async for r in await llm.astream_chat(MESSAGES)
+        ]
+        acompletion = [
+            (r.delta, r.text) async for r in await llm.astream_complete("Diagnose?")
+        ]
+        await llm.aclose()
+        return achat, acompletion
+
+    assert asyncio.run(run()) == (chat, completion)
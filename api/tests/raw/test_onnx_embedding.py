@@ -0,0 +1,146 @@
+import numpy as np
+import onnx
+import pytest
+from onnx import TensorProto, helper, numpy_helper
+from transformers import BertTokenizerFast
+
+from raw import engine
+from raw.onnx_embedding import (
+    INT8_MODEL_FILE,
+    MODEL_FILE,
+    OnnxEmbedding,
+    compare,
+    export_dir,
+    quantize,
+)
+
+WORDS = "was ist die diagnose therapie lunge karzinom befund tumor board".split()
+DIM = 32
+
+
+def make_tokenizer(path):
+    path.mkdir(parents=True, exist_ok=True)
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]", *WORDS]
+    (path / "vocab.txt").write_text("\n".join(vocab) + "\n")
+    tokenizer = BertTokenizerFast(vocab_file=str(path / "vocab.txt"))
+    tokenizer.save_pretrained(path)
+    return len(vocab)
+
+
+def make_model(path, seed=0):
+    """Tiny random encoder: token embedding, linear layer, tanh."""
+    vocab_size = make_tokenizer(path)
+    rng = np.random.default_rng(seed)
+    weights = {
+        "embedding": rng.normal(size=(vocab_size, DIM)).astype(np.float32),
+        "weight": (rng.normal(size=(DIM, DIM)) / np.sqrt(DIM)).astype(np.float32),
+        "bias": rng.normal(size=DIM).astype(np.float32),
+    }
+    inputs = [
+        helper.make_tensor_value_info(name, TensorProto.INT64, ["batch", "sequence"])
+        for name in ["input_ids", "token_type_ids", "attention_mask"]
+    ]
+    graph = helper.make_graph(
+        [
+            helper.make_node("Gather", ["embedding", "input_ids"], ["tokens"]),
+            helper.make_node("MatMul", ["tokens", "weight"], ["linear"]),
+            helper.make_node("Add", ["linear", "bias"], ["biased"]),
+            helper.make_node("Tanh", ["biased"], ["last_hidden_state"]),
+        ],
+        "encoder",
+        inputs,
+        [
+            helper.make_tensor_value_info(
+                "last_hidden_state", TensorProto.FLOAT, ["batch", "sequence", DIM]
+            )
+        ],
+        initializer=[numpy_helper.from_array(v, name) for name, v in weights.items()],
+    )
+    model = helper.make_model(graph, opset_imports=[helper.make_opsetid("", 14)])
+    model.ir_version = 8
+    onnx.save(model, path / MODEL_FILE)
+    return weights
+
+
+def reference(weights, input_ids):
+    hidden = np.tanh(
+        weights["embedding"][input_ids] @ weights["weight"] + weights["bias"]
+    )
+    mean = hidden.mean(axis=0)
+    return mean / np.linalg.norm(mean)
+
+
+def test_embeddings_are_mean_pooled_and_normalized(tmp_path):
+    weights = make_model(tmp_path)
+    model = OnnxEmbedding(tmp_path, threads=1)
+    texts = ["Was ist die Diagnose?", "Befund", "Tumor Board Lunge Karzinom Therapie"]
+
+    embeddings = np.array(model.get_text_embedding_batch(texts))
+    tokenizer = BertTokenizerFast.from_pretrained(tmp_path)
+    for text, embedding in zip(texts, embeddings):
+        # padding in the batch does not change the embedding
+        expected = reference(weights, tokenizer(text)["input_ids"])
+        assert np.allclose(embedding, expected, atol=1e-5)
+    assert np.allclose(model.get_query_embedding(texts[1]), embeddings[1], atol=1e-5)
+
+
+def test_int8_embeddings_are_close(tmp_path):
+    make_model(tmp_path)
+    assert quantize(tmp_path) == tmp_path / INT8_MODEL_FILE
+    assert (tmp_path / INT8_MODEL_FILE).stat().st_size < (
+        tmp_path / MODEL_FILE
+    ).stat().st_size
+
+    texts = ["Was ist die Diagnose?", "Befund Lunge", "Therapie Tumor Board"]
+    result = compare(
+        OnnxEmbedding(tmp_path), OnnxEmbedding(tmp_path, quantized=True), texts
+    )
+    assert 0.95 < result["min_cosine"] <= result["mean_cosine"] < 1.0 + 1e-6
+
+
+def test_backend_from_env(tmp_path, monkeypatch):
+    # exported models are not exported again
+    model_dir = export_dir(tmp_path, engine.EMBED_MODEL.removeprefix("local:"))
+    make_model(model_dir)
+    monkeypatch.setenv("EMBED_ONNX_DIR", str(tmp_path))
+    monkeypatch.setenv("EMBED_THREADS", "2")
+
+    model = engine.get_embed_model("onnx-int8")
+    assert isinstance(model, OnnxEmbedding)
+    assert model.quantized and model.threads == 2
+    assert (model_dir / INT8_MODEL_FILE).exists()
+    assert len(model.get_text_embedding("Befund")) == DIM
+    assert engine.embed_model_id("onnx-int8") != engine.embed_model_id("torch")
+    assert engine.embed_model_id("onnx") == engine.EMBED_MODEL
+    with pytest.raises(ValueError):
+        engine.get_embed_model("tensorrt")
+
+
+def test_export_matches_pytorch(tmp_path):
+    # torch is only needed for the export
+    torch = pytest.importorskip("torch")
+    from transformers import BertConfig, BertModel  # pylint: disable=C0415
+
+    from raw.onnx_embedding import export  # pylint: disable=C0415
+
+    vocab_size = make_tokenizer(tmp_path / "hf")
+    config = BertConfig(
+        vocab_size=vocab_size,
+        hidden_size=DIM,
+        num_hidden_layers=1,
+        num_attention_heads=2,
+        intermediate_size=64,
+    )
+    torch.manual_seed(0)
+    BertModel(config).save_pretrained(tmp_path / "hf")
+    export(str(tmp_path / "hf"), tmp_path / "onnx")
+
+    texts = ["Was ist die Diagnose?", "Befund"]
+    model = OnnxEmbedding(tmp_path / "onnx")
+    hf = BertModel.from_pretrained(tmp_path / "hf").eval()
+    tokenizer = BertTokenizerFast.from_pretrained(tmp_path / "hf")
+    for text, embedding in zip(texts, model.get_text_embedding_batch(texts)):
+        with torch.no_grad():
+            hidden = hf(**tokenizer(text, return_tensors="pt")).last_hidden_state
+        expected = torch.nn.functional.normalize(hidden.mean(dim=1), dim=-1)[0]
+        assert np.allclose(embedding, expected.numpy(), atol=1e-4)
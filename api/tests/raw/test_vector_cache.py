@@ -0,0 +1,116 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from llama_index.core import MockEmbedding, VectorStoreIndex
+from llama_index.core.schema import QueryBundle, TextNode
+from llama_index.vector_stores.qdrant import QdrantVectorStore
+from qdrant_client import QdrantClient, models
+
+from raw.vector_cache import PatientVectorCache, PatientVectorRetriever
+
+DIM = 16
+
+
+def make_index(client, n_patients=3, n_chunks=50):
+    rng = np.random.default_rng(0)
+    vector_store = QdrantVectorStore(collection_name="test", client=client)
+    vector_store.add(
+        [
+            TextNode(
+                text=f"Befund {p}-{i}",
+                metadata={"patient_id": f"p{p}"},
+                embedding=rng.normal(size=DIM).tolist(),
+            )
+            for p in range(n_patients)
+            for i in range(n_chunks)
+        ]
+    )
+    return VectorStoreIndex.from_vector_store(
+        vector_store, embed_model=MockEmbedding(embed_dim=DIM)
+    )
+
+
+def qdrant_search(client, patient_id, embedding, k):
+    """Filtered search in Qdrant (the path of the index retriever)."""
+    return client.query_points(
+        collection_name="test",
+        query=embedding,
+        query_filter=models.Filter(
+            must=[
+                models.FieldCondition(
+                    key="patient_id", match=models.MatchValue(value=patient_id)
+                )
+            ]
+        ),
+        limit=k,
+    ).points
+
+
+def test_exact_search_matches_qdrant():
+    client = QdrantClient(":memory:")
+    make_index(client)
+    cache = PatientVectorCache(client, "test")
+    rng = np.random.default_rng(1)
+
+    for patient_id in ["p0", "p2"]:
+        retriever = PatientVectorRetriever(
+            cache, patient_id, MockEmbedding(embed_dim=DIM), similarity_top_k=5
+        )
+        for _ in range(10):
+            embedding = rng.normal(size=DIM).tolist()
+            expected = qdrant_search(client, patient_id, embedding, 5)
+            nodes = asyncio.run(
+                retriever.aretrieve(QueryBundle("", embedding=embedding))
+            )
+            assert [n.node.node_id for n in nodes] == [str(p.id) for p in expected]
+            assert np.allclose([n.score for n in nodes], [p.score for p in expected])
+            assert all(n.node.metadata["patient_id"] == patient_id for n in nodes)
+
+    assert cache.stats()["patients"] == 2
+    assert cache.misses == 2
+    assert cache.hits == 18
+
+
+def test_eviction_and_invalidation():
+    client = QdrantClient(":memory:")
+    make_index(client, n_chunks=20)
+    entry_bytes = PatientVectorCache(client, "test").load("p0").nbytes
+    cache = PatientVectorCache(client, "test", max_bytes=int(entry_bytes * 2.5))
+
+    for patient_id in ["p0", "p1", "p0", "p2"]:
+        cache.get(patient_id)
+    # p1 was least recently used
+    assert cache.lookup("p1") is None
+    assert cache.lookup("p0") is not None and cache.lookup("p2") is not None
+    assert cache.nbytes <= cache.max_bytes
+    assert cache.get("p3").matrix.shape == (0,)
+
+    cache.invalidate("p0")
+    assert cache.lookup("p0") is None
+    cache.invalidate()
+    assert cache.stats()["patients"] == 0 and cache.nbytes == 0
+
+    cache.ttl = 0.01
+    first = cache.get("p0")
+    time.sleep(0.02)
+    assert cache.get("p0") is not first
+
+
+def test_concurrent_gets_load_once():
+    client = QdrantClient(":memory:")
+    make_index(client, n_chunks=20)
+    cache = PatientVectorCache(client, "test")
+    loads = []
+    load = cache.load
+    cache.load = lambda patient_id: loads.append(patient_id) or load(patient_id)
+
+    with ThreadPoolExecutor(8) as pool:
+        entries = list(pool.map(cache.get, ["p0"] * 8 + ["p1"] * 8))
+
+    assert sorted(loads) == ["p0", "p1"]
+    assert len({id(e) for e in entries}) == 2
+    assert cache.stats()["hits"] == 14 and cache.stats()["misses"] == 2
+    # no per-patient state is left behind by loading
+    assert cache._loading == {}  # pylint: disable=W0212
@@ -0,0 +1,102 @@
+"""
+Content-addressed store for attachments.
+
+Every attachment is stored once, as `blobs/<sha256[:2]>/<sha256>.<ext>`, no matter how
+many DiagnosticReports (or versions of one report) present it. `blobs/index.sqlite`
+maps (resource id, form url) to the digest. A url that was stored before is not fetched
+again, so binaries shared by several reports are downloaded once.
+
+The dumps reference blobs by `presentedForm.sha256` and `presentedForm.path`.
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Optional, Tuple
+
+BLOBS_PATH = Path("fhir/data/blobs")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS forms (
+    resource_id TEXT NOT NULL,
+    url TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    ext TEXT NOT NULL,
+    PRIMARY KEY (resource_id, url)
+);
+CREATE INDEX IF NOT EXISTS forms_url ON forms (url);
+CREATE INDEX IF NOT EXISTS forms_sha256 ON forms (sha256);
+"""
+
+
+def file_hash(path) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f_r:
+        for block in iter(lambda: f_r.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class BlobStore:
+    def __init__(self, root=BLOBS_PATH):
+        self.root = Path(root)
+        self.tmp_path = self.root / "tmp"
+        self.tmp_path.mkdir(parents=True, exist_ok=True)
+        self._con = sqlite3.connect(self.root / "index.sqlite", check_same_thread=False)
+        self._con.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def close(self):
+        self._con.close()
+
+    def path(self, sha256: str, ext: str) -> Path:
+        return self.root / sha256[:2] / f"{sha256}.{ext}"
+
+    def download_path(self, url: str, ext: str) -> Path:
+        """Where `url` is downloaded to before it is added (stable for resuming)."""
+        return self.tmp_path / f"{hashlib.sha256(url.encode()).hexdigest()}.{ext}"
+
+    def lookup(self, url: str) -> Optional[Tuple[str, str]]:
+        """(sha256, ext) of a url that was stored before."""
+        with self._lock:
+            row = self._con.execute(
+                "SELECT sha256, ext FROM forms WHERE url = ? LIMIT 1", (url,)
+            ).fetchone()
+        if row is None or not self.path(*row).exists():
+            return None
+        return row
+
+    def add(self, path, ext: str) -> str:
+        """Move a file into the store (or drop it if the content is stored)."""
+        sha256 = file_hash(path)
+        blob_path = self.path(sha256, ext)
+        if blob_path.exists():
+            os.remove(path)
+        else:
+            blob_path.parent.mkdir(exist_ok=True)
+            os.replace(path, blob_path)
+        return sha256
+
+    def link(self, resource_id: str, url: str, sha256: str, ext: str):
+        with self._lock, self._con:
+            self._con.execute(
+                "INSERT OR REPLACE INTO forms VALUES (?, ?, ?, ?)",
+                (resource_id, url, sha256, ext),
+            )
+
+    def resolve(self, resource_id: str, url: str) -> Optional[Path]:
+        with self._lock:
+            row = self._con.execute(
+                "SELECT sha256, ext FROM forms WHERE resource_id = ? AND url = ?",
+                (resource_id, url),
+            ).fetchone()
+        return None if row is None else self.path(*row)
+
+    def stats(self) -> dict:
+        with self._lock:
+            forms, blobs = self._con.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT sha256) FROM forms"
+            ).fetchone()
+        return {"forms": forms, "blobs": blobs}
@@ -0,0 +1,242 @@
+"""
+Concurrent, resumable HTTP downloads for the FHIR scripts.
+
+All requests go through one `requests.Session` (e.g., the authenticated session of
+`fhir_pyrate.Ahoy`) with a connection pool sized for the number of workers. At most
+`per_host` requests run against the same host at a time, and transient errors
+(connection errors, 429 and 5xx) are retried with exponential backoff, honoring
+`Retry-After`.
+
+Files are written to `<path>.part` and renamed when complete. A download interrupted
+by a crash continues from the end of the `.part` file with a `Range` request, and files
+that exist are not downloaded again.
+"""
+
+import logging
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Container, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 16
+DEFAULT_PER_HOST = 8
+RETRY_STATUS = {429, 500, 502, 503, 504}
+CHUNK_SIZE = 1 << 20
+
+
+@dataclass
+class DownloadStats:
+    files: int = 0
+    skipped: int = 0
+    failed: int = 0
+    requests: int = 0
+    retries: int = 0
+    bytes: int = 0
+    start: float = 0.0
+
+    def __str__(self) -> str:
+        seconds = max(time.perf_counter() - self.start, 1e-9)
+        return (
+            f"{self.files:,} files downloaded ({self.skipped:,} existing, {self.failed:,} failed), "
+            f"{self.bytes / 2**20:,.1f} MB in {seconds:.1f}s "
+            f"({self.files / seconds:,.1f} files/s, {self.bytes / 2**20 / seconds:,.2f} MB/s), "
+            f"{self.requests:,} requests, {self.retries:,} retries"
+        )
+
+
+class Downloader:
+    def __init__(
+        self,
+        session: Optional[requests.Session] = None,
+        workers: int = DEFAULT_WORKERS,
+        per_host: int = DEFAULT_PER_HOST,
+        retries: int = 5,
+        backoff: float = 0.5,
+        timeout: float = 60,
+    ):
+        self.session = session or requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.workers = workers
+        self.per_host = per_host
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.stats = DownloadStats(start=time.perf_counter())
+
+        self._executor = ThreadPoolExecutor(workers, thread_name_prefix="download")
+        self._hosts = defaultdict(lambda: threading.BoundedSemaphore(self.per_host))
+        self._paths = defaultdict(threading.Lock)
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def _host_limit(self, url) -> threading.BoundedSemaphore:
+        with self._lock:
+            return self._hosts[urlsplit(url).netloc]
+
+    def _count(self, key: str, value: int = 1):
+        with self._lock:
+            setattr(self.stats, key, getattr(self.stats, key) + value)
+
+    def _sleep(self, attempt: int, response: Optional[requests.Response] = None):
+        delay = self.backoff * 2**attempt
+        retry_after = None if response is None else response.headers.get("Retry-After")
+        if retry_after is not None and retry_after.isdigit():
+            delay = max(delay, float(retry_after))
+        self._count("retries")
+        time.sleep(delay)
+
+    def request(self, url, consume=None, headers=None, **kwargs):
+        """
+        GET `url` with retries. Without `consume`, the response body is read and the
+        response returned; else `consume(response)` runs while the connection (and
+        the host slot) is held and its result is returned. `headers` may be a function
+        that is called before each attempt.
+        """
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.retries + 1):
+            last_attempt = attempt == self.retries
+            retry_response = None
+            try:
+                with self._host_limit(url):
+                    self._count("requests")
+                    with self.session.get(
+                        url,
+                        stream=True,
+                        headers=headers() if callable(headers) else headers,
+                        **kwargs,
+                    ) as response:
+                        if response.status_code in RETRY_STATUS and not last_attempt:
+                            retry_response = response
+                        else:
+                            response.raise_for_status()
+                            if consume is None:
+                                response.content  # pylint: disable=W0104
+                                return response
+                            return consume(response)
+            except (
+                requests.ConnectionError,
+                requests.Timeout,
+                requests.exceptions.ChunkedEncodingError,
+            ) as e:
+                if last_attempt:
+                    raise
+                logger.info(f"Retrying {url}: {e}")
+                self._sleep(attempt)
+                continue
+            logger.info(f"Retrying {url}: HTTP {retry_response.status_code}")
+            self._sleep(attempt, retry_response)
+
+    def get_json(self, url, **kwargs) -> dict:
+        return self.request(url, **kwargs).json()
+
+    def download(self, url, path, overwrite: bool = False) -> Path:
+        """
+        Download `url` to `path` unless it exists (or `overwrite`); resumes partial
+        downloads.
+        """
+        path = Path(path)
+        # concurrent downloads to the same path would write the same part file
+        with self._lock:
+            path_lock = self._paths[path]
+        with path_lock:
+            if path.exists() and not overwrite:
+                self._count("skipped")
+                return path
+            return self._download(url, path)
+
+    def _download(self, url, path: Path) -> Path:
+        part_path = path.with_name(path.name + ".part")
+
+        def part_size() -> int:
+            return part_path.stat().st_size if part_path.exists() else 0
+
+        def range_header() -> dict:
+            offset = part_size()
+            return {"Range": f"bytes={offset}-"} if offset > 0 else {}
+
+        def write(response: requests.Response):
+            offset = part_size()
+            content_range = response.headers.get("Content-Range", "")
+            resumed = response.status_code == 206 and content_range.startswith(
+                f"bytes {offset}-"
+            )
+            with open(part_path, "ab" if resumed else "wb") as fout:
+                for chunk in response.iter_content(CHUNK_SIZE):
+                    fout.write(chunk)
+                    self._count("bytes", len(chunk))
+
+        try:
+            self.request(url, consume=write, headers=range_header)
+        except requests.HTTPError as e:
+            if e.response.status_code != 416:
+                raise
+            content_range = e.response.headers.get("Content-Range", "")
+            if content_range != f"bytes */{part_size()}":
+                # the part file does not match the file on the server: start over
+                part_path.unlink(missing_ok=True)
+                self.request(url, consume=write)
+        os.replace(part_path, path)
+        self._count("files")
+        return path
+
+    def download_all(
+        self, items: Iterable[Tuple[str, Path]], overwrite: Container[Path] = ()
+    ) -> List[Optional[Path]]:
+        """
+        Download (url, path) pairs concurrently; failed downloads are None. Paths in
+        `overwrite` are downloaded again if they exist.
+        """
+        items = list(items)
+        futures = [
+            self._executor.submit(self.download, url, path, path in overwrite)
+            for url, path in items
+        ]
+        paths = []
+        for (url, path), future in zip(items, futures):
+            try:
+                paths.append(future.result())
+            except requests.RequestException as e:
+                logger.info(f"Could not download file ({path}): {url} ({e})")
+                self._count("failed")
+                paths.append(None)
+        return paths
+
+
+def search(
+    downloader: Downloader, base_url: str, resource_type: str, params: dict
+) -> Iterator[dict]:
+    """Yield the resources of a FHIR search, following the `next` links of the bundles."""
+    url = f"{base_url.rstrip('/')}/{resource_type}"
+    while url is not None:
+        bundle = downloader.get_json(url, params=params)
+        params = None  # the next links contain the query
+        for entry in bundle.get("entry", []):
+            yield entry["resource"]
+        url = next(
+            (
+                link["url"]
+                for link in bundle.get("link", [])
+                if link["relation"] == "next"
+            ),
+            None,
+        )
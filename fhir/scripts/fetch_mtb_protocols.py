@@ -1,3 +1,4 @@
+import argparse
 import json
 import os
 import re
@@ -7,8 +8,26 @@ from dotenv import find_dotenv, load_dotenv
 from fhir_pyrate import Ahoy, Pirate
 from tqdm.auto import tqdm
 
+from sync import (
+    CHANGES_JSONL,
+    WATERMARKS_JSON,
+    ChangeLog,
+    Watermarks,
+    query_key,
+    since_param,
+    version_of,
+)
+
 tqdm.pandas()
 
+parser = argparse.ArgumentParser()
+parser.add_argument(
+    "--full",
+    action="store_true",
+    help="Search all protocols, not only those updated since the last run.",
+)
+args = parser.parse_args()
+
 load_dotenv(find_dotenv())
 
 auth = Ahoy(
@@ -29,17 +48,42 @@ fields = [
     "presentedForm.contentType",
     "presentedForm.creation",
     "subject.reference",
+    "meta.versionId",
+    "meta.lastUpdated",
 ]
+request_params = {
+    "_content": "MTB",
+    "category": "https://uk-essen.de/HIS/Cerner/Medico/Docs/Type%7cTKPROTOKOLL",
+    "_sort": "-date",
+    "_count": 500,
+}
+out_file = Path("fhir/data/mtb-patients.json")
+
+# Delta sync: only protocols updated since the last run (see sync.py)
+watermarks = Watermarks.load(WATERMARKS_JSON)
+watermark_key = query_key("DiagnosticReport", request_params)
+since = None if args.full else watermarks.get(watermark_key)
 obs = search.steal_bundles_to_dataframe(
     resource_type="DiagnosticReport",
-    request_params={
-        "_content": "MTB",
-        "category": "https://uk-essen.de/HIS/Cerner/Medico/Docs/Type%7cTKPROTOKOLL",
-        "_sort": "-date",
-        "_count": 500,
-    },
+    request_params={**request_params, **since_param(since)},
     fhir_paths=fields,  # type: ignore
 )
+if obs.empty:
+    print(f"No protocols updated since {since}.")
+    exit(0)
+
+existing = []
+if out_file.exists():
+    with open(out_file) as f_r:
+        existing = json.load(f_r)
+changes = ChangeLog(
+    versions={doc["mtb_id"]: version_of(doc) for doc in existing}, path=CHANGES_JSONL
+)
+updated_ids = {doc["mtb_id"] for doc in existing}
+records = obs.drop_duplicates("id").to_dict(orient="records")
+changed_ids = {doc["id"] for doc in changes.merge(records)}
+updated_ids &= changed_ids
+obs = obs[obs["id"].isin(changed_ids)]
 
 all_documents = obs.explode(
     ["presentedForm.contentType", "presentedForm.url", "presentedForm.creation"]
@@ -56,7 +100,7 @@ pattern = r"MTB\s\d{2}\.\d{2}\.\d{4}"
 
 def download_doc(url, id):
     output_file = data_dir / f"{id}.txt"
-    if output_file.exists():
+    if output_file.exists() and id not in updated_ids:
         return output_file
     res = auth.session.get(url)
     text = res.content.decode("utf-8")
@@ -88,5 +132,16 @@ text_documents["mtb_path"] = text_documents["mtb_path"].astype(str)
 
 text_documents = text_documents.to_dict(orient="records")
 
-with open("fhir/data/mtb-patients.json", "w") as f_w:
+# Merge: updated protocols replace their previous version
+text_documents = [
+    doc for doc in existing if doc["mtb_id"] not in changed_ids
+] + text_documents
+
+tmp_file = out_file.with_suffix(".tmp")
+with open(tmp_file, "w") as f_w:
     json.dump(text_documents, f_w)
+os.replace(tmp_file, out_file)
+
+watermarks.advance(watermark_key, [doc.get("meta.lastUpdated") for doc in records])
+watermarks.save()
+print(f"{changes.count:,} protocols created or updated (see {changes.path}).")
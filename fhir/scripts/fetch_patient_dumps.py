@@ -1,18 +1,30 @@
+import argparse
 import json
 import logging
 import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
+from typing import List, Optional, Tuple
 
-import requests
 from dotenv import find_dotenv, load_dotenv
+from fhir_pyrate import Ahoy
 from tqdm.auto import tqdm
 
-tqdm.pandas()
-
-from fhir_pyrate import Ahoy, Pirate
+from blobstore import BlobStore
+from downloader import DEFAULT_PER_HOST, DEFAULT_WORKERS, Downloader, search
+from sync import (
+    CHANGES_JSONL,
+    WATERMARKS_JSON,
+    ChangeLog,
+    Watermarks,
+    is_newer,
+    query_key,
+    read_jsonl,
+    since_param,
+    version_of,
+)
 
 out_file = Path("fhir/data/patient-documents.jsonl")
-n_patients = 10
 form_to_ext = {
     "text/plain; charset=UTF-8": "txt",
     "application/pdf": "pdf",
@@ -23,126 +35,282 @@ form_to_ext = {
     "text/richtext; charset=UTF-8": "rtf",
 }
 
-load_dotenv(find_dotenv())
-
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
-auth = Ahoy(
-    auth_type="token",
-    auth_method="env",
-    auth_url=os.environ["BASIC_AUTH"],  # The URL for authentication
-    refresh_url=os.environ["BASIC_AUTH"],  # The URL to refresh the authentication
-)
-search = Pirate(
-    auth=auth,
-    base_url=os.environ["SEARCH_URL"],  # e.g. "http://hapi.fhir.org/baseDstu2"
-    print_request_url=True,  # If set to true, you will see all requests
-)
 
-with open("fhir/data/mtb-patients.json") as f_r:
-    mtb_patients = json.load(f_r)
-
-
-def download_file(url):
-    res = auth.session.get(url)
-    return res.content
-
-
-def download_document(doc):
-    base_path = f"fhir/data/docs/{doc['id']}"
-    presented_form = []
-    if isinstance(doc["presentedForm.contentType"], list):
-        doc_path = []
-        for form, url, creation in zip(
-            doc["presentedForm.contentType"],
-            doc["presentedForm.url"],
-            doc["presentedForm.creation"],
-        ):
-            if not Path(f"{base_path}.{form_to_ext[form]}").exists():
-                try:
-                    content = download_file(url)
-                except requests.exceptions.HTTPError:
-                    logger.info(f"Could not download file ({base_path}): {url}")
-                    continue
-
-                with open(f"{base_path}.{form_to_ext[form]}", "wb") as f_w:
-                    f_w.write(content)
-            doc_path.append(f"{base_path}.{form_to_ext[form]}")
-
-            presented_form.append(
-                {
-                    "url": url,
-                    "contentType": form,
-                    "creation": creation,
-                    "path": f"{base_path}.{form_to_ext[form]}",
-                }
-            )
-
-    else:
-        doc_path = f"{base_path}.{form_to_ext[doc['presentedForm.contentType']]}"
-        url = doc["presentedForm.url"]
-        if not Path(doc_path).exists():
-            try:
-                content = download_file(url)
-            except requests.exceptions.HTTPError:
-                logger.info(f"Could not download file ({base_path}): {url}")
-                return presented_form
-            with open(doc_path, "wb") as f_w:
-                f_w.write(content)
-
-        presented_form.append(
+def flatten_report(resource: dict) -> dict:
+    """DiagnosticReport with the fields of the dump (see fetch_patient_documents)."""
+    meta = resource.get("meta", {})
+    return {
+        "resourceType": resource["resourceType"],
+        "id": resource["id"],
+        "subject.reference": resource.get("subject", {}).get("reference"),
+        "meta.versionId": meta.get("versionId"),
+        "meta.lastUpdated": meta.get("lastUpdated"),
+        "presentedForm": resource.get("presentedForm", []),
+    }
+
+
+def download_documents(
+    downloader: Downloader, store: BlobStore, documents: List[dict], updated=()
+) -> Tuple[List[dict], List[dict]]:
+    """
+    Download the attachments of all documents concurrently into the blob store. Urls
+    that are in the store are not downloaded again, unless the document id is in
+    `updated`. Returns the documents whose attachments are all stored and those with
+    a failed download (to be fetched again in the next run).
+    """
+    forms, items, overwrite = [], {}, set()
+    for doc in documents:
+        for form in doc["presentedForm"]:
+            if not form.get("url"):
+                continue
+            ext = form_to_ext[form["contentType"]]
+            forms.append((doc, form, ext))
+            if doc["id"] not in updated and store.lookup(form["url"]) is not None:
+                continue
+            path = store.download_path(form["url"], ext)
+            items[form["url"]] = (path, ext)
+            if doc["id"] in updated:
+                overwrite.add(path)
+
+    paths = downloader.download_all(
+        [(url, path) for url, (path, _) in items.items()], overwrite
+    )
+    digests = {}
+    for (url, (_, ext)), path in zip(items.items(), paths):
+        if path is not None:
+            digests[url] = store.add(path, ext)
+
+    presented_forms = {doc["id"]: [] for doc in documents}
+    failed = set()
+    for doc, form, ext in forms:
+        sha256 = digests.get(form["url"])
+        if sha256 is None:
+            # The stored blob of an updated document is the previous version
+            stored = None if doc["id"] in updated else store.lookup(form["url"])
+            if stored is None:
+                failed.add(doc["id"])
+                continue
+            sha256 = stored[0]
+        presented_forms[doc["id"]].append((form, sha256, ext))
+
+    for doc in documents:
+        if doc["id"] in failed:
+            continue
+        for form, sha256, ext in presented_forms[doc["id"]]:
+            store.link(doc["id"], form["url"], sha256, ext)
+        doc["presentedForm"] = [
             {
-                "url": doc["presentedForm.url"],
-                "contentType": doc["presentedForm.contentType"],
-                "creation": doc["presentedForm.creation"],
-                "path": doc_path,
+                "url": form["url"],
+                "contentType": form["contentType"],
+                "creation": form.get("creation"),
+                "path": str(store.path(sha256, ext)),
+                "sha256": sha256,
             }
-        )
-    return presented_form
-
-
-def fetch_patient_documents(patient_id):
-    fields = [
-        "resourceType",
-        "id",
-        "presentedForm.url",
-        "presentedForm.contentType",
-        "presentedForm.creation",
-        "subject.reference",
-        "meta.versionid",
-        "meta.lastUpdated",
-        "path",
-    ]
+            for form, sha256, ext in presented_forms[doc["id"]]
+        ]
+    if failed:
+        logger.warning(f"Downloads of {len(failed):,} documents failed.")
+    return (
+        [doc for doc in documents if doc["id"] not in failed],
+        [doc for doc in documents if doc["id"] in failed],
+    )
 
-    documents = search.steal_bundles_to_dataframe(
-        resource_type="DiagnosticReport",
-        request_params={
-            "subject": f"Patient/{patient_id}",
+
+def patient_reference(patient_id: str) -> str:
+    # mtb-patients.json stores the subject reference ("Patient/<id>")
+    return patient_id if patient_id.startswith("Patient/") else f"Patient/{patient_id}"
+
+
+def fetch_patient_documents(
+    downloader: Downloader,
+    store: BlobStore,
+    base_url: str,
+    patient_id,
+    since: Optional[str] = None,
+    changes: Optional[ChangeLog] = None,
+):
+    """
+    Search the documents of a patient (updated since `since`) and download the
+    attachments of those that are new or updated compared to `changes`. Returns the
+    downloaded documents, the latest `meta.lastUpdated` the server returned and the
+    documents whose attachments could not be downloaded.
+    """
+    documents = search(
+        downloader,
+        base_url,
+        "DiagnosticReport",
+        {
+            "subject": patient_reference(patient_id),
             "_sort": "-date",
             "_count": 500,
+            **since_param(since),
         },
-        fhir_paths=fields,  # type: ignore
     )
-    documents = documents[documents["presentedForm.url"].notnull()]
-    tqdm.pandas(desc="Downloading documents")
-    documents["presentedForm"] = documents.progress_apply(download_document, axis=1)
-    documents = documents.drop(
-        ["presentedForm.url", "presentedForm.contentType", "presentedForm.creation"],
-        axis=1,
+    documents = [flatten_report(doc) for doc in documents]
+    latest = max((doc["meta.lastUpdated"] or "" for doc in documents), default=None)
+    documents = [
+        doc
+        for doc in documents
+        if any(form.get("url") for form in doc["presentedForm"])
+    ]
+
+    updated = set()
+    if changes is not None:
+        known = changes.versions
+        documents = [
+            doc
+            for doc in documents
+            if doc["id"] not in known or is_newer(version_of(doc), known[doc["id"]])
+        ]
+        updated = {doc["id"] for doc in documents if doc["id"] in known}
+    documents, failed = download_documents(downloader, store, documents, updated)
+    return documents, latest, failed
+
+
+def repair_dump(path: Path):
+    """Drop a last line that was not completely written (e.g., after a crash)."""
+    if not path.exists():
+        return
+    with open(path, "rb+") as f:
+        content = f.read()
+        if content and not content.endswith(b"\n"):
+            f.truncate(content.rfind(b"\n") + 1)
+
+
+def patient_key(patient_id) -> str:
+    return query_key("DiagnosticReport", {"subject": patient_reference(patient_id)})
+
+
+def sync_patients(
+    downloader: Downloader,
+    store: BlobStore,
+    base_url: str,
+    patient_ids: List[str],
+    dump_path: Path = out_file,
+    watermarks: Optional[Watermarks] = None,
+    changes_path: Path = CHANGES_JSONL,
+    patient_workers: int = 4,
+    full: bool = False,
+) -> ChangeLog:
+    """
+    Fetch the documents of the patients updated since the last run (all documents
+    without watermarks or with `full`) and append new versions to the dump. Documents
+    with failed downloads are not written and the watermark is held before them, so
+    the next run fetches them again.
+    """
+    repair_dump(dump_path)
+    dump = list(read_jsonl(dump_path))
+    changes = ChangeLog.from_records(dump, changes_path)
+    watermarks = watermarks if watermarks is not None else Watermarks()
+
+    # Patients in a dump written without watermarks: start from the dump
+    for doc in dump:
+        key = patient_key(doc["subject.reference"])
+        if key not in watermarks.marks:
+            watermarks.advance(key, [doc["meta.lastUpdated"]])
+    del dump
+
+    with ThreadPoolExecutor(patient_workers) as executor:
+        futures = {
+            executor.submit(
+                fetch_patient_documents,
+                downloader,
+                store,
+                base_url,
+                patient_id,
+                None if full else watermarks.get(patient_key(patient_id)),
+                changes,
+            ): patient_id
+            for patient_id in patient_ids
+        }
+        with open(dump_path, "a") as f_w:
+            for future in tqdm(as_completed(futures), total=len(futures)):
+                documents, latest, failed = future.result()
+                documents = changes.merge(documents)
+                # one write per patient, so that a crash leaves at most one partial line
+                f_w.write("".join(json.dumps(doc) + "\n" for doc in documents))
+                f_w.flush()
+                key = patient_key(futures[future])
+                watermarks.advance(key, [latest])
+                watermarks.hold(key, [doc["meta.lastUpdated"] for doc in failed])
+                watermarks.save()
+    return changes
+
+
+def main(args):
+    load_dotenv(find_dotenv())
+    auth = Ahoy(
+        auth_type="token",
+        auth_method="env",
+        auth_url=os.environ["BASIC_AUTH"],  # The URL for authentication
+        refresh_url=os.environ["BASIC_AUTH"],  # The URL to refresh the authentication
     )
 
-    return documents
+    with open("fhir/data/mtb-patients.json") as f_r:
+        mtb_patients = json.load(f_r)
+    patient_ids = list(dict.fromkeys(p["patient_id"] for p in mtb_patients))
+    if args.n_patients is not None:
+        patient_ids = patient_ids[: args.n_patients]
 
+    watermarks = Watermarks.load(WATERMARKS_JSON)
+    print(f"Syncing documents of {len(patient_ids):,} patients.")
 
-if out_file.exists():
-    print(f"{out_file} already exists. Skipping")
-    exit(0)
+    store = BlobStore()
+    with Downloader(
+        auth.session, workers=args.workers, per_host=args.per_host
+    ) as downloader:
+        changes = sync_patients(
+            downloader,
+            store,
+            os.environ["SEARCH_URL"],
+            patient_ids,
+            out_file,
+            watermarks,
+            patient_workers=args.patient_workers,
+            full=args.full,
+        )
+        print(downloader.stats)
+    stats = store.stats()
+    print(f"{stats['forms']:,} attachments stored as {stats['blobs']:,} blobs.")
+    store.close()
+    print(f"{changes.count:,} documents created or updated (see {changes.path}).")
 
-for patient in mtb_patients[:n_patients]:
-    documents = fetch_patient_documents(patient["patient_id"])
-    documents = documents.to_dict(orient="records")
-    for doc in documents:
-        with open(out_file, "a") as f_w:
-            json.dump(doc, f_w)
-            f_w.write("\n")
+
+def arg_parser():
+    parser = argparse.ArgumentParser(
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter
+    )
+    parser.add_argument(
+        "--n_patients", type=int, default=None, help="Only the first n patients."
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=DEFAULT_WORKERS,
+        help="Number of concurrent downloads.",
+    )
+    parser.add_argument(
+        "--per_host",
+        type=int,
+        default=DEFAULT_PER_HOST,
+        help="Maximum number of concurrent requests per host.",
+    )
+    parser.add_argument(
+        "--patient_workers",
+        type=int,
+        default=4,
+        help="Number of patients whose documents are searched concurrently.",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Search all documents, not only those updated since the last run.",
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    main(arg_parser())
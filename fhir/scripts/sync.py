@@ -0,0 +1,146 @@
+"""
+Incremental (delta) sync of FHIR resources.
+
+Each search query has a `_lastUpdated` watermark: the latest `meta.lastUpdated` the
+server returned for it. The next run only requests resources updated since then
+(`_lastUpdated=ge<watermark>`, resources at the watermark itself are returned again and
+recognized as unchanged). Fetched resources are merged into the dumps by resource id
+and version, and every created or updated resource is appended to a change list
+(`changes.jsonl`) that indexing can consume.
+
+Deleted resources are not returned by searches and are not detected.
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple
+
+WATERMARKS_JSON = Path("fhir/data/watermarks.json")
+CHANGES_JSONL = Path("fhir/data/changes.jsonl")
+
+
+def query_key(resource_type: str, params: dict) -> str:
+    """Key of a search query (without paging and sorting parameters)."""
+    params = {k: v for k, v in params.items() if k not in ("_sort", "_count")}
+    return resource_type + "?" + "&".join(f"{k}={params[k]}" for k in sorted(params))
+
+
+def since_param(watermark: Optional[str]) -> dict:
+    return {} if watermark is None else {"_lastUpdated": f"ge{watermark}"}
+
+
+class Watermarks:
+    def __init__(self, path=WATERMARKS_JSON, marks: Optional[Dict[str, str]] = None):
+        self.path = Path(path)
+        self.marks = marks or {}
+
+    @classmethod
+    def load(cls, path=WATERMARKS_JSON) -> "Watermarks":
+        path = Path(path)
+        if not path.exists():
+            return cls(path)
+        with open(path) as f_r:
+            return cls(path, json.load(f_r))
+
+    def save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f_w:
+            json.dump(self.marks, f_w, indent=1)
+        os.replace(tmp_path, self.path)
+
+    def get(self, key: str) -> Optional[str]:
+        return self.marks.get(key)
+
+    def advance(self, key: str, last_updated: Iterable[Optional[str]]):
+        """Move the watermark to the latest of `last_updated` (never backwards)."""
+        # FHIR instants of one server share the format and time zone
+        latest = max((t for t in last_updated if t), default=None)
+        if latest is not None and (key not in self.marks or latest > self.marks[key]):
+            self.marks[key] = latest
+
+    def hold(self, key: str, last_updated: Iterable[Optional[str]]):
+        """
+        Move the watermark back to the earliest of `last_updated`, so that the next
+        search returns these resources again (drop it if one has no `lastUpdated`).
+        """
+        last_updated = list(last_updated)
+        if not last_updated:
+            return
+        if not all(last_updated):
+            self.marks.pop(key, None)
+            return
+        earliest = min(last_updated)
+        if key not in self.marks or earliest < self.marks[key]:
+            self.marks[key] = earliest
+
+
+def version_of(record: dict) -> Tuple[Optional[str], Optional[str]]:
+    return record.get("meta.versionId"), record.get("meta.lastUpdated")
+
+
+def is_newer(version, known) -> bool:
+    """Compare (versionId, lastUpdated); versions are integers on most servers."""
+    (version_id, last_updated), (known_id, known_updated) = version, known
+    if version_id is not None and known_id is not None and version_id != known_id:
+        if version_id.isdigit() and known_id.isdigit():
+            return int(version_id) > int(known_id)
+        return (last_updated or "") >= (known_updated or "")
+    return (last_updated or "") > (known_updated or "")
+
+
+class ChangeLog:
+    """Tracks the versions in a dump and appends created/updated resources to a list."""
+
+    def __init__(self, versions: Optional[Dict[str, tuple]] = None, path=CHANGES_JSONL):
+        self.versions = versions or {}
+        self.path = Path(path)
+        self.run = time.strftime("%Y-%m-%dT%H:%M:%S%z")
+        self.count = 0
+
+    @classmethod
+    def from_records(cls, records: Iterable[dict], path=CHANGES_JSONL) -> "ChangeLog":
+        changes = cls(path=path)
+        for record in records:
+            changes.versions[record["id"]] = version_of(record)
+        return changes
+
+    def merge(self, records: Iterable[dict]) -> list:
+        """Records that are new or newer than the known version (and log them)."""
+        merged, lines = [], []
+        for record in records:
+            version = version_of(record)
+            known = self.versions.get(record["id"])
+            if known is not None and not is_newer(version, known):
+                continue
+            self.versions[record["id"]] = version
+            merged.append(record)
+            lines.append(
+                {
+                    "run": self.run,
+                    "change": "created" if known is None else "updated",
+                    "resourceType": record.get("resourceType"),
+                    "id": record["id"],
+                    "versionId": version[0],
+                    "lastUpdated": version[1],
+                    "subject": record.get("subject.reference"),
+                }
+            )
+        self.count += len(lines)
+        if lines:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(self.path, "a") as f_w:
+                f_w.write("".join(json.dumps(line) + "\n" for line in lines))
+        return merged
+
+
+def read_jsonl(path) -> Iterable[dict]:
+    path = Path(path)
+    if not path.exists():
+        return
+    with open(path) as f_r:
+        for line in f_r:
+            if line.strip():
+                yield json.loads(line)
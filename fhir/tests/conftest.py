@@ -0,0 +1,139 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+
+
+class FHIRStub:
+    """
+    Minimal FHIR server: paged DiagnosticReport searches by subject and binary
+    attachments (with Range support). `failures[path]` 503 responses are sent before
+    a binary is served.
+    """
+
+    page_size = 2
+
+    def __init__(self):
+        self.reports = {}  # subject reference -> [DiagnosticReport]
+        self.binaries = {}  # path -> bytes
+        self.failures = {}  # path -> number of 503 responses
+        self.delay = 0.0
+        self.requests = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.url = None
+
+    def report(self, doc_id, subject, last_updated, forms, version="1"):
+        return {
+            "resourceType": "DiagnosticReport",
+            "id": doc_id,
+            "meta": {"versionId": version, "lastUpdated": last_updated},
+            "subject": {"reference": subject},
+            "presentedForm": [
+                {
+                    "contentType": content_type,
+                    "url": f"{self.url}/binary/{name}",
+                    "creation": last_updated,
+                }
+                for content_type, name in forms
+            ],
+        }
+
+    def search(self, query):
+        reports = self.reports.get(query["subject"][0], [])
+        since = query.get("_lastUpdated", [None])[0]
+        if since is not None:
+            assert since.startswith("ge")
+            reports = [r for r in reports if r["meta"]["lastUpdated"] >= since[2:]]
+        page = int(query.get("_page", ["0"])[0])
+        start = page * self.page_size
+        bundle = {
+            "resourceType": "Bundle",
+            "entry": [{"resource": r} for r in reports[start : start + self.page_size]],
+            "link": [],
+        }
+        if start + self.page_size < len(reports):
+            query = {k: v[0] for k, v in query.items()}
+            query["_page"] = str(page + 1)
+            next_url = f"{self.url}/fhir/DiagnosticReport?" + "&".join(
+                f"{k}={v}" for k, v in query.items()
+            )
+            bundle["link"].append({"relation": "next", "url": next_url})
+        return bundle
+
+
+def make_handler(stub: FHIRStub):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def send(self, status, body=b"", headers=None):
+            self.send_response(status)
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlsplit(self.path)
+            with stub.lock:
+                stub.requests.append((url.path, dict(self.headers)))
+                stub.in_flight += 1
+                stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+            try:
+                time.sleep(stub.delay)
+                self.handle_get(url)
+            finally:
+                with stub.lock:
+                    stub.in_flight -= 1
+
+        def handle_get(self, url):
+            if url.path == "/fhir/DiagnosticReport":
+                bundle = stub.search(parse_qs(url.query))
+                self.send(200, json.dumps(bundle).encode())
+                return
+
+            name = url.path.removeprefix("/binary/")
+            if name not in stub.binaries:
+                self.send(404)
+                return
+            if stub.failures.get(name, 0) > 0:
+                stub.failures[name] -= 1
+                self.send(503, headers={"Retry-After": "0"})
+                return
+
+            content = stub.binaries[name]
+            range_header = self.headers.get("Range")
+            if range_header is None:
+                self.send(200, content)
+                return
+            start = int(range_header.removeprefix("bytes=").rstrip("-"))
+            if start >= len(content):
+                self.send(416, headers={"Content-Range": f"bytes */{len(content)}"})
+                return
+            self.send(
+                206,
+                content[start:],
+                {"Content-Range": f"bytes {start}-{len(content) - 1}/{len(content)}"},
+            )
+
+    return Handler
+
+
+@pytest.fixture
+def fhir_server():
+    stub = FHIRStub()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(stub))
+    stub.url = f"http://127.0.0.1:{server.server_port}"
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield stub
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,122 @@
+import hashlib
+import json
+from pathlib import Path
+
+import fetch_patient_dumps
+from blobstore import BlobStore
+from downloader import Downloader
+
+
+def test_download_retries_resumes_and_skips(fhir_server, tmp_path):
+    fhir_server.binaries = {"a.pdf": b"a" * 5000, "b.pdf": bytes(range(256)) * 40}
+    fhir_server.failures = {"a.pdf": 2}
+    # b.pdf was partially downloaded before a crash, c.pdf is complete
+    (tmp_path / "b.pdf.part").write_bytes(fhir_server.binaries["b.pdf"][:1000])
+    (tmp_path / "c.pdf").write_bytes(b"c")
+
+    items = [
+        (f"{fhir_server.url}/binary/{name}", tmp_path / name)
+        for name in ["a.pdf", "b.pdf", "c.pdf", "missing.pdf"]
+    ]
+    with Downloader(workers=4, backoff=0.01) as downloader:
+        paths = downloader.download_all(items)
+
+    assert paths == [tmp_path / "a.pdf", tmp_path / "b.pdf", tmp_path / "c.pdf", None]
+    for name in ["a.pdf", "b.pdf"]:
+        assert (tmp_path / name).read_bytes() == fhir_server.binaries[name]
+    assert not list(tmp_path.glob("*.part"))
+    b_requests = [h for path, h in fhir_server.requests if path == "/binary/b.pdf"]
+    assert [h.get("Range") for h in b_requests] == ["bytes=1000-"]
+
+    stats = downloader.stats
+    assert (stats.files, stats.skipped, stats.failed, stats.retries) == (2, 1, 1, 2)
+    assert stats.bytes == 5000 + 10240 - 1000
+    assert "files/s" in str(stats)
+
+
+def test_fetch_patient_documents(fhir_server, tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+    pdf, txt = "application/pdf", "text/plain; charset=UTF-8"
+    subject = "Patient/p1"
+    fhir_server.reports[subject] = [
+        fhir_server.report(f"d{i}", subject, f"2023-0{i}-01", [(pdf, f"{i}.pdf")])
+        for i in range(1, 6)
+    ] + [fhir_server.report("d6", subject, "2023-06-01", [])]
+    fhir_server.binaries = {f"{i}.pdf": f"PDF {i}".encode() for i in range(1, 6)}
+    fhir_server.reports[subject][0]["presentedForm"].append(
+        {"contentType": txt, "url": f"{fhir_server.url}/binary/missing.txt"}
+    )
+    fhir_server.delay = 0.05
+
+    with Downloader(workers=8, per_host=2, backoff=0.01) as downloader:
+        documents, latest, failed = fetch_patient_dumps.fetch_patient_documents(
+            downloader, store, f"{fhir_server.url}/fhir", "p1"
+        )
+
+    # 3 pages of results, d6 has no attachment
+    assert [doc["id"] for doc in documents] == ["d2", "d3", "d4", "d5"]
+    assert latest == "2023-06-01"
+    assert documents[0]["subject.reference"] == subject
+    assert documents[0]["meta.lastUpdated"] == "2023-02-01"
+    sha256 = hashlib.sha256(b"PDF 2").hexdigest()
+    assert documents[0]["presentedForm"] == [
+        {
+            "url": f"{fhir_server.url}/binary/2.pdf",
+            "contentType": pdf,
+            "creation": "2023-02-01",
+            "path": str(tmp_path / "blobs" / sha256[:2] / f"{sha256}.pdf"),
+            "sha256": sha256,
+        }
+    ]
+    # an attachment of d1 could not be downloaded
+    assert [doc["id"] for doc in failed] == ["d1"]
+    assert store.stats()["forms"] == 4
+    assert Path(documents[3]["presentedForm"][0]["path"]).read_bytes() == b"PDF 5"
+    assert fhir_server.max_in_flight <= 2
+    json.dumps(documents)
+
+
+def test_repair_dump(tmp_path):
+    dump = tmp_path / "patient-documents.jsonl"
+    dump.write_text('{"subject.reference": "Patient/p1"}\n{"subject.refer')
+    fetch_patient_dumps.repair_dump(dump)
+    assert dump.read_text() == '{"subject.reference": "Patient/p1"}\n'
+    assert fetch_patient_dumps.patient_reference("Patient/p1") == "Patient/p1"
+    assert fetch_patient_dumps.patient_reference("p2") == "Patient/p2"
+
+
+def test_identical_attachments_are_stored_and_fetched_once(fhir_server, tmp_path):
+    store = BlobStore(tmp_path / "blobs")
+    pdf = "application/pdf"
+    subject = "Patient/p1"
+    fhir_server.binaries = {"a.pdf": b"same", "b.pdf": b"same", "c.pdf": b"other"}
+    fhir_server.reports[subject] = [
+        # d1 and d2 present the same binary, d3 a copy of it under another url
+        fhir_server.report("d1", subject, "2023-01-01", [(pdf, "a.pdf")]),
+        fhir_server.report("d2", subject, "2023-01-02", [(pdf, "a.pdf")]),
+        fhir_server.report("d3", subject, "2023-01-03", [(pdf, "b.pdf")]),
+        fhir_server.report("d4", subject, "2023-01-04", [(pdf, "c.pdf")]),
+    ]
+
+    with Downloader(workers=4) as downloader:
+        documents, _, _ = fetch_patient_dumps.fetch_patient_documents(
+            downloader, store, f"{fhir_server.url}/fhir", "p1"
+        )
+        # the next sync does not download stored urls again
+        fetch_patient_dumps.fetch_patient_documents(
+            downloader, store, f"{fhir_server.url}/fhir", "p1"
+        )
+
+    binary_requests = [p for p, _ in fhir_server.requests if p.startswith("/binary")]
+    assert sorted(binary_requests) == [
+        "/binary/a.pdf",
+        "/binary/b.pdf",
+        "/binary/c.pdf",
+    ]
+    digests = [doc["presentedForm"][0]["sha256"] for doc in documents]
+    assert digests[0] == digests[1] == digests[2] != digests[3]
+    assert store.stats() == {"forms": 4, "blobs": 2}
+    assert (
+        store.resolve("d3", f"{fhir_server.url}/binary/b.pdf").read_bytes() == b"same"
+    )
+    assert not list((tmp_path / "blobs" / "tmp").iterdir())
@@ -0,0 +1,151 @@
+import json
+from pathlib import Path
+
+import fetch_patient_dumps
+from blobstore import BlobStore
+from downloader import Downloader
+from sync import ChangeLog, Watermarks, is_newer, read_jsonl
+
+PDF = "application/pdf"
+
+
+def sync(fhir_server, tmp_path):
+    watermarks = Watermarks.load(tmp_path / "watermarks.json")
+    with Downloader(workers=4, backoff=0.01) as downloader:
+        return fetch_patient_dumps.sync_patients(
+            downloader,
+            BlobStore(tmp_path / "blobs"),
+            f"{fhir_server.url}/fhir",
+            ["Patient/p1", "Patient/p2"],
+            tmp_path / "patient-documents.jsonl",
+            watermarks,
+            tmp_path / "changes.jsonl",
+        )
+
+
+def searches(fhir_server):
+    return [h for path, h in fhir_server.requests if path == "/fhir/DiagnosticReport"]
+
+
+def test_delta_sync_merges_new_and_updated_documents(fhir_server, tmp_path):
+    report = fhir_server.report
+    fhir_server.reports = {
+        "Patient/p1": [
+            report("d1", "Patient/p1", "2023-01-01", [(PDF, "1.pdf")]),
+            report("d2", "Patient/p1", "2023-02-01", [(PDF, "2.pdf")]),
+        ],
+        "Patient/p2": [report("d3", "Patient/p2", "2023-01-15", [(PDF, "3.pdf")])],
+    }
+    fhir_server.binaries = {"1.pdf": b"v1", "2.pdf": b"2", "3.pdf": b"3", "4.pdf": b"4"}
+
+    changes = sync(fhir_server, tmp_path)
+    assert changes.count == 3
+    watermarks = json.loads((tmp_path / "watermarks.json").read_text())
+    assert watermarks == {
+        "DiagnosticReport?subject=Patient/p1": "2023-02-01",
+        "DiagnosticReport?subject=Patient/p2": "2023-01-15",
+    }
+
+    # d1 gets a new version, d4 is new, nothing changes for p2
+    fhir_server.reports["Patient/p1"][0] = report(
+        "d1", "Patient/p1", "2023-03-01", [(PDF, "1.pdf")], version="2"
+    )
+    fhir_server.reports["Patient/p1"].append(
+        report("d4", "Patient/p1", "2023-03-02", [(PDF, "4.pdf")])
+    )
+    fhir_server.binaries["1.pdf"] = b"v2"
+    fhir_server.requests.clear()
+
+    changes = sync(fhir_server, tmp_path)
+    assert changes.count == 2
+    # only documents updated since the watermark were requested
+    assert sorted(p for p, _ in fhir_server.requests if p.startswith("/binary")) == [
+        "/binary/1.pdf",
+        "/binary/4.pdf",
+    ]
+    dump = list(read_jsonl(tmp_path / "patient-documents.jsonl"))
+    assert Path(dump[-2]["presentedForm"][0]["path"]).read_bytes() == b"v2"
+    assert {(d["id"], d["meta.versionId"]) for d in dump[:3]} == {
+        ("d1", "1"),
+        ("d2", "1"),
+        ("d3", "1"),
+    }
+    assert {(d["id"], d["meta.versionId"]) for d in dump[3:]} == {
+        ("d1", "2"),
+        ("d4", "1"),
+    }
+
+    log = list(read_jsonl(tmp_path / "changes.jsonl"))
+    assert [(c["id"], c["change"]) for c in log[3:]] == [
+        ("d1", "updated"),
+        ("d4", "created"),
+    ]
+    assert (
+        json.loads((tmp_path / "watermarks.json").read_text())[
+            "DiagnosticReport?subject=Patient/p1"
+        ]
+        == "2023-03-02"
+    )
+
+    # a third run without changes on the server adds nothing
+    assert sync(fhir_server, tmp_path).count == 0
+
+
+def test_failed_downloads_are_fetched_again(fhir_server, tmp_path):
+    report = fhir_server.report
+    fhir_server.reports = {
+        "Patient/p1": [
+            report("d1", "Patient/p1", "2023-01-01", [(PDF, "1.pdf")]),
+            report("d2", "Patient/p1", "2023-02-01", [(PDF, "2.pdf")]),
+        ],
+        "Patient/p2": [report("d3", "Patient/p2", "2023-01-15", [(PDF, "3.pdf")])],
+    }
+    fhir_server.binaries = {"1.pdf": b"v1", "2.pdf": b"2", "3.pdf": b"3", "4.pdf": b"4"}
+    sync(fhir_server, tmp_path)
+
+    # the downloads of the new d4 and of the new version of d1 fail
+    fhir_server.reports["Patient/p1"][0] = report(
+        "d1", "Patient/p1", "2023-03-01", [(PDF, "1.pdf")], version="2"
+    )
+    fhir_server.reports["Patient/p1"].append(
+        report("d4", "Patient/p1", "2023-03-02", [(PDF, "4.pdf")])
+    )
+    fhir_server.binaries["1.pdf"] = b"v2"
+    fhir_server.failures = {"1.pdf": 100, "4.pdf": 100}
+    assert sync(fhir_server, tmp_path).count == 0
+    watermarks = json.loads((tmp_path / "watermarks.json").read_text())
+    assert watermarks["DiagnosticReport?subject=Patient/p1"] == "2023-03-01"
+    assert len(list(read_jsonl(tmp_path / "patient-documents.jsonl"))) == 3
+
+    fhir_server.failures = {}
+    assert sync(fhir_server, tmp_path).count == 2
+    dump = list(read_jsonl(tmp_path / "patient-documents.jsonl"))
+    assert {(d["id"], d["meta.versionId"]) for d in dump[3:]} == {
+        ("d1", "2"),
+        ("d4", "1"),
+    }
+    d1 = next(d for d in dump[3:] if d["id"] == "d1")
+    assert Path(d1["presentedForm"][0]["path"]).read_bytes() == b"v2"
+    watermarks = json.loads((tmp_path / "watermarks.json").read_text())
+    assert watermarks["DiagnosticReport?subject=Patient/p1"] == "2023-03-02"
+
+
+def test_versions_and_watermarks():
+    assert is_newer(("2", "2023-01-01"), ("1", "2023-01-01"))
+    assert not is_newer(("1", "2023-01-01"), ("1", "2023-01-01"))
+    assert is_newer((None, "2023-01-02"), (None, "2023-01-01"))
+    assert not is_newer(("9", "2023-01-02"), ("10", "2023-01-01"))
+
+    changes = ChangeLog.from_records(
+        [{"id": "a", "meta.versionId": "1", "meta.lastUpdated": "t1"}]
+    )
+    assert changes.versions == {"a": ("1", "t1")}
+
+    watermarks = Watermarks()
+    watermarks.advance("q", ["2023-01-02", None, "2023-01-01"])
+    watermarks.advance("q", ["2022-12-31"])
+    assert watermarks.get("q") == "2023-01-02"
+    watermarks.hold("q", ["2023-01-03", "2022-12-30"])
+    assert watermarks.get("q") == "2022-12-30"
+    watermarks.hold("q", [None])
+    assert watermarks.get("q") is None